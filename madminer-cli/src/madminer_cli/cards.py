@@ -0,0 +1,55 @@
+"""Per-run edits of the cards MadMiner writes to `<proc_dir>/madminer/cards`.
+
+The run cards and reweight card inserts of every run are rendered when the DAG
+is created. Run cards go through MadMiner as they are, but the reweight cards are
+created by MadMiner from the setup file, so the insert is pasted on top of them
+after preparation. Cached process directories (see `madminer_cli.proc_cache`)
+are shared by runs with different seeds, so the seed of the run is set again in
+the copy.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import re
+from pathlib import Path
+from typing import List, Optional
+
+from madminer_cli import LOGGER
+
+# `<value> = iseed ! comment` line of a MadGraph run card
+SEED_RGX = re.compile(r"^(\s*)(\S+)(\s*=\s*iseed\b.*)$", re.MULTILINE)
+
+logger = LOGGER.getChild(__name__)
+
+
+def read_seed(run_card: Path) -> Optional[str]:
+    match = SEED_RGX.search(Path(run_card).read_text())
+    return match.group(2) if match else None
+
+
+def run_card_digest(run_card: Path) -> str:
+    """Hash of the run card, leaving out the seed"""
+    text = SEED_RGX.sub(r"\1SEED\3", Path(run_card).read_text())
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def _cards(proc_dir: Path, pattern: str) -> List[Path]:
+    cards = sorted((Path(proc_dir) / "madminer" / "cards").glob(pattern))
+    if not cards:
+        raise FileNotFoundError(f"No {pattern} found in {proc_dir}/madminer/cards")
+    return cards
+
+
+def set_seed(proc_dir: Path, seed: str) -> None:
+    for run_card in _cards(proc_dir, "run_card*"):
+        text = run_card.read_text()
+        run_card.write_text(SEED_RGX.sub(rf"\g<1>{seed}\g<3>", text))
+        logger.info(f"Set random seed {seed} in {run_card}")
+
+
+def insert_reweight_card(proc_dir: Path, insert: Path) -> None:
+    contents = Path(insert).read_text()
+    for rwg_card in _cards(proc_dir, "reweight_card_*.dat"):
+        rwg_card.write_text(contents + rwg_card.read_text())
+        logger.info(f"Written contents of {insert} to {rwg_card}")
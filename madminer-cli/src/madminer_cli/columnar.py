@@ -0,0 +1,1199 @@
+"""Columnar evaluation of observables and cuts on Delphes ROOT files.
+
+MadMiner builds one particle object per reconstructed object and evaluates every
+observable and cut with `eval`, event by event. Here the branches of the Delphes
+tree are read as flat arrays, by chunks of events. Expressions made of indexed
+particles (`j[0].pt`, `l[-1].E`), `met`, `len` of collections, numbers,
+arithmetic, comparisons, boolean operators and the math functions of MadMiner
+are evaluated on all the events of a chunk at once. Where `eval` would fail
+(e.g. missing objects), the value is the default.
+
+Values are those of the per-event path bit for bit:
+
+- kinematics are computed by the object backend of `vector`, which the particles
+  of MadMiner inherit from, on arrays instead of scalars;
+- columns keep the types the values have in `eval`: NumPy scalars of the type of
+  the branch (float32) or Python numbers (literals, `len`). Operations promote
+  them like scalars, which NumPy < 2 does differently than arrays;
+- `**` and the math functions are called by Python for every event;
+- leptons are built like MadMiner does, muons first.
+
+The engine replaces `parse_delphes_root_file` while DelphesReader analyses its
+samples. Whatever it does not implement is left to MadMiner, e.g. `visible`,
+generator truth, Delphes weights or observables defined by functions. The
+`check` engine runs both and compares them.
+"""
+
+from __future__ import annotations
+
+import ast
+import builtins
+import inspect
+import logging
+import math
+import operator
+import os
+import sys
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+)
+
+import numpy as np
+
+from madminer_cli import LOGGER
+from madminer_cli.expressions import (
+    COLLECTIONS,
+    MATH_FUNCTIONS,
+    OBJECTS,
+    ExpressionGraph,
+    parse,
+)
+
+# Collections read from the Delphes tree
+BRANCHES = {
+    "e": "Electron",
+    "mu": "Muon",
+    "j": "Jet",
+    "a": "Photon",
+    "met": "MissingET",
+}
+# Mass MadMiner gives to particles without mass branch
+MASSES = {"e": 0.000511, "mu": 0.105}
+# Objects of MadMiner the engine does not implement
+UNSUPPORTED_OBJECTS = OBJECTS - {"met"}
+# fmt: off
+ATTRIBUTES = {
+    "pt", "eta", "phi", "m", "mass", "M", "tau", "E", "e", "energy", "t",
+    "px", "py", "pz", "x", "y", "z", "p", "mag", "rho", "Et", "et", "Mt", "mt",
+    "rapidity", "theta", "costheta",
+}
+# fmt: on
+MATH_CONSTANTS = {"pi": math.pi}
+# Exceptions MadMiner replaces by the default value of cuts, observables also
+# catch RuntimeError, which nothing here raises
+EVAL_ERRORS = (SyntaxError, NameError, TypeError, ZeroDivisionError, IndexError)
+
+ARITHMETIC = {
+    ast.Add: (operator.add, np.add),
+    ast.Sub: (operator.sub, np.subtract),
+    ast.Mult: (operator.mul, np.multiply),
+    ast.Div: (operator.truediv, np.true_divide),
+    ast.FloorDiv: (operator.floordiv, np.floor_divide),
+    ast.Mod: (operator.mod, np.remainder),
+}
+DIVISIONS = (ast.Div, ast.FloorDiv, ast.Mod)
+UNARY = {ast.USub: (operator.neg, np.negative), ast.UAdd: (operator.pos, np.positive)}
+COMPARISONS = {
+    ast.Eq: np.equal,
+    ast.NotEq: np.not_equal,
+    ast.Lt: np.less,
+    ast.LtE: np.less_equal,
+    ast.Gt: np.greater,
+    ast.GtE: np.greater_equal,
+}
+# Events read from a ROOT file and analysed at once
+CHUNK_SIZE = 100_000
+# Events on which requirements and cuts are tried, to order them
+PILOT_EVENTS = 1000
+# NumPy < 2 promotes scalars by type, e.g. float32 + float to float64, and
+# arrays by value, e.g. float32 array + float to float32
+LEGACY_PROMOTION = np.lib.NumpyVersion(np.__version__) < "2.0.0"
+
+logger = LOGGER.getChild(__name__)
+
+
+class Unsupported(Exception):
+    """Expression or option left to MadMiner"""
+
+
+def _power(x: np.ndarray, y: np.ndarray) -> np.ndarray:
+    """`x ** y` pair by pair with `pow` of the C library, like NumPy computes it
+    on scalars of the type of the result. The power ufunc may round differently"""
+    dtype = np.result_type(x, y)
+    x, y = np.broadcast_arrays(np.asarray(x, dtype), np.asarray(y, dtype))
+    if dtype == np.float64:
+        # Python numbers, `math.pow` calling the same `pow`
+        pairs = zip(x.ravel().tolist(), y.ravel().tolist())
+    else:
+        pairs = zip(x.flat, y.flat)
+    values = []
+    for a, b in pairs:
+        try:
+            value = math.pow(a, b) if dtype == np.float64 else a**b
+        except (ValueError, OverflowError):
+            # NumPy gives nan or inf instead
+            value = dtype.type(a) ** dtype.type(b)
+        values.append(value)
+    return np.array(values, dtype=dtype).reshape(x.shape)
+
+
+class _Scalars(np.ndarray):
+    """Array computing in operations what NumPy computes on each of its values
+    as scalars, so that `vector` computes the values of particle objects on it.
+    With NumPy < 2, Python numbers are promoted as float64 or int64 arrays"""
+
+    def __array_ufunc__(self, ufunc, method, *inputs, **kwargs):
+        types = [x.dtype for x in inputs if isinstance(x, (np.ndarray, np.generic))]
+        if LEGACY_PROMOTION:
+            inputs = tuple(np.array([x]) if np.ndim(x) == 0 else x for x in inputs)
+        inputs = tuple(np.asarray(x) if isinstance(x, _Scalars) else x for x in inputs)
+        if (
+            ufunc is np.power
+            and method == "__call__"
+            and not kwargs
+            and np.result_type(*inputs) in types
+        ):
+            # Scalars promoted to another type use the ufunc
+            result = _power(*inputs)
+        else:
+            result = getattr(ufunc, method)(*inputs, **kwargs)
+        return result.view(_Scalars) if isinstance(result, np.ndarray) else result
+
+    def __pow__(self, other):
+        # Not `np.square` for `** 2`, which would drop the Python number
+        return np.power(self, other)
+
+    def __rpow__(self, other):
+        return np.power(other, self)
+
+
+def _as_scalars(values: Any) -> Any:
+    return values.view(_Scalars) if isinstance(values, np.ndarray) else values
+
+
+class Column(NamedTuple):
+    """Values of an expression for every event, whether `eval` fails, and
+    whether the values are Python numbers in `eval` (None if it depends on the
+    event). Values and errors may be scalars, when equal for all the events"""
+
+    values: Any
+    error: Any
+    python: Optional[bool]
+
+
+class Collection:
+    """Objects of one kind in all the events: flat columns and per-event counts"""
+
+    def __init__(self, counts: np.ndarray, columns: Dict[str, Any]) -> None:
+        self.counts = counts
+        self.starts = np.cumsum(counts) - counts
+        # pt, eta, phi and mass (tau) or energy (t), the mass may be a number
+        self.columns = columns
+        self._attributes: Dict[str, Any] = {}
+
+    def events(self) -> np.ndarray:
+        """Event of every object"""
+        return np.repeat(np.arange(len(self.counts)), self.counts)
+
+    def select(self, keep: np.ndarray) -> Collection:
+        counts = np.bincount(self.events()[keep], minlength=len(self.counts))
+        columns = {
+            k: v[keep] if isinstance(v, np.ndarray) else v
+            for k, v in self.columns.items()
+        }
+        return Collection(counts, columns)
+
+    def accept(self, pt_min: Optional[float], eta_max: Optional[float]) -> Collection:
+        """Objects in the acceptance, `pt_min` and `eta_max` may be None"""
+        keep = _accepted(self.columns["pt"], self.columns["eta"], pt_min, eta_max)
+        return self if keep.all() else self.select(keep)
+
+    def take(self, keep: np.ndarray) -> Collection:
+        """Objects of the events where `keep` is True, with their attributes"""
+        objects = keep[self.events()]
+
+        def subset(columns: Dict[str, Any]) -> Dict[str, Any]:
+            return {
+                k: v[objects] if isinstance(v, np.ndarray) else v
+                for k, v in columns.items()
+            }
+
+        collection = Collection(self.counts[keep], subset(self.columns))
+        collection._attributes = subset(self._attributes)
+        return collection
+
+    @classmethod
+    def leptons(
+        cls,
+        muons: Collection,
+        electrons: Collection,
+        acceptance: Dict[str, Tuple[Optional[float], Optional[float]]],
+    ) -> Collection:
+        """Muons and electrons sorted by decreasing pt in every event, as built by
+        MadMiner: only pt, eta and phi are sorted, the mass and the acceptance
+        criteria of the first positions of an event are those of its muons"""
+        mu_events, e_events = muons.events(), electrons.events()
+        events = np.concatenate([mu_events, e_events])
+        # Position in the event, muons first
+        rank = np.concatenate(
+            [
+                np.arange(len(mu_events)) - muons.starts[mu_events],
+                np.arange(len(e_events))
+                - electrons.starts[e_events]
+                + muons.counts[e_events],
+            ]
+        )
+        columns = {
+            k: np.concatenate([muons.columns[k], electrons.columns[k]])
+            for k in ("pt", "eta", "phi")
+        }
+        # Like `np.argsort` on the few leptons of an event, equal pts keep their
+        # order
+        order = np.lexsort((rank, -columns["pt"], events))
+        columns = {k: v[order] for k, v in columns.items()}
+        is_muon = (np.arange(len(events)) < len(mu_events))[np.lexsort((rank, events))]
+        columns["tau"] = np.where(is_muon, np.float32(0.105), np.float32(0.000511))
+
+        keep = np.where(
+            is_muon,
+            _accepted(columns["pt"], columns["eta"], *acceptance["mu"]),
+            _accepted(columns["pt"], columns["eta"], *acceptance["e"]),
+        )
+        leptons = cls(muons.counts + electrons.counts, columns)
+        return leptons if keep.all() else leptons.select(keep)
+
+    def attribute(self, name: str) -> Any:
+        """`name` of every object, or of all of them if it is a number"""
+        if name not in self._attributes:
+            from vector.backends.object import (
+                AzimuthalObjectRhoPhi,
+                LongitudinalObjectEta,
+                MomentumObject4D,
+                TemporalObjectT,
+                TemporalObjectTau,
+            )
+
+            columns = {k: _as_scalars(v) for k, v in self.columns.items()}
+            if "tau" in columns:
+                temporal = TemporalObjectTau(columns["tau"])
+            else:
+                temporal = TemporalObjectT(columns["t"])
+            momenta = MomentumObject4D(
+                azimuthal=AzimuthalObjectRhoPhi(columns["pt"], columns["phi"]),
+                longitudinal=LongitudinalObjectEta(columns["eta"]),
+                temporal=temporal,
+            )
+            values = getattr(momenta, name)
+            if isinstance(values, np.ndarray):
+                values = values.view(np.ndarray)
+            self._attributes[name] = values
+        return self._attributes[name]
+
+    def item(self, index: int, name: str) -> Column:
+        """`name` of the object `index` of every event"""
+        position = index if index >= 0 else self.counts + index
+        error = (position < 0) | (position >= self.counts)
+        values = self.attribute(name)
+        if not isinstance(values, np.ndarray):
+            # Same for all the objects, e.g. the mass of electrons
+            return Column(np.asarray(values), error, not isinstance(values, np.generic))
+        if values.size == 0:
+            return Column(np.full(len(self.counts), np.nan, values.dtype), error, False)
+        flat = self.starts + np.where(error, 0, position)
+        return Column(values.take(flat, mode="clip"), error, False)
+
+
+def _accepted(
+    pt: np.ndarray, eta: np.ndarray, pt_min: Optional[float], eta_max: Optional[float]
+) -> np.ndarray:
+    keep = np.ones(len(pt), dtype=bool)
+    # Python numbers and float32 scalars are compared as float64
+    if pt_min is not None:
+        keep &= ~(pt.astype(np.float64) < pt_min)
+    if eta_max is not None:
+        keep &= ~(np.abs(eta.astype(np.float64)) > eta_max)
+    return keep
+
+
+class Events(NamedTuple):
+    n: int
+    collections: Dict[str, Collection]
+    # Values of the observables, for cuts
+    names: Dict[str, np.ndarray]
+    # Values of the sub-expressions shared by several expressions
+    shared: Dict[str, Column]
+
+    def take(self, keep: np.ndarray) -> Events:
+        """The events where `keep` is True"""
+        return Events(
+            int(keep.sum()),
+            {k: c.take(keep) for k, c in self.collections.items()},
+            {k: v[keep] for k, v in self.names.items()},
+            {},
+        )
+
+
+def _failing(events: Events) -> Column:
+    return Column(np.float64(np.nan), np.True_, True)
+
+
+def _truth(values: Any) -> np.ndarray:
+    return np.asarray(values) != 0
+
+
+def _errors(columns: Iterable[Column], n: int) -> np.ndarray:
+    error = np.zeros(n, dtype=bool)
+    for column in columns:
+        error = error | column.error
+    return error
+
+
+def _sample(column: Column) -> Any:
+    """A value with the type of the column in `eval`"""
+    if column.python is None:
+        raise Unsupported("Operations on values of types depending on the event")
+    value = np.asarray(column.values).dtype.type(1)
+    return value.item() if column.python else value
+
+
+def _promotion(func: Callable, *columns: Column) -> Tuple[np.dtype, bool]:
+    """Type of the result of `func` in `eval`, and whether it is a Python number.
+    Raises the errors of `func` on values of these types"""
+    result = func(*map(_sample, columns))
+    if isinstance(result, np.generic):
+        return result.dtype, False
+    if isinstance(result, (bool, int, float)):
+        return np.asarray(result).dtype, True
+    raise Unsupported(f"{func.__name__} returning {type(result).__name__}")
+
+
+def _merged(columns: List[Column]) -> Optional[bool]:
+    """Type of values picked from `columns` depending on the event"""
+    types = {(np.asarray(c.values).dtype, c.python) for c in columns}
+    return types.pop()[1] if len(types) == 1 else None
+
+
+def _elementwise(func: Callable, columns: List[Column], n: int) -> Column:
+    """`func` called by Python for every event where the arguments are valid"""
+    for column in columns:
+        _sample(column)
+    error = _errors(columns, n)
+    args = [(np.broadcast_to(np.asarray(c.values), (n,)), c.python) for c in columns]
+    indices, results = [], []
+    for i in np.flatnonzero(~error):
+        try:
+            result = func(*(a[i].item() if python else a[i] for a, python in args))
+        except EVAL_ERRORS:
+            error[i] = True
+            continue
+        except (ValueError, OverflowError) as e:
+            # `eval` raises them to the caller
+            raise Unsupported(f"{func.__name__} failing with {e!r}")
+        indices.append(i)
+        results.append(result)
+    if not results:
+        return Column(np.float64(np.nan), error, True)
+    if len({type(r) for r in results}) > 1:
+        raise Unsupported(f"{func.__name__} returning values of several types")
+    python = not isinstance(results[0], np.generic)
+    results = np.asarray(results)
+    if results.dtype == object:
+        raise Unsupported(f"{func.__name__} returning {results[0]!r}")
+    values = np.zeros(n, dtype=results.dtype)
+    values[indices] = results
+    return Column(values, error, python)
+
+
+class Compiler:
+    """Turns expressions into functions of the events, computing the values of
+    the expression and the events for which `eval` fails"""
+
+    def __init__(
+        self, names: Iterable[str] = (), graph: Optional[ExpressionGraph] = None
+    ) -> None:
+        # Observables, which cuts can use
+        self.names = set(names)
+        self.collections: set = set()
+        # Parsed expressions
+        self.graph = graph
+        # Functions and number of uses of the sub-expressions, by their dump
+        self._compiled: Dict[str, Callable[[Events], Column]] = {}
+        self.uses: Dict[str, int] = {}
+
+    def compile(self, expression: Any) -> Callable[[Events], Column]:
+        if not isinstance(expression, str):
+            raise Unsupported("Observables defined by functions")
+        tree = self._tree(expression)
+        if tree is None:
+            # `eval` fails for every event
+            return _failing
+        return self._node(tree.body)
+
+    def uses_names(self, expression: str) -> set:
+        """Observables used by `expression`"""
+        tree = self._tree(expression)
+        if tree is None:
+            return set()
+        return {
+            n.id for n in ast.walk(tree) if isinstance(n, ast.Name)
+        } & self.names
+
+    def _tree(self, expression: str) -> Optional[ast.Expression]:
+        tree = self.graph.tree(expression) if self.graph is not None else None
+        if tree is None:
+            try:
+                tree = parse(expression)
+            except SyntaxError:
+                return None
+        return tree
+
+    def _node(self, node: ast.AST) -> Callable[[Events], Column]:
+        key = ast.dump(node)
+        if any(
+            isinstance(n, ast.Name) and n.id in self.names for n in ast.walk(node)
+        ):
+            # Observables are only defined for cuts
+            key = f"cut {key}"
+        self.uses[key] = self.uses.get(key, 0) + 1
+        if key not in self._compiled:
+            method = getattr(self, f"_{type(node).__name__.lower()}", None)
+            if method is None:
+                raise Unsupported(f"{type(node).__name__} in expressions")
+            self._compiled[key] = self._shared(key, method(node))
+        return self._compiled[key]
+
+    def _shared(
+        self, key: str, func: Callable[[Events], Column]
+    ) -> Callable[[Events], Column]:
+        """`func` computing its values once if the sub-expression is used several
+        times"""
+
+        def run(events: Events) -> Column:
+            if self.uses[key] == 1:
+                return func(events)
+            if key not in events.shared:
+                events.shared[key] = func(events)
+            return events.shared[key]
+
+        return run
+
+    def _constant(self, node: ast.Constant) -> Callable[[Events], Column]:
+        value = node.value
+        if type(value) not in (bool, int, float):
+            raise Unsupported(f"Constant {value!r}")
+        column = Column(np.asarray(value), np.False_, True)
+        return lambda events: column
+
+    def _name(self, node: ast.Name) -> Callable[[Events], Column]:
+        name = node.id
+        if name in self.names:
+            return lambda events: Column(events.names[name], np.False_, False)
+        if name in MATH_CONSTANTS:
+            column = Column(np.asarray(MATH_CONSTANTS[name]), np.False_, True)
+            return lambda events: column
+        if (
+            name in COLLECTIONS
+            or name in UNSUPPORTED_OBJECTS
+            or name in MATH_FUNCTIONS
+            or name == "met"
+            or hasattr(builtins, name)
+        ):
+            raise Unsupported(f"{name} used as a value")
+        # NameError wherever it is evaluated
+        return _failing
+
+    def _item(self, node: ast.Subscript) -> Tuple[str, int]:
+        target, index = node.value, node.slice
+        if not isinstance(target, ast.Name) or target.id not in COLLECTIONS:
+            raise Unsupported("Indexing anything but a collection")
+        sign = 1
+        if isinstance(index, ast.UnaryOp) and isinstance(index.op, ast.USub):
+            sign, index = -1, index.operand
+        if not isinstance(index, ast.Constant) or type(index.value) is not int:
+            raise Unsupported("Indices other than integers")
+        self.collections.add(target.id)
+        return target.id, sign * index.value
+
+    def _attribute(self, node: ast.Attribute) -> Callable[[Events], Column]:
+        if node.attr not in ATTRIBUTES:
+            raise Unsupported(f"Attribute {node.attr} of particles")
+        if isinstance(node.value, ast.Name) and node.value.id == "met":
+            # First missing energy of the event, always there
+            name, index = "met", 0
+            self.collections.add(name)
+        elif isinstance(node.value, ast.Subscript):
+            name, index = self._item(node.value)
+        else:
+            raise Unsupported("Attributes of anything but particles")
+        attr = node.attr
+        return lambda events: events.collections[name].item(index, attr)
+
+    def _call(self, node: ast.Call) -> Callable[[Events], Column]:
+        if not isinstance(node.func, ast.Name) or node.keywords:
+            raise Unsupported("Calls other than functions of numbers")
+        name = node.func.id
+        if name == "len" and len(node.args) == 1:
+            collection = node.args[0]
+            if not isinstance(collection, ast.Name) or collection.id not in COLLECTIONS:
+                raise Unsupported("len of anything but a collection")
+            self.collections.add(collection.id)
+            return lambda events: Column(
+                events.collections[collection.id].counts, np.False_, True
+            )
+
+        args = [self._node(arg) for arg in node.args]
+        if name in MATH_FUNCTIONS:
+            func = getattr(math, name)
+            return lambda events: _elementwise(
+                func, [arg(events) for arg in args], events.n
+            )
+        if name in self.names or not (
+            name in COLLECTIONS
+            or name in UNSUPPORTED_OBJECTS
+            or name == "met"
+            or hasattr(builtins, name)
+        ):
+            # Calling a number, or NameError
+            return _failing
+        if name == "abs" and len(args) == 1:
+            (arg,) = args
+
+            def run(events: Events) -> Column:
+                column = arg(events)
+                try:
+                    dtype, python = _promotion(abs, column)
+                except EVAL_ERRORS:
+                    return _failing(events)
+                values = np.abs(np.asarray(column.values).astype(dtype))
+                return Column(values, column.error, python)
+
+            return run
+        if name in ("min", "max") and len(args) > 1:
+            # Like Python, the first of equal values is kept
+            better = np.less if name == "min" else np.greater
+
+            def run(events: Events) -> Column:
+                columns = [arg(events) for arg in args]
+                values = columns[0].values
+                for other in columns[1:]:
+                    replace = better(other.values, values)
+                    values = np.where(replace, other.values, values)
+                return Column(values, _errors(columns, events.n), _merged(columns))
+
+            return run
+        raise Unsupported(f"Function {name}")
+
+    def _unaryop(self, node: ast.UnaryOp) -> Callable[[Events], Column]:
+        operand = self._node(node.operand)
+        if isinstance(node.op, ast.Not):
+
+            def run(events: Events) -> Column:
+                column = operand(events)
+                return Column(~_truth(column.values), column.error, True)
+
+            return run
+        if type(node.op) not in UNARY:
+            raise Unsupported(f"Operator {type(node.op).__name__}")
+        func, ufunc = UNARY[type(node.op)]
+
+        def run(events: Events) -> Column:
+            column = operand(events)
+            try:
+                dtype, python = _promotion(func, column)
+            except EVAL_ERRORS:
+                # e.g. negating a NumPy boolean
+                return _failing(events)
+            values = ufunc(np.asarray(column.values).astype(dtype))
+            return Column(values, column.error, python)
+
+        return run
+
+    def _binop(self, node: ast.BinOp) -> Callable[[Events], Column]:
+        left, right = self._node(node.left), self._node(node.right)
+        op = type(node.op)
+        if op is ast.Pow:
+            return lambda events: _elementwise(
+                operator.pow, [left(events), right(events)], events.n
+            )
+        if op not in ARITHMETIC:
+            raise Unsupported(f"Operator {op.__name__}")
+        func, ufunc = ARITHMETIC[op]
+
+        def run(events: Events) -> Column:
+            a, b = left(events), right(events)
+            try:
+                dtype, python = _promotion(func, a, b)
+            except EVAL_ERRORS:
+                return _failing(events)
+            x = np.asarray(a.values).astype(dtype)
+            y = np.asarray(b.values).astype(dtype)
+            error = a.error | b.error
+            if python and op in DIVISIONS:
+                # ZeroDivisionError, NumPy numbers give inf or nan instead
+                zero = y == 0
+                error = error | zero
+                y = np.where(zero, 1, y)
+            with np.errstate(all="ignore"):
+                return Column(ufunc(x, y), error, python)
+
+        return run
+
+    def _compare(self, node: ast.Compare) -> Callable[[Events], Column]:
+        operands = [self._node(node.left)] + [self._node(c) for c in node.comparators]
+        ops = []
+        for op in node.ops:
+            if type(op) not in COMPARISONS:
+                raise Unsupported(f"Operator {type(op).__name__}")
+            ops.append(COMPARISONS[type(op)])
+
+        def run(events: Events) -> Column:
+            columns = [operand(events) for operand in operands]
+            values, error, python = np.True_, columns[0].error, True
+            for op, left, right in zip(ops, columns, columns[1:]):
+                # Chains stop at the first false comparison
+                error = error | (values & right.error)
+                # Numbers are compared in the type they would be added in
+                dtype, is_python = _promotion(operator.add, left, right)
+                x = np.asarray(left.values).astype(dtype)
+                y = np.asarray(right.values).astype(dtype)
+                values = values & op(x, y)
+                python = python and is_python
+            return Column(values, error, python)
+
+        return run
+
+    def _boolop(self, node: ast.BoolOp) -> Callable[[Events], Column]:
+        operands = [self._node(value) for value in node.values]
+        is_and = isinstance(node.op, ast.And)
+
+        def run(events: Events) -> Column:
+            columns = [operand(events) for operand in operands]
+            values, error = columns[0].values, columns[0].error
+            # `and` and `or` return the first operand deciding the result
+            pending = _truth(values) == is_and
+            for other in columns[1:]:
+                error = error | (pending & other.error)
+                values = np.where(pending, other.values, values)
+                pending = pending & (_truth(other.values) == is_and)
+            return Column(values, error, _merged(columns))
+
+        return run
+
+    def _ifexp(self, node: ast.IfExp) -> Callable[[Events], Column]:
+        test, body, orelse = map(self._node, (node.test, node.body, node.orelse))
+
+        def run(events: Events) -> Column:
+            condition = test(events)
+            a, b = body(events), orelse(events)
+            truth = _truth(condition.values)
+            return Column(
+                np.where(truth, a.values, b.values),
+                condition.error | np.where(truth, a.error, b.error),
+                _merged([a, b]),
+            )
+
+        return run
+
+
+def _leaves(name: str) -> List[Tuple[str, str]]:
+    """Columns of the collection `name` and the leaves of Delphes they are read from"""
+    if name == "met":
+        return [("pt", "MET"), ("phi", "Phi")]
+    leaves = [("pt", "PT"), ("eta", "Eta"), ("phi", "Phi")]
+    if name == "j":
+        leaves.append(("tau", "Mass"))
+    elif name == "a":
+        leaves.append(("t", "E"))
+    return leaves
+
+
+def _collections(
+    arrays: Any,
+    needed: Iterable[str],
+    acceptance: Dict[str, Tuple[Optional[float], Optional[float]]],
+) -> Dict[str, Collection]:
+    """Collections `needed` in the branches `arrays` of some events"""
+    import awkward as ak
+
+    collections, raw = {}, {}
+    for name in sorted(needed):
+        if name == "l":
+            continue
+        columns = {}
+        for key, leaf in _leaves(name):
+            jagged = arrays[f"{BRANCHES[name]}.{leaf}"]
+            counts = ak.to_numpy(ak.num(jagged)).astype(np.int64)
+            columns[key] = ak.to_numpy(ak.flatten(jagged))
+        if name in MASSES:
+            columns["tau"] = MASSES[name]
+        elif name == "met":
+            if (counts < 1).any():
+                raise Unsupported("Events without missing energy")
+            columns["eta"], columns["tau"] = 0.0, 0.0
+        raw[name] = Collection(counts, columns)
+        if name == "met":
+            collections[name] = raw[name]
+        else:
+            pt_min, eta_max = acceptance.get(name, (None, None))
+            collections[name] = raw[name].accept(pt_min, eta_max)
+
+    if "l" in needed:
+        collections["l"] = Collection.leptons(raw["mu"], raw["e"], acceptance)
+    return collections
+
+
+class ChunkReader:
+    """Number of events and collections `names` of consecutive chunks of at most
+    `chunk_size` events of a Delphes ROOT file, without the objects out of the
+    acceptance (pt_min, eta_max) of their collection.
+
+    The next chunk is read while the current one is analysed, so at most two
+    chunks are in memory at a time. Baskets are decompressed by `threads`
+    threads"""
+
+    def __init__(
+        self,
+        delphes_sample_file: str,
+        names: Iterable[str],
+        acceptance: Dict[str, Tuple[Optional[float], Optional[float]]],
+        chunk_size: int = CHUNK_SIZE,
+        threads: int = 1,
+    ) -> None:
+        self.delphes_sample_file = delphes_sample_file
+        self.needed = set(names)
+        if "l" in self.needed:
+            self.needed |= {"e", "mu"}
+        self.branches = [
+            f"{BRANCHES[name]}.{leaf}"
+            for name in sorted(self.needed - {"l"})
+            for _, leaf in _leaves(name)
+        ]
+        self.acceptance = acceptance
+        self.chunk_size = chunk_size
+        self.threads = threads
+        # Size of the branches read, known once the file is opened
+        self.compressed_bytes = 0
+        self.uncompressed_bytes = 0
+
+    def __iter__(self) -> Iterator[Tuple[int, Dict[str, Collection]]]:
+        import uproot
+
+        # Chunks are read once, uproot must not keep them
+        root_file = uproot.open(self.delphes_sample_file, array_cache=None)
+        decompression = ThreadPoolExecutor(self.threads)
+        # Exited in reverse order: the read ahead finishes before the file closes
+        with root_file, decompression, ThreadPoolExecutor(1) as read_ahead:
+            tree = root_file["Delphes"]
+            self.compressed_bytes = sum(tree[b].compressed_bytes for b in self.branches)
+            self.uncompressed_bytes = sum(
+                tree[b].uncompressed_bytes for b in self.branches
+            )
+            executor = decompression if self.threads > 1 else None
+
+            def read(start: int, stop: int) -> Tuple[int, Dict[str, Collection]]:
+                arrays = {}
+                if self.branches:
+                    arrays = tree.arrays(
+                        filter_name=self.branches,
+                        entry_start=start,
+                        entry_stop=stop,
+                        library="ak",
+                        decompression_executor=executor,
+                        interpretation_executor=executor,
+                    )
+                return stop - start, _collections(arrays, self.needed, self.acceptance)
+
+            n_events = tree.num_entries
+            ranges = [
+                (start, min(start + self.chunk_size, n_events))
+                for start in range(0, n_events, self.chunk_size)
+            ]
+            if not ranges:
+                return
+            future = read_ahead.submit(read, *ranges[0])
+            for next_range in ranges[1:] + [None]:
+                chunk = future.result()
+                if next_range is not None:
+                    future = read_ahead.submit(read, *next_range)
+                yield chunk
+
+
+def _finalize(column: Column, n: int) -> Tuple[np.ndarray, np.ndarray]:
+    values = np.broadcast_to(np.asarray(column.values), (n,))
+    error = np.broadcast_to(np.asarray(column.error, dtype=bool), (n,))
+    return values, error
+
+
+class Filter(NamedTuple):
+    """Requirement of an observable, or cut, with the observables it needs"""
+
+    label: str
+    observables: List[str]
+    # None for requirements, which keep the events with finite values
+    compiled: Optional[Callable[[Events], Column]]
+    # Whether the events where `eval` fails pass
+    default: bool
+
+
+class CutFlow(NamedTuple):
+    """Events of a file passing the filters, in the order they are applied, with
+    the seconds spent on each filter and the observables it computes"""
+
+    delphes_sample_file: str
+    rows: List[Tuple[str, int, float]]
+
+
+class _Analysis:
+    """Observables of `parse_delphes_root_file`, computed when needed"""
+
+    def __init__(
+        self,
+        observables: Dict[str, Any],
+        compiled: Dict[str, Callable[[Events], Column]],
+    ) -> None:
+        self.observables = observables
+        self.compiled = compiled
+
+    def observe(self, name: str, events: Events) -> np.ndarray:
+        """Values of the observable `name`, with its default where `eval` fails,
+        kept for the cuts"""
+        if name not in events.names:
+            values, error = _finalize(self.compiled[name](events), events.n)
+            default = self.observables[name].val_default
+            default = np.nan if default is None else default
+            events.names[name] = np.where(error, default, values.astype(np.float64))
+        return events.names[name]
+
+    def passing(self, filter_: Filter, events: Events) -> np.ndarray:
+        for name in filter_.observables:
+            values = self.observe(name, events)
+        if filter_.compiled is None:
+            return np.isfinite(values)
+        values, error = _finalize(filter_.compiled(events), events.n)
+        return np.where(error, filter_.default, _truth(values))
+
+    def order(self, filters: List[Filter], events: Events) -> List[Filter]:
+        """`filters` rejecting the most of the first events first"""
+        if len(filters) < 2 or events.n == 0:
+            return filters
+        start_time = time.perf_counter()
+        pilot = events.take(np.arange(events.n) < PILOT_EVENTS)
+        passing = [self.passing(f, pilot).sum() for f in filters]
+        ordered = [f for _, f in sorted(zip(passing, filters), key=lambda p: p[0])]
+        logger.debug(
+            f"Filters ordered on {pilot.n} events in "
+            f"{time.perf_counter() - start_time:.3f} s"
+        )
+        return ordered
+
+
+def write_cutflows(cutflows: List[CutFlow], path: Path) -> None:
+    """Write a tab separated table of `cutflows` to `path`"""
+    with path.open("w") as f:
+        for cutflow in cutflows:
+            f.write(f"# {cutflow.delphes_sample_file}\n")
+            f.write("filter\tevents\tefficiency\tseconds\n")
+            previous = cutflow.rows[0][1]
+            for label, n_pass, seconds in cutflow.rows:
+                efficiency = n_pass / previous if previous else 0.0
+                f.write(f"{label}\t{n_pass}\t{efficiency:.4f}\t{seconds:.4f}\n")
+                previous = n_pass
+
+
+def parse_delphes_root_file(
+    delphes_sample_file: str,
+    observables: Dict[str, Any],
+    cuts: List[Any],
+    acceptance: Dict[str, Tuple[Optional[float], Optional[float]]],
+    graph: Optional[ExpressionGraph] = None,
+    cutflows: Optional[List[CutFlow]] = None,
+    chunk_size: int = CHUNK_SIZE,
+    threads: int = 1,
+    report_throughput: bool = False,
+) -> Tuple[Optional[Dict[str, np.ndarray]], None, Optional[np.ndarray]]:
+    """Observables of the events passing the requirements and cuts, and the
+    filter of those events, like MadMiner's `parse_delphes_root_file`. The
+    expressions in `graph` are not parsed again.
+
+    The file is read and analysed by chunks of `chunk_size` events, only the
+    observables of the events passing everything are kept. The next chunk is
+    read and decompressed by `threads` threads while the current one is
+    analysed, the MB/s read are logged at info level if `report_throughput`.
+    In every chunk, requirements and cuts are applied one after the other, the
+    most selective on the first events first, and only compute the observables
+    they use, on the events passing the previous ones. The other observables
+    are computed on the events passing everything. The cut flow is appended to
+    `cutflows`"""
+    start_time = time.perf_counter()
+    compiler = Compiler(graph=graph)
+    compiled_observables = {
+        name: compiler.compile(obs.val_expression) for name, obs in observables.items()
+    }
+    compiler.names = set(observables)
+    compiled_cuts = [compiler.compile(cut.val_expression) for cut in cuts]
+    shared = sum(uses > 1 for uses in compiler.uses.values())
+    logger.debug(
+        f"{len(compiler.uses)} distinct sub-expressions, {shared} of them shared"
+    )
+
+    filters = [
+        Filter(f"required observable {name}", [name], None, False)
+        for name, obs in observables.items()
+        if obs.is_required
+    ]
+    for cut, compiled in zip(cuts, compiled_cuts):
+        # Observables used, in the order they are defined
+        uses = compiler.uses_names(cut.val_expression)
+        filters.append(
+            Filter(
+                f"cut {cut.val_expression}",
+                [name for name in observables if name in uses],
+                compiled,
+                bool(cut.is_required),
+            )
+        )
+    analysis = _Analysis(observables, compiled_observables)
+
+    n_events = 0
+    # Events passing and seconds spent reading, then for every filter
+    n_passing = np.zeros(len(filters) + 1, dtype=np.int64)
+    seconds = np.zeros(len(filters) + 1)
+    seconds[0] = time.perf_counter() - start_time
+    filter_chunks: List[np.ndarray] = []
+    value_chunks: Dict[str, List[np.ndarray]] = {name: [] for name in observables}
+    reader = ChunkReader(
+        delphes_sample_file, compiler.collections, acceptance, chunk_size, threads
+    )
+    loop_start = read_start = time.perf_counter()
+    for n_chunk, collections in reader:
+        seconds[0] += time.perf_counter() - read_start
+        events = Events(n_chunk, collections, {}, {})
+        if n_events == 0:
+            filters = analysis.order(filters, events)
+        n_events += n_chunk
+        n_passing[0] += n_chunk
+
+        # Every filter only sees the events passing the previous ones
+        passed = np.arange(n_chunk)
+        for i, filter_ in enumerate(filters, 1):
+            filter_start = time.perf_counter()
+            if len(passed) > 0:
+                keep = analysis.passing(filter_, events)
+                if not keep.all():
+                    events = events.take(keep)
+                    passed = passed[keep]
+            n_passing[i] += len(passed)
+            seconds[i] += time.perf_counter() - filter_start
+
+        chunk_filter = np.zeros(n_chunk, dtype=bool)
+        chunk_filter[passed] = True
+        filter_chunks.append(chunk_filter)
+        if len(passed) > 0:
+            for name in observables:
+                value_chunks[name].append(analysis.observe(name, events))
+        logger.debug(f"{n_events} events of {delphes_sample_file} analysed")
+        read_start = time.perf_counter()
+
+    loop_time = time.perf_counter() - loop_start
+    logger.log(
+        logging.INFO if report_throughput else logging.DEBUG,
+        f"Read {reader.compressed_bytes / 1e6:.1f} MB "
+        f"({reader.uncompressed_bytes / 1e6:.1f} MB decompressed) of "
+        f"{delphes_sample_file} in {loop_time:.2f} s: "
+        f"{reader.compressed_bytes / 1e6 / max(loop_time, 1e-9):.1f} MB/s, "
+        f"{seconds[0]:.2f} s waiting for input",
+    )
+
+    labels = ["all events"] + [filter_.label for filter_ in filters]
+    rows = list(zip(labels, n_passing.tolist(), seconds.tolist()))
+    for label, n_pass, _ in rows[1:]:
+        logger.debug(f"{n_pass} / {n_events} events pass {label}")
+    if cutflows is not None:
+        cutflows.append(CutFlow(delphes_sample_file, rows))
+    elapsed = time.perf_counter() - start_time
+    logger.info(
+        f"Columnar analysis of {n_events} events of {delphes_sample_file} in "
+        f"{elapsed:.2f} s ({n_events / max(elapsed, 1e-9):.0f} events/s)"
+    )
+
+    combined_filter = None
+    if filters:
+        combined_filter = np.concatenate([np.zeros(0, dtype=bool)] + filter_chunks)
+        n_pass = int(combined_filter.sum())
+        if n_pass == 0:
+            logger.warning("No observations remaining!")
+            return None, None, combined_filter
+        logger.info(f"{n_pass} / {n_events} events pass everything")
+
+    # Chunks freed as they are joined, to hold the values only once
+    observable_values: Dict[str, np.ndarray] = OrderedDict(
+        (name, np.concatenate([np.zeros(0)] + value_chunks.pop(name)))
+        for name in observables
+    )
+    return observable_values, None, combined_filter
+
+
+def _is_off(value: Any) -> bool:
+    return (
+        value is None
+        or value is False
+        or (isinstance(value, (list, tuple, dict, set)) and len(value) == 0)
+    )
+
+
+class ColumnarParser:
+    """Drop-in replacement of MadMiner's `parse_delphes_root_file`, calling it
+    back for whatever the columnar engine does not implement"""
+
+    def __init__(
+        self,
+        original: Callable,
+        check: bool = False,
+        graph: Optional[ExpressionGraph] = None,
+        **reading: Any,
+    ) -> None:
+        self.original = original
+        self.signature = inspect.signature(original)
+        self.check = check
+        self.graph = graph
+        # Options of `parse_delphes_root_file` reading the files, e.g. chunk_size
+        self.reading = reading
+        # Cut flows of the files analysed by the columnar engine
+        self.cutflows: List[CutFlow] = []
+
+    def __call__(self, *args, **kwargs):
+        bound = self.signature.bind(*args, **kwargs)
+        bound.apply_defaults()
+        options = dict(bound.arguments)
+        delete = options.pop("delete_delphes_sample_file", False)
+        try:
+            result = self._columnar(options)
+        except Unsupported as e:
+            logger.info(f"{e} left to MadMiner, evaluating observables event by event")
+            return self.original(*args, **kwargs)
+
+        if self.check:
+            start_time = time.perf_counter()
+            reference = self.original(*args, **kwargs)
+            logger.info(
+                f"MadMiner analysis in {time.perf_counter() - start_time:.2f} s"
+            )
+            self._compare(result, reference)
+            return reference
+        if delete:
+            os.remove(options["delphes_sample_file"])
+        return result
+
+    def _columnar(self, options: Dict[str, Any]):
+        options = dict(options)
+        delphes_sample_file = options.pop("delphes_sample_file")
+        observables = options.pop("observables")
+        cuts = options.pop("cuts")
+        if not isinstance(observables, dict):
+            raise Unsupported("Observables not given by name")
+
+        acceptance = {}
+        for name in ("e", "mu", "j", "a"):
+            pt_min = options.pop(f"acceptance_pt_min_{name}", None)
+            eta_max = options.pop(f"acceptance_eta_max_{name}", None)
+            acceptance[name] = (pt_min, eta_max)
+        for name, value in options.items():
+            # Everything else, e.g. `weight_labels` or `use_generator_truth`,
+            # must be off
+            if not _is_off(value):
+                raise Unsupported(f"Option {name}")
+
+        return parse_delphes_root_file(
+            delphes_sample_file,
+            observables,
+            cuts,
+            acceptance,
+            self.graph,
+            self.cutflows,
+            **self.reading,
+        )
+
+    @staticmethod
+    def _compare(result, reference) -> None:
+        observations, _, combined_filter = result
+        ref_observations, _, ref_filter = reference
+        differences = []
+        if (combined_filter is None) != (ref_filter is None) or (
+            ref_filter is not None
+            and not np.array_equal(combined_filter, np.asarray(ref_filter))
+        ):
+            differences.append("filter")
+        for name, values in (ref_observations or {}).items():
+            ref = np.asarray(values, dtype=np.float64)
+            if observations is None or name not in observations:
+                differences.append(name)
+            elif observations[name].tobytes() != ref.tobytes():
+                differences.append(name)
+        if (observations is None) != (ref_observations is None):
+            differences.append("observations")
+        if differences:
+            raise RuntimeError(
+                f"Columnar engine differs from MadMiner for: {', '.join(differences)}"
+            )
+        logger.info("Columnar engine matches MadMiner bit for bit")
+
+
+@contextmanager
+def analysis_engine(
+    reader_cls: type,
+    engine: str,
+    graph: Optional[ExpressionGraph] = None,
+    **reading: Any,
+) -> Iterator[List[CutFlow]]:
+    """Make the DelphesReader class `reader_cls` evaluate observables with
+    `engine` while in the context: `columnar`, `madminer` (event by event) or
+    `check` (both, compared). `graph` has the expressions already parsed, the
+    `reading` options (`chunk_size`, `threads`, `report_throughput`) go to
+    `parse_delphes_root_file`. Yields the list of the cut flows of the files
+    analysed by the columnar engine"""
+    module = sys.modules[reader_cls.__module__]
+    original = getattr(module, "parse_delphes_root_file", None)
+    if original is None:
+        logger.warning(
+            f"{module.__name__} does not call parse_delphes_root_file, "
+            "evaluating observables event by event"
+        )
+        yield []
+        return
+
+    with _compiled_eval(original, graph):
+        if engine == "madminer":
+            yield []
+            return
+        parser = ColumnarParser(
+            original, check=engine == "check", graph=graph, **reading
+        )
+        module.parse_delphes_root_file = parser
+        try:
+            yield parser.cutflows
+        finally:
+            module.parse_delphes_root_file = original
+
+
+@contextmanager
+def _compiled_eval(function: Callable, graph: Optional[ExpressionGraph]) -> Iterator:
+    """Make the `eval` of the module of `function` (MadMiner's event by event
+    path) run the code of the expressions compiled in `graph`, instead of
+    compiling the expression for every event"""
+    if graph is None:
+        yield
+        return
+    module = sys.modules[function.__module__]
+    previous = module.__dict__.get("eval")
+    # Module globals shadow the builtins
+    module.eval = graph.eval
+    try:
+        yield
+    finally:
+        if previous is None:
+            del module.eval
+        else:
+            module.eval = previous
@@ -0,0 +1,97 @@
+"""Content-addressed store of Delphes ROOT files.
+
+Delphes is deterministic given its inputs, so the ROOT file of a HepMC file
+simulated with the same card and Delphes version is simulated once and linked
+afterwards, e.g. when redoing Delphes for a run whose events did not change or
+when several experiments generate the same events. Entries are keyed by the
+hash of the HepMC file, the Delphes card and the Delphes version.
+"""
+
+from __future__ import annotations
+
+import fcntl
+import hashlib
+import json
+import os
+import tempfile
+from pathlib import Path
+from typing import Callable
+
+from madminer_cli import LOGGER
+from madminer_cli.parse_cls import DelphesArgs
+from madminer_cli.staging import file_digest, read_checksums
+
+
+def delphes_version(delphes_dir: Path) -> str:
+    version_file = Path(delphes_dir) / "VERSION"
+    if version_file.exists():
+        return version_file.read_text()
+    # Without version file, at least don't mix different installations
+    return str(Path(delphes_dir).resolve())
+
+
+class DelphesCache:
+    SUFFIX = ".root"
+
+    def __init__(self, cache_dir: Path) -> None:
+        self.logger = LOGGER.getChild(f"{__name__}.{self.__class__.__name__}")
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def hepmc_digest(arguments: DelphesArgs) -> str:
+        """Hash of the HepMC file, taken from the checksums written when it was
+        staged in if possible (see `madminer_cli.staging`)"""
+        hepmc = arguments.sample.hepmc_filename
+        if arguments.proc_dir is not None:
+            rel = os.path.relpath(hepmc, arguments.proc_dir)
+            digest = read_checksums(Path(arguments.proc_dir)).get(rel)
+            if digest is not None:
+                return digest
+        return file_digest(hepmc)
+
+    @classmethod
+    def key(cls, arguments: DelphesArgs) -> str:
+        """Hash of everything the ROOT file depends on"""
+        inputs = {
+            "hepmc": cls.hepmc_digest(arguments),
+            "delphes_card": file_digest(arguments.delphes_card),
+            "delphes_version": delphes_version(arguments.delphes_dir),
+        }
+        return hashlib.sha256(json.dumps(inputs, sort_keys=True).encode()).hexdigest()
+
+    def get(self, key: str, build: Callable[[Path], None]) -> Path:
+        """Path to the stored ROOT file for `key`, calling `build` with a fresh
+        path to create it if missing. Concurrent jobs with the same key wait
+        for the first one to build it"""
+        entry = self.cache_dir / (key + self.SUFFIX)
+        with open(self.cache_dir / f"{key}.lock", "w") as lock:
+            # POSIX locks also work on NFS, unlike `flock`
+            fcntl.lockf(lock, fcntl.LOCK_EX)
+            try:
+                if entry.is_file():
+                    self.logger.info(f"Delphes output found in store: {entry}")
+                    return entry
+
+                self.logger.info(f"Delphes output not in store, building {entry}")
+                fd, tmp = tempfile.mkstemp(
+                    prefix=f"{key}.", suffix=self.SUFFIX, dir=self.cache_dir
+                )
+                os.close(fd)
+                try:
+                    build(Path(tmp))
+                    # Entries only appear complete
+                    os.replace(tmp, entry)
+                finally:
+                    Path(tmp).unlink(missing_ok=True)
+                return entry
+            finally:
+                fcntl.lockf(lock, fcntl.LOCK_UN)
+
+    def link(self, entry: Path, delphes_filename: Path) -> None:
+        """Point `delphes_filename` to a stored ROOT file. Symlinks are staged
+        as symlinks, so the ROOT file is never copied out of the store"""
+        delphes_filename.parent.mkdir(parents=True, exist_ok=True)
+        delphes_filename.unlink(missing_ok=True)
+        os.symlink(os.path.abspath(entry), delphes_filename)
+        self.logger.info(f"Linked {delphes_filename} to {entry}")
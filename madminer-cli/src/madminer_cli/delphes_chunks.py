@@ -0,0 +1,167 @@
+"""Run Delphes on chunks of a HepMC file in parallel.
+
+The HepMC file is unzipped once and split at event boundaries into contiguous
+byte ranges of about the same size. Every range is streamed, between the header
+and the footer of the file, to the standard input of its own Delphes process.
+The ROOT files are merged with `hadd` in the order of the chunks, so events keep
+the order of the HepMC (and LHE) file, which the analysis relies on to match
+weights and observables.
+"""
+
+from __future__ import annotations
+
+import gzip
+import mmap
+import os
+import shutil
+import subprocess
+import threading
+import time
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from madminer_cli import LOGGER
+
+# Events start with an `E` line, in HepMC2 and HepMC3 ASCII files alike
+EVENT_START = b"\nE "
+# Last line of the file, e.g. `HepMC::IO_GenEvent-END_EVENT_LISTING`
+FOOTER_START = b"\nHepMC::"
+CHUNK_SIZE = 1 << 22
+
+logger = LOGGER.getChild(__name__)
+
+
+def unzip(hepmc_filename: Path, dst_dir: Path) -> Path:
+    if hepmc_filename.suffix != ".gz":
+        return hepmc_filename
+    dst = dst_dir / hepmc_filename.stem
+    with gzip.open(hepmc_filename, "rb") as fsrc, open(dst, "wb") as fdst:
+        shutil.copyfileobj(fsrc, fdst, CHUNK_SIZE)
+    return dst
+
+
+def event_ranges(
+    data: mmap.mmap, n_chunks: int
+) -> Tuple[Tuple[int, int], List[Tuple[int, int]], Tuple[int, int]]:
+    """Byte ranges of the header, of up to `n_chunks` chunks of whole events
+    and of the footer of a HepMC file"""
+    size = len(data)
+    if data[:2] == EVENT_START[1:]:
+        first = 0
+    else:
+        first = data.find(EVENT_START) + 1
+        if first == 0:
+            raise ValueError("No events in HepMC file")
+    end = data.rfind(FOOTER_START) + 1
+    if end <= first:
+        # Truncated file without footer
+        end = size
+
+    bounds = [first]
+    for k in range(1, n_chunks):
+        target = first + (end - first) * k // n_chunks
+        pos = data.find(EVENT_START, max(target - 1, bounds[-1]), end)
+        if pos < 0:
+            break
+        if pos + 1 > bounds[-1]:
+            bounds.append(pos + 1)
+    bounds.append(end)
+    chunks = list(zip(bounds[:-1], bounds[1:]))
+    return (0, first), chunks, (end, size)
+
+
+def _feed(stdin, data: mmap.mmap, ranges: List[Tuple[int, int]]) -> None:
+    try:
+        for start, stop in ranges:
+            for offset in range(start, stop, CHUNK_SIZE):
+                stdin.write(data[offset : min(offset + CHUNK_SIZE, stop)])
+    except BrokenPipeError:
+        # Delphes died, its exit code tells why
+        pass
+    finally:
+        stdin.close()
+
+
+def run_delphes_chunks(
+    delphes_directory: Path,
+    delphes_card_filename: Path,
+    hepmc_sample_filename: Path,
+    delphes_sample_filename: Path,
+    jobs: int,
+    log_dir: Path,
+    delphes_executable: str = "DelphesHepMC2",
+    hadd: str = "hadd",
+    tmp_dir: Optional[Path] = None,
+) -> None:
+    """Simulate `hepmc_sample_filename` with `jobs` Delphes processes, and
+    write the merged ROOT file to `delphes_sample_filename`"""
+    start_time = time.perf_counter()
+    out_dir = delphes_sample_filename.parent
+    tmp_dir = Path(tmp_dir) if tmp_dir is not None else out_dir
+    hepmc = unzip(hepmc_sample_filename, tmp_dir)
+    unzipped = time.perf_counter()
+
+    executable = str(Path(delphes_directory) / delphes_executable)
+    outputs: List[Path] = []
+    try:
+        with open(hepmc, "rb") as f, mmap.mmap(
+            f.fileno(), 0, access=mmap.ACCESS_READ
+        ) as data:
+            header, chunks, footer = event_ranges(data, jobs)
+            procs = []
+            for i, chunk in enumerate(chunks):
+                output = out_dir / f"{delphes_sample_filename.stem}.{i}.root"
+                output.unlink(missing_ok=True)
+                outputs.append(output)
+                log = open(log_dir / f"Delphes.{i}.log", "w")
+                # `-` reads the events from the standard input
+                proc = subprocess.Popen(
+                    [executable, str(delphes_card_filename), str(output), "-"],
+                    stdin=subprocess.PIPE,
+                    stdout=log,
+                    stderr=subprocess.STDOUT,
+                )
+                log.close()
+                feeder = threading.Thread(
+                    target=_feed,
+                    args=(proc.stdin, data, [header, chunk, footer]),
+                    daemon=True,
+                )
+                feeder.start()
+                procs.append((proc, feeder))
+
+            failed = []
+            for i, (proc, feeder) in enumerate(procs):
+                feeder.join()
+                if proc.wait() != 0:
+                    failed.append(f"{i} (exit code {proc.returncode})")
+            if failed:
+                raise RuntimeError(
+                    f"Delphes failed for chunks {', '.join(failed)}, see the "
+                    f"Delphes.<chunk>.log files in {log_dir}"
+                )
+        simulated = time.perf_counter()
+
+        if len(outputs) == 1:
+            os.replace(outputs[0], delphes_sample_filename)
+        else:
+            # Entries are appended in the order of the inputs
+            with open(log_dir / "hadd.log", "w") as log:
+                subprocess.run(
+                    [hadd, "-f", str(delphes_sample_filename)]
+                    + [str(o) for o in outputs],
+                    stdout=log,
+                    stderr=subprocess.STDOUT,
+                    check=True,
+                )
+    finally:
+        for output in outputs:
+            output.unlink(missing_ok=True)
+        if hepmc != hepmc_sample_filename:
+            hepmc.unlink(missing_ok=True)
+
+    logger.info(
+        f"Delphes run on {len(outputs)} chunks of {hepmc_sample_filename}: "
+        f"unzip {unzipped - start_time:.1f} s, simulation "
+        f"{simulated - unzipped:.1f} s, merge {time.perf_counter() - simulated:.1f} s"
+    )
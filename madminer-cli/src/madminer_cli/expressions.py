@@ -0,0 +1,149 @@
+"""Expressions of observables and cuts, parsed once for the whole analysis.
+
+MadMiner evaluates the expressions with `eval` in a namespace of particles and
+math functions, and silently uses the default value for the events where they
+fail, even when they could never work (a typo in a name, a syntax error). Here
+they are parsed and checked when the arguments of `run_analysis` are parsed, and
+their sub-expressions are interned: sub-expressions written several times, like
+`l[0]` in `l[0].E` and `l[0].px`, are a single node of the graph, which the
+columnar engine evaluates once. Their code is compiled once as well, and reused by
+the `eval` of the event by event path (`ExpressionGraph.eval`) instead of
+compiling the expression again in every event.
+"""
+
+from __future__ import annotations
+
+import ast
+import builtins
+import sys
+from types import CodeType
+from typing import Any, Dict, Iterable, Optional, Set
+
+# Names MadMiner gives to expressions, besides the builtins
+MATH_FUNCTIONS = {
+    "acos",
+    "asin",
+    "atan",
+    "atan2",
+    "ceil",
+    "cos",
+    "cosh",
+    "exp",
+    "floor",
+    "log",
+    "pow",
+    "sin",
+    "sinh",
+    "sqrt",
+    "tan",
+    "tanh",
+}
+MATH_CONSTANTS = {"pi"}
+# Lists of particles, and single objects
+COLLECTIONS = {"e", "mu", "j", "a", "l"}
+OBJECTS = {"met", "visible", "all", "boost_to_com"}
+MADMINER_NAMES = MATH_FUNCTIONS | MATH_CONSTANTS | COLLECTIONS | OBJECTS
+
+
+def parse(expression: str) -> ast.Expression:
+    """Syntax tree of `expression`, as `eval` reads it"""
+    # `eval` ignores leading spaces and tabs
+    return ast.parse(expression.lstrip(" \t"), mode="eval")
+
+
+class _Interner(ast.NodeTransformer):
+    def __init__(self, nodes: Dict[str, ast.expr]) -> None:
+        self.nodes = nodes
+
+    def generic_visit(self, node: ast.AST) -> ast.AST:
+        super().generic_visit(node)
+        if not isinstance(node, ast.expr):
+            return node
+        return self.nodes.setdefault(ast.dump(node), node)
+
+
+def _bound_names(tree: ast.AST) -> Set[str]:
+    """Names bound inside the expression, e.g. by comprehensions or lambdas"""
+    names = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name) and not isinstance(node.ctx, ast.Load):
+            names.add(node.id)
+        elif isinstance(node, ast.arg):
+            names.add(node.arg)
+    return names
+
+
+class ExpressionGraph:
+    """Observables and cuts of an analysis, sharing their common sub-expressions"""
+
+    def __init__(
+        self, observables: Dict[str, str], cuts: Iterable[str] = ()
+    ) -> None:
+        # Distinct sub-expressions, by their dump
+        self.nodes: Dict[str, ast.expr] = {}
+        self.trees: Dict[str, ast.Expression] = {}
+        self.code: Dict[str, CodeType] = {}
+        self.n_expressions = 0
+        for name, expression in observables.items():
+            self.add(expression, f"observable {name}")
+        for expression in cuts:
+            self.add(expression, "cut", names=observables)
+
+    def add(
+        self, expression: str, what: str, names: Iterable[str] = ()
+    ) -> ast.Expression:
+        """Parse `expression` of `what` (e.g. `observable pt_j1`), which may also
+        use `names`. Raises ValueError if `eval` would fail in every event"""
+        if not isinstance(expression, str):
+            raise ValueError(f"Invalid {what}: {expression!r} is not a string")
+        self.n_expressions += 1
+        if expression in self.trees:
+            self._check(self.trees[expression], expression, what, names)
+            return self.trees[expression]
+        try:
+            tree = parse(expression)
+            # Also raises errors the parser does not, e.g. `yield`
+            code = compile(tree, f"<{what}>", "eval")
+        except SyntaxError as e:
+            raise ValueError(f"Invalid {what} {expression!r}: {e.msg}") from None
+        self._check(tree, expression, what, names)
+        tree = _Interner(self.nodes).visit(tree)
+        self.trees[expression] = tree
+        self.code[expression] = code
+        return tree
+
+    @staticmethod
+    def _check(
+        tree: ast.Expression, expression: str, what: str, names: Iterable[str]
+    ) -> None:
+        known = MADMINER_NAMES | set(names) | _bound_names(tree)
+        for node in ast.walk(tree):
+            if (
+                isinstance(node, ast.Name)
+                and isinstance(node.ctx, ast.Load)
+                and node.id not in known
+                and not hasattr(builtins, node.id)
+            ):
+                raise ValueError(
+                    f"Invalid {what} {expression!r}: unknown name {node.id}"
+                )
+
+    def tree(self, expression: str) -> Optional[ast.Expression]:
+        return self.trees.get(expression)
+
+    def eval(self, source: Any, globals: Any = None, locals: Any = None) -> Any:
+        """Builtin `eval`, running the compiled code of the expressions of the
+        graph instead of compiling them again"""
+        if globals is None:
+            # Namespace of the caller, like the builtin
+            frame = sys._getframe(1)
+            globals, locals = frame.f_globals, frame.f_locals
+        if isinstance(source, str):
+            source = self.code.get(source, source)
+        return builtins.eval(source, globals, locals)
+
+    def summary(self) -> str:
+        return (
+            f"{self.n_expressions} expressions ({len(self.trees)} distinct) with "
+            f"{len(self.nodes)} distinct sub-expressions"
+        )
@@ -0,0 +1,250 @@
+"""Ledger of the runs of a DAG: process directory, benchmark and seed of every
+run, and the artifacts every stage left (path, size and sha256).
+
+The ledger is a folder in the shared temporary directory of the DAG, written by
+the jobs themselves: every run has its own folder, with the record of the run
+(`run.json`) and of the artifacts of every stage, one per folder the stage wrote
+them to (`<stage>.<root digest>.json`), so that the analyses of a run shared by
+several experiments, each writing to its own `h5_dir`, have their own records.
+Every record has a single writer. Records are small files written to a temporary
+file and renamed into place, which is atomic on network filesystems too: readers
+never see partial records. `Ledger.load` copies all records into a SQLite file
+for queries, e.g. on the local disk of the submit host. The jobs do not share a
+SQLite file themselves: its locking is not reliable on network filesystems, and
+the jobs of all nodes writing to it at once could corrupt it.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import socket
+import sqlite3
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from madminer_cli import LOGGER
+from madminer_cli.staging import (
+    CHECKSUMS_FILENAME,
+    expand,
+    file_digest,
+    read_checksums,
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run INTEGER PRIMARY KEY,
+    proc_dir TEXT,
+    benchmark TEXT,
+    seed INTEGER,
+    updated REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS artifacts (
+    run INTEGER NOT NULL,
+    stage TEXT NOT NULL,
+    root TEXT,
+    path TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    sha256 TEXT,
+    updated REAL NOT NULL,
+    PRIMARY KEY (run, stage, path)
+);
+"""
+
+logger = LOGGER.getChild(__name__)
+
+
+class RunRecord(NamedTuple):
+    run: int
+    proc_dir: Optional[str]
+    benchmark: Optional[str]
+    seed: Optional[int]
+
+
+class Artifact(NamedTuple):
+    run: int
+    stage: str
+    root: Optional[str]
+    path: str
+    size: int
+    sha256: Optional[str]
+
+
+def collect_artifacts(
+    root: Path, patterns: Iterable[str]
+) -> Dict[str, Tuple[int, Optional[str]]]:
+    """Path -> (size, sha256) of the files under `root` matching `patterns`.
+    Checksums written by `madminer stage` are reused instead of reading the
+    files again. Symlinks (e.g. to the Delphes store, whose entries never change)
+    are recorded without checksum"""
+    known = read_checksums(root)
+    artifacts = {}
+    for pattern in patterns:
+        matches = [rel for rel, is_dir in expand(root, pattern) if not is_dir]
+        if not matches:
+            raise FileNotFoundError(f"Nothing matches {pattern} in {root}")
+        for rel in matches:
+            if rel == CHECKSUMS_FILENAME:
+                continue
+            path = root / rel
+            digest = known.get(rel)
+            if digest is None and not path.is_symlink():
+                digest = file_digest(path)
+            artifacts[os.path.abspath(path)] = (path.stat().st_size, digest)
+    return artifacts
+
+
+class Ledger:
+    FIELDS = ("proc_dir", "benchmark", "seed")
+    RUN_FILENAME = "run.json"
+
+    def __init__(self, path: Path) -> None:
+        self.path = Path(path)
+
+    def _run_dir(self, run: int) -> Path:
+        return self.path / str(run)
+
+    @staticmethod
+    def _read(path: Path) -> Optional[Dict[str, Any]]:
+        try:
+            with open(path, "r") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    @staticmethod
+    def _write(path: Path, record: Dict[str, Any]) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Unique per writer, jobs of different nodes may share the pid
+        tmp = path.parent / f".{path.name}.{socket.gethostname()}-{os.getpid()}"
+        with open(tmp, "w") as f:
+            json.dump(record, f, indent=1)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+
+    def put(
+        self,
+        run: int,
+        proc_dir: Optional[str] = None,
+        benchmark: Optional[str] = None,
+        seed: Optional[int] = None,
+    ) -> None:
+        """Insert or update a run. Fields left to None keep their value"""
+        path = self._run_dir(run) / self.RUN_FILENAME
+        record = self._read(path)
+        given = {"proc_dir": proc_dir, "benchmark": benchmark, "seed": seed}
+        given = {k: v for k, v in given.items() if v is not None}
+        # Stages recording their artifacts leave the run as it is, so that
+        # experiments sharing the run do not write it at once
+        if record is not None and not given:
+            return
+        record = {**dict.fromkeys(self.FIELDS), **(record or {}), **given}
+        record.update(run=run, updated=time.time())
+        self._write(path, record)
+        logger.info(f"Run {run} recorded in {self.path}")
+
+    def get(self, run: int) -> Optional[RunRecord]:
+        record = self._read(self._run_dir(run) / self.RUN_FILENAME)
+        if record is None:
+            return None
+        return RunRecord(run, *(record[f] for f in self.FIELDS))
+
+    def put_artifacts(
+        self,
+        run: int,
+        stage: str,
+        root: Path,
+        artifacts: Dict[str, Tuple[int, Optional[str]]],
+    ) -> None:
+        """Record the artifacts a stage left under `root`, replacing those it
+        recorded there before"""
+        root = os.path.abspath(root)
+        digest = hashlib.sha1(root.encode()).hexdigest()[:12]
+        self._write(
+            self._run_dir(run) / f"{stage}.{digest}.json",
+            {
+                "run": run,
+                "stage": stage,
+                "root": root,
+                "artifacts": {
+                    path: {"size": size, "sha256": digest}
+                    for path, (size, digest) in sorted(artifacts.items())
+                },
+                "updated": time.time(),
+            },
+        )
+        size = sum(size for size, _ in artifacts.values())
+        logger.info(
+            f"{len(artifacts)} artifacts ({size / 1e6:.1f} MB) of stage {stage} "
+            f"of run {run} in {root} recorded in {self.path}"
+        )
+
+    def _stage_records(self, run: int) -> List[Dict[str, Any]]:
+        records = []
+        for path in sorted(self._run_dir(run).glob("*.json")):
+            if path.name != self.RUN_FILENAME:
+                record = self._read(path)
+                if record is not None:
+                    records.append(record)
+        return records
+
+    def artifacts(self, run: int, stage: Optional[str] = None) -> List[Artifact]:
+        artifacts = [
+            Artifact(
+                run,
+                record["stage"],
+                record.get("root"),
+                path,
+                a["size"],
+                a["sha256"],
+            )
+            for record in self._stage_records(run)
+            if stage is None or record["stage"] == stage
+            for path, a in record["artifacts"].items()
+        ]
+        return sorted(artifacts, key=lambda a: a.path)
+
+    def runs(self) -> List[int]:
+        if not self.path.is_dir():
+            return []
+        return sorted(int(d.name) for d in self.path.iterdir() if d.name.isdigit())
+
+    def load(self, db: Path) -> Tuple[int, int]:
+        """Copy all records into the SQLite file `db` (tables `runs` and
+        `artifacts`), replacing it. Returns the number of runs and artifacts"""
+        db = Path(db)
+        tmp = db.parent / f".{db.name}.tmp"
+        tmp.unlink(missing_ok=True)
+        n_runs = n_artifacts = 0
+        conn = sqlite3.connect(str(tmp))
+        try:
+            conn.executescript(SCHEMA)
+            for run in self.runs():
+                record = self._read(self._run_dir(run) / self.RUN_FILENAME)
+                if record is not None:
+                    conn.execute(
+                        "INSERT INTO runs VALUES (?, ?, ?, ?, ?)",
+                        (run, *(record[f] for f in self.FIELDS), record["updated"]),
+                    )
+                    n_runs += 1
+                for stage in self._stage_records(run):
+                    rows = [
+                        (run, stage["stage"], stage.get("root"), path)
+                        + (a["size"], a["sha256"], stage["updated"])
+                        for path, a in stage["artifacts"].items()
+                    ]
+                    conn.executemany(
+                        "INSERT INTO artifacts VALUES (?, ?, ?, ?, ?, ?, ?)", rows
+                    )
+                    n_artifacts += len(rows)
+            conn.commit()
+        finally:
+            conn.close()
+        os.replace(tmp, db)
+        logger.info(
+            f"{n_runs} runs and {n_artifacts} artifacts of {self.path} loaded into {db}"
+        )
+        return n_runs, n_artifacts
@@ -7,14 +7,17 @@ from typing import List
 from madminer_cli import __doc__ as PACKAGE_DOCSTRING
 from madminer_cli import __version__
 from madminer_cli.base import BASE_DELPHES, BASE_INFILE, BASE_SETUP
-from madminer_cli.parse_cls import Args
+from madminer_cli.parse_cls import Args, UploadArgs
 from madminer_cli.parse_funs import (
     parse_analysis,
     parse_augmentation,
     parse_delphes,
     parse_gen,
+    parse_ledger,
     parse_setup,
+    parse_stage,
 )
+from madminer_cli.staging import STAGES
 
 __all__ = ["parse_args"]
 
@@ -50,6 +53,40 @@ def parse_args(args: List[str]) -> Args:
         type=Path,
         help="File to write logs to",
     )
+    parser.add_argument(
+        "--upload-from",
+        dest="upload_from",
+        type=Path,
+        default=None,
+        help="Output directory of the command, uploaded in the background while "
+        "the command runs (requires --upload-to)",
+    )
+    parser.add_argument(
+        "--upload-to",
+        dest="upload_to",
+        type=Path,
+        default=None,
+        help="Directory to upload finished outputs to, renamed into place atomically",
+    )
+    parser.add_argument(
+        "--upload-pattern",
+        dest="upload_pattern",
+        default="*",
+        help="Only upload files whose path relative to --upload-from matches",
+    )
+    parser.add_argument(
+        "--upload-jobs",
+        dest="upload_jobs",
+        type=int,
+        default=2,
+        help="Number of files uploaded at once",
+    )
+    parser.add_argument(
+        "--upload-delete",
+        dest="upload_delete",
+        action="store_true",
+        help="Delete uploaded files from --upload-from to free scratch space early",
+    )
 
     # 1: Setup parsing
     parser_setup = subparsers.add_parser(
@@ -143,6 +180,21 @@ def parse_args(args: List[str]) -> Args:
         action="store_true",
         help="Specify this if you want to run generation (not only preparation scripts)",
     )
+    parser_gen.add_argument(
+        "--cache-dir",
+        type=Path,
+        default=None,
+        help="""Cache of prepared process directories. The process directory is
+        prepared once for every set of cards, setup file and MadGraph version, and
+        copied to `proc_dir` afterwards""",
+    )
+    parser_gen.add_argument(
+        "--reweight-card-insert",
+        type=str,
+        default=None,
+        help="""Lines pasted on top of the reweight cards created by MadMiner, e.g. to
+        change the process definition""",
+    )
     parser_gen.set_defaults(arg_handler=parse_gen)
 
     # TODO: Delphes parsing doesn't need this many arguments, fix
@@ -166,6 +218,34 @@ def parse_args(args: List[str]) -> Args:
         default=f"{os.getenv('MG_FOLDER_PATH', '.')}/Delphes",
         help="The base directory of the Delphes program.",
     )
+    parser_delphes.add_argument(
+        "--cache-dir",
+        type=Path,
+        default=None,
+        help="""Content-addressed store of ROOT files. The ROOT file is looked up by
+        the hash of the HepMC file, Delphes card and Delphes version, and linked
+        instead of running Delphes again""",
+    )
+    parser_delphes.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        help="""Split the HepMC file at event boundaries into this many chunks,
+        simulated by concurrent Delphes processes and merged in order with hadd""",
+    )
+    parser_delphes.add_argument(
+        "--delphes-executable",
+        type=str,
+        default="DelphesHepMC2",
+        help="Delphes program run on the chunks, in the Delphes directory",
+    )
+    parser_delphes.add_argument(
+        "--hadd",
+        type=str,
+        default="hadd",
+        help="Program merging the ROOT files of the chunks",
+    )
     parser_delphes.set_defaults(arg_handler=parse_delphes)
 
     # 4. Analysis parsing
@@ -201,6 +281,34 @@ def parse_args(args: List[str]) -> Args:
         action="store_true",
         help="Specify this if sampling from background",
     )
+    parser_analysis.add_argument(
+        "--engine",
+        default="madminer",
+        choices=("columnar", "madminer", "check"),
+        help="""How observables and cuts are evaluated: on arrays of all the events,
+        falling back to MadMiner for what is not supported, event by event by
+        MadMiner, or both, failing if they differ. Opt in to `columnar` once
+        `check` matched for the observables of the experiment""",
+    )
+    parser_analysis.add_argument(
+        "--chunk-size",
+        type=int,
+        default=100_000,
+        help="""Number of events the columnar engine reads from the ROOT file and
+        analyses at once, which bounds its memory use""",
+    )
+    parser_analysis.add_argument(
+        "--threads",
+        type=int,
+        default=1,
+        help="""Threads decompressing the ROOT file, while the next chunk of events
+        is read ahead of the one being analysed""",
+    )
+    parser_analysis.add_argument(
+        "--report-throughput",
+        action="store_true",
+        help="Log the MB/s read from the ROOT file",
+    )
 
     parser_analysis.set_defaults(arg_handler=parse_analysis)
 
@@ -255,11 +363,89 @@ def parse_args(args: List[str]) -> Args:
     )
     parser_augmentation.set_defaults(arg_handler=parse_augmentation)
 
+    # 6. Staging
+    parser_stage = subparsers.add_parser(
+        "stage",
+        description="""
+        Copy the inputs of a stage to the scratch space of the node (`in`), or its
+        outputs back to the shared filesystem (`out`). Only the files in the stage
+        manifest are copied, in parallel and checksummed.
+        """,
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+        help="Copy the inputs or outputs of a stage",
+    )
+    parser_stage.add_argument("direction", choices=("in", "out"))
+    parser_stage.add_argument("stage", choices=tuple(STAGES))
+    parser_stage.add_argument("src_dir", type=str, help="Directory to copy from")
+    parser_stage.add_argument("dst_dir", type=str, help="Directory to copy to")
+    parser_stage.add_argument(
+        "-j", "--jobs", type=int, default=4, help="Number of files copied at once"
+    )
+    parser_stage.add_argument(
+        "--no-verify",
+        dest="verify",
+        action="store_false",
+        help="Don't read the copies back to compare checksums",
+    )
+    parser_stage.set_defaults(arg_handler=parse_stage)
+
+    # 7. Run ledger
+    parser_ledger = subparsers.add_parser(
+        "ledger",
+        description="""
+        Read (`get`) or record (`put`) a run in the ledger of the DAG: its process
+        directory, benchmark and seed, and the artifacts of its stages. `get` prints
+        the requested fields separated by spaces. `load` copies the whole ledger
+        into a SQLite file (--db) for queries.
+        """,
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+        help="Read or record a run in the run ledger",
+    )
+    parser_ledger.add_argument("action", choices=("get", "put", "load"))
+    parser_ledger.add_argument("ledger", type=str, help="Ledger folder")
+    parser_ledger.add_argument(
+        "run", type=int, nargs="?", default=None, help="Run number (`get`, `put`)"
+    )
+    parser_ledger.add_argument(
+        "fields", nargs="*", help="Fields to print (`get`), all if none given"
+    )
+    parser_ledger.add_argument(
+        "--db", type=str, default=None, help="SQLite file written by `load`"
+    )
+    parser_ledger.add_argument("--proc-dir", type=str, default=None)
+    parser_ledger.add_argument("--benchmark", type=str, default=None)
+    parser_ledger.add_argument("--seed", type=int, default=None)
+    parser_ledger.add_argument(
+        "--run-card", type=str, default=None, help="Run card to read the seed from"
+    )
+    parser_ledger.add_argument(
+        "--stage",
+        type=str,
+        default=None,
+        help="Record the files the stage left under --root as its artifacts",
+    )
+    parser_ledger.add_argument(
+        "--root", type=str, default=None, help="Directory of the artifacts"
+    )
+    parser_ledger.add_argument(
+        "--pattern",
+        dest="patterns",
+        action="append",
+        default=[],
+        help="Artifacts relative to --root (default: the outputs of the stage, see "
+        "`madminer stage`)",
+    )
+    parser_ledger.set_defaults(arg_handler=parse_ledger)
+
     # parse args
     arguments = parser.parse_args(args)
 
     if not getattr(arguments, "arg_handler", None):
         parser.error("Too few arguments provided")
+    if (arguments.upload_from is None) != (arguments.upload_to is None):
+        parser.error("--upload-from and --upload-to go together")
+    if arguments.upload_jobs < 1:
+        parser.error(f"Invalid number of upload jobs {arguments.upload_jobs}")
 
     log_level = logging.INFO
     if arguments.verbose:
@@ -279,7 +465,17 @@ def parse_args(args: List[str]) -> Args:
     )
 
     try:
-        return arguments.arg_handler(arguments)
+        stage_args = arguments.arg_handler(arguments)
+        if arguments.upload_from is None:
+            return stage_args
+        return UploadArgs(
+            stage_args=stage_args,
+            src_dir=arguments.upload_from,
+            dst_dir=arguments.upload_to,
+            pattern=arguments.upload_pattern,
+            jobs=arguments.upload_jobs,
+            delete=arguments.upload_delete,
+        )
     except Exception as ex:
         # parser.error(f"{type(ex).__name__}: {ex}")
         raise
@@ -2,6 +2,7 @@ from dataclasses import dataclass
 from pathlib import Path
 from typing import List, Optional, Union
 
+from madminer_cli.expressions import ExpressionGraph
 from madminer_cli.schemas import (
     AnalysisSample,
     Benchmark,
@@ -35,6 +36,9 @@ class GenArgs:
     proc_dir: str
     is_background: bool
     now: bool
+    # Content-addressed cache of prepared process directories
+    cache_dir: Optional[Path] = None
+    reweight_card_insert: Optional[Path] = None
 
 
 @dataclass
@@ -43,6 +47,13 @@ class DelphesArgs:
     delphes_dir: Path
     sample: DelphesSample
     log_file: Path
+    proc_dir: Optional[Path] = None
+    # Content-addressed store of ROOT files
+    cache_dir: Optional[Path] = None
+    # Concurrent Delphes processes, each simulating a chunk of the events
+    jobs: int = 1
+    delphes_executable: str = "DelphesHepMC2"
+    hadd: str = "hadd"
 
 
 @dataclass
@@ -52,6 +63,11 @@ class AnalysisArgs:
     observables: List[Observable]
     cuts: List[Cut]
     outfile: str
+    expressions: ExpressionGraph
+    engine: str = "columnar"
+    chunk_size: int = 100_000
+    threads: int = 1
+    report_throughput: bool = False
 
 
 @dataclass
@@ -66,4 +82,50 @@ class AugmentationArgs:
     nproc: Optional[int]
 
 
-Args = Union[SetupArgs, GenArgs, DelphesArgs, AugmentationArgs, AnalysisArgs]
+@dataclass
+class StageArgs:
+    direction: str
+    stage: str
+    src_dir: Path
+    dst_dir: Path
+    jobs: int
+    verify: bool
+
+
+@dataclass
+class LedgerArgs:
+    action: str
+    ledger: Path
+    run: Optional[int]
+    fields: List[str]
+    db: Optional[Path]
+    proc_dir: Optional[str]
+    benchmark: Optional[str]
+    seed: Optional[int]
+    stage: Optional[str]
+    root: Optional[Path]
+    patterns: List[str]
+
+
+@dataclass
+class UploadArgs:
+    """Arguments of a stage, run while uploading its outputs in the background"""
+
+    stage_args: "Args"
+    src_dir: Path
+    dst_dir: Path
+    pattern: str
+    jobs: int
+    delete: bool
+
+
+Args = Union[
+    SetupArgs,
+    GenArgs,
+    DelphesArgs,
+    AugmentationArgs,
+    AnalysisArgs,
+    StageArgs,
+    LedgerArgs,
+    UploadArgs,
+]
@@ -1,6 +1,11 @@
+from pathlib import Path
+
 import yaml
 
+from madminer_cli.cards import read_seed
 from madminer_cli.decorators import pack, validate_paths
+from madminer_cli.expressions import ExpressionGraph
+from madminer_cli.ledger import Ledger
 from madminer_cli.parse_cls import (
     AnalysisArgs,
     AnalysisSample,
@@ -8,7 +13,9 @@ from madminer_cli.parse_cls import (
     DelphesArgs,
     DelphesSample,
     GenArgs,
+    LedgerArgs,
     SetupArgs,
+    StageArgs,
 )
 from madminer_cli.schemas import Benchmark, Cut, MorphingSetup, Observable, Parameter
 from madminer_cli.utils import get_delphes_sample
@@ -32,6 +39,7 @@ def parse_setup(args):
     "proc_card",
     "param_card",
     "run_card",
+    "reweight_card_insert",
 )
 def parse_gen(args):
     args.pythia_card = args.cards_dir / args.pythia_card if args.pythia_card else None
@@ -47,6 +55,8 @@ def parse_gen(args):
 @pack(DelphesArgs)
 @validate_paths("delphes_card", "delphes_dir", "proc_dir")
 def parse_delphes(args):
+    if args.jobs < 1:
+        raise ValueError(f"Invalid number of jobs {args.jobs}")
     args.sample = get_delphes_sample(args)
     return args
 
@@ -54,12 +64,21 @@ def parse_delphes(args):
 @pack(AnalysisArgs)
 @validate_paths("setup_file", "proc_dir")
 def parse_analysis(args):
+    if args.chunk_size < 1:
+        raise ValueError(f"Invalid chunk size {args.chunk_size}")
+    if args.threads < 1:
+        raise ValueError(f"Invalid number of threads {args.threads}")
     yaml_config = yaml.safe_load(args.infile)
     observables = [] or yaml_config["observables"]
     cuts = [] or yaml_config["cuts"]
 
     args.observables = [Observable(**o) for o in observables]
     args.cuts = [Cut(name="CUT", **c) for c in cuts]
+    # Invalid expressions fail here, not in every event of the analysis
+    args.expressions = ExpressionGraph(
+        {o.name: o.val_expression for o in args.observables},
+        [c.val_expression for c in args.cuts],
+    )
     args.outfile = args.outfile.format(args.proc_dir.name)
 
     delphes_sample = get_delphes_sample(args)
@@ -88,3 +107,45 @@ def parse_augmentation(args):
     args.theta_test = eval(args.theta_test)
 
     return args
+
+
+@pack(StageArgs)
+@validate_paths("src_dir")
+def parse_stage(args):
+    if args.jobs < 1:
+        raise ValueError(f"Invalid number of jobs {args.jobs}")
+    args.dst_dir = Path(args.dst_dir)
+    return args
+
+
+@pack(LedgerArgs)
+@validate_paths("run_card", "root")
+def parse_ledger(args):
+    args.ledger = Path(args.ledger)
+    if args.action == "load":
+        if args.db is None or args.run is not None or args.fields:
+            raise ValueError("`load` takes the SQLite file (--db) and no run")
+        args.db = Path(args.db)
+        return args
+    if args.run is None:
+        raise ValueError(f"Missing run to {args.action}")
+    if args.db is not None:
+        raise ValueError("--db is only given to `load`")
+    if args.action == "get":
+        invalid = [f for f in args.fields if f not in Ledger.FIELDS]
+        if invalid:
+            raise ValueError(f"Invalid fields {invalid}. Valid are: {Ledger.FIELDS}")
+        return args
+
+    if args.fields:
+        raise ValueError("Fields are only given to `get`")
+    if args.run_card is not None:
+        if args.seed is not None:
+            raise ValueError("Give either the seed or the run card to read it from")
+        seed = read_seed(args.run_card)
+        args.seed = int(seed) if seed is not None else None
+    if (args.stage is None) != (args.root is None):
+        raise ValueError("--stage and --root go together")
+    if args.patterns and args.stage is None:
+        raise ValueError("--pattern requires --stage and --root")
+    return args
@@ -0,0 +1,98 @@
+"""Content-addressed cache of prepared MadGraph process directories.
+
+Runs of the same process only differ in the random seed and the reweight card
+insert, which are patched into the run's copy after preparation. The prepared
+directory is therefore built once per key and cloned for every run.
+"""
+
+from __future__ import annotations
+
+import fcntl
+import hashlib
+import json
+import shutil
+import subprocess
+import tempfile
+from pathlib import Path
+from typing import Callable, Optional
+
+from madminer_cli import LOGGER
+from madminer_cli.cards import run_card_digest
+from madminer_cli.parse_cls import GenArgs
+
+
+def file_digest(path: Optional[Path]) -> Optional[str]:
+    if path is None:
+        return None
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def mg_version(mg_dir: Path) -> str:
+    version_file = Path(mg_dir) / "VERSION"
+    if version_file.exists():
+        return version_file.read_text()
+    # Without version file, at least don't mix different installations
+    return str(Path(mg_dir).resolve())
+
+
+class ProcessCache:
+    def __init__(self, cache_dir: Path) -> None:
+        self.logger = LOGGER.getChild(f"{__name__}.{self.__class__.__name__}")
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def key(arguments: GenArgs) -> str:
+        """Hash of everything the prepared process directory depends on"""
+        inputs = {
+            "proc_card": file_digest(arguments.proc_card),
+            "param_card": file_digest(arguments.param_card),
+            # Runs only differ in the seed, set in the copy of every run
+            "run_card": run_card_digest(arguments.run_card),
+            "pythia_card": file_digest(arguments.pythia_card),
+            "setup_file": file_digest(arguments.setup_file),
+            "mg_config_file": file_digest(arguments.mg_config_file),
+            "mg_version": mg_version(arguments.mg_dir),
+            "benchmarks": sorted(arguments.benchmarks),
+            "is_background": arguments.is_background,
+        }
+        return hashlib.sha256(json.dumps(inputs, sort_keys=True).encode()).hexdigest()
+
+    def get(self, key: str, build: Callable[[Path], None]) -> Path:
+        """Path to the cached process directory for `key`, calling `build` with
+        a fresh directory to create it if missing. Concurrent jobs with the same
+        key wait for the first one to build it"""
+        entry = self.cache_dir / key
+        with open(self.cache_dir / f"{key}.lock", "w") as lock:
+            # POSIX locks also work on NFS, unlike `flock`
+            fcntl.lockf(lock, fcntl.LOCK_EX)
+            try:
+                if entry.is_dir():
+                    self.logger.info(f"Process directory found in cache: {entry}")
+                    return entry
+
+                self.logger.info(f"Process directory not in cache, building {entry}")
+                tmp_dir = Path(tempfile.mkdtemp(prefix=f"{key}.", dir=self.cache_dir))
+                try:
+                    build(tmp_dir / "mgprocess")
+                    # Entries only appear complete
+                    (tmp_dir / "mgprocess").rename(entry)
+                finally:
+                    shutil.rmtree(tmp_dir, ignore_errors=True)
+                return entry
+            finally:
+                fcntl.lockf(lock, fcntl.LOCK_UN)
+
+    def clone(self, entry: Path, proc_dir: Path) -> None:
+        """Copy a cached process directory. MadGraph rewrites cards, includes and
+        seeds in place, so files are not hardlinked: `--reflink=auto` shares the
+        data blocks on copy-on-write filesystems and falls back to a copy"""
+        proc_dir.mkdir(parents=True, exist_ok=True)
+        self.logger.info(f"Cloning cached process directory {entry} to {proc_dir}")
+        subprocess.run(
+            ["cp", "-a", "--reflink=auto", f"{entry}/.", str(proc_dir)], check=True
+        )
@@ -6,17 +6,27 @@ import os
 import tempfile
 from pathlib import Path
 from subprocess import PIPE, Popen
-from typing import TYPE_CHECKING, Any, Type
+from typing import TYPE_CHECKING, Any, Optional, Type
 
 from madminer_cli import LOGGER
+from madminer_cli.cards import insert_reweight_card, read_seed, set_seed
+from madminer_cli.delphes_cache import DelphesCache
+from madminer_cli.delphes_chunks import run_delphes_chunks
 from madminer_cli.parse_cls import (
     AnalysisArgs,
     Args,
     AugmentationArgs,
     DelphesArgs,
     GenArgs,
+    LedgerArgs,
     SetupArgs,
+    StageArgs,
+    UploadArgs,
 )
+from madminer_cli.ledger import Ledger, collect_artifacts
+from madminer_cli.proc_cache import ProcessCache
+from madminer_cli.staging import STAGES, copy_file, stage
+from madminer_cli.upload import BackgroundUploader
 
 if TYPE_CHECKING:
     from madminer import DelphesReader, MadMiner, SampleAugmenter
@@ -43,6 +53,7 @@ class Runner:
         self._miner = None
         self._delphes_reader = None
         self._sample_augmenter = None
+        self.uploader: Optional[BackgroundUploader] = None
 
         self.run_args_map = {
             SetupArgs: self.run_setup,
@@ -50,6 +61,9 @@ class Runner:
             DelphesArgs: self.run_delphes,
             AnalysisArgs: self.run_analysis,
             AugmentationArgs: self.run_augmentation,
+            StageArgs: self.run_stage,
+            LedgerArgs: self.run_ledger,
+            UploadArgs: self.run_with_upload,
         }
 
     def _lazy_import(
@@ -99,6 +113,40 @@ class Runner:
         miner.save(filename=arguments.outfile)
 
     def run_generate(self, arguments: GenArgs) -> None:
+        if arguments.cache_dir is not None:
+            cache = ProcessCache(arguments.cache_dir)
+            entry = cache.get(
+                cache.key(arguments),
+                build=lambda proc_dir: self._prepare_generation(arguments, proc_dir),
+            )
+            cache.clone(entry, Path(arguments.proc_dir))
+            seed = read_seed(arguments.run_card)
+            if seed is not None:
+                set_seed(Path(arguments.proc_dir), seed)
+        else:
+            self._prepare_generation(arguments, Path(arguments.proc_dir))
+
+        if arguments.reweight_card_insert is not None:
+            insert_reweight_card(
+                Path(arguments.proc_dir), arguments.reweight_card_insert
+            )
+
+        # TODO
+        if arguments.now:
+            cmd = os.path.abspath(
+                os.path.join(arguments.proc_dir, "madminer", "run.sh")
+            )
+            proc = Popen(cmd, stdout=PIPE, stderr=PIPE, shell=True)
+            out, err = proc.communicate()
+            exitcode = proc.returncode
+
+            if exitcode != 0:
+                raise RuntimeError(
+                    f"Calling command {cmd} returned exit code {exitcode}.\n\nStd output: {out}\n\nError output: {err}\n\n"
+                )
+            return
+
+    def _prepare_generation(self, arguments: GenArgs, proc_dir: Path) -> None:
         miner = self.miner()
         miner.load(arguments.setup_file)
 
@@ -108,7 +156,7 @@ class Runner:
             proc_card_file=arguments.proc_card,
             param_card_template_file=arguments.param_card,
             run_card_files=[arguments.run_card],
-            mg_process_directory=arguments.proc_dir,
+            mg_process_directory=str(proc_dir),
             pythia8_card_file=arguments.pythia_card,
             configuration_file=arguments.mg_config_file,
             sample_benchmarks=arguments.benchmarks,
@@ -125,22 +173,35 @@ class Runner:
             # python_executable=arguments.python_executable,
         )
 
-        # TODO
-        if arguments.now:
-            cmd = os.path.abspath(
-                os.path.join(arguments.proc_dir, "madminer", "run.sh")
-            )
-            proc = Popen(cmd, stdout=PIPE, stderr=PIPE, shell=True)
-            out, err = proc.communicate()
-            exitcode = proc.returncode
-
-            if exitcode != 0:
-                raise RuntimeError(
-                    f"Calling command {cmd} returned exit code {exitcode}.\n\nStd output: {out}\n\nError output: {err}\n\n"
-                )
+    def run_delphes(self, arguments: DelphesArgs) -> None:
+        if arguments.cache_dir is None:
+            self._run_delphes(arguments)
             return
 
-    def run_delphes(self, arguments: DelphesArgs) -> None:
+        sample = arguments.sample
+
+        def build(root_file: Path) -> None:
+            self._run_delphes(arguments)
+            copy_file(sample.delphes_filename, root_file)
+
+        cache = DelphesCache(arguments.cache_dir)
+        entry = cache.get(cache.key(arguments), build=build)
+        cache.link(entry, sample.delphes_filename)
+
+    def _run_delphes(self, arguments: DelphesArgs) -> None:
+        if arguments.jobs > 1:
+            sample = arguments.sample
+            run_delphes_chunks(
+                delphes_directory=arguments.delphes_dir,
+                delphes_card_filename=arguments.delphes_card,
+                hepmc_sample_filename=sample.hepmc_filename,
+                delphes_sample_filename=sample.delphes_filename,
+                jobs=arguments.jobs,
+                log_dir=arguments.log_file.parent,
+                delphes_executable=arguments.delphes_executable,
+                hadd=arguments.hadd,
+            )
+            return
 
         # TODO: Add delphes_filename here below so that .root files
         # go to /dcache
@@ -206,9 +267,26 @@ class Runner:
                 definition=cut.val_expression, required=cut.is_required
             )
 
-        delphes_reader.analyse_delphes_samples()
+        from madminer_cli.columnar import analysis_engine, write_cutflows
+
+        self.logger.info(f"Analysis of {arguments.expressions.summary()}")
+        with analysis_engine(
+            self.delphes_reader,
+            arguments.engine,
+            arguments.expressions,
+            chunk_size=arguments.chunk_size,
+            threads=arguments.threads,
+            report_throughput=arguments.report_throughput,
+        ) as cutflows:
+            delphes_reader.analyse_delphes_samples()
         delphes_reader.save(arguments.outfile)
 
+        # Only the columnar engine applies the cuts one after the other
+        if cutflows:
+            cutflow_file = Path(arguments.outfile).with_suffix(".cutflow.tsv")
+            write_cutflows(cutflows, cutflow_file)
+            self.logger.info(f"Cut flow written to {cutflow_file}")
+
     def run_augmentation(self, arguments: AugmentationArgs) -> None:
 
         # TODO: Add support for other sampling strategies
@@ -256,6 +334,7 @@ class Runner:
             test_split=test_split,
             partition="test",
         )
+        self.hand_off()
 
         _ = sampler.sample_train_local(
             theta=arguments.theta_test,
@@ -267,6 +346,7 @@ class Runner:
             test_split=test_split,
             partition="test",
         )
+        self.hand_off()
 
         # _ = sampler.sample_test(
         #     theta=arguments.theta_test,
@@ -278,6 +358,73 @@ class Runner:
         #     test_split=test_split,
         # )
 
+    def run_stage(self, arguments: StageArgs) -> None:
+        manifest = STAGES[arguments.stage]
+        patterns = manifest.inputs if arguments.direction == "in" else manifest.outputs
+        stage(
+            patterns,
+            src_dir=arguments.src_dir,
+            dst_dir=arguments.dst_dir,
+            jobs=arguments.jobs,
+            verify=arguments.verify,
+        )
+
+    def run_ledger(self, arguments: LedgerArgs) -> None:
+        ledger = Ledger(arguments.ledger)
+        if arguments.action == "load":
+            assert arguments.db is not None
+            ledger.load(arguments.db)
+            return
+        assert arguments.run is not None
+        if arguments.action == "get":
+            record = ledger.get(arguments.run)
+            if record is None:
+                raise LookupError(f"Run {arguments.run} not in {arguments.ledger}")
+            fields = arguments.fields or Ledger.FIELDS
+            print(" ".join(str(getattr(record, f)) for f in fields))
+            return
+
+        ledger.put(
+            arguments.run,
+            proc_dir=arguments.proc_dir,
+            benchmark=arguments.benchmark,
+            seed=arguments.seed,
+        )
+        if arguments.stage is not None:
+            assert arguments.root is not None
+            patterns = arguments.patterns or (
+                STAGES[arguments.stage].outputs
+                if arguments.stage in STAGES
+                else ("*",)
+            )
+            artifacts = collect_artifacts(arguments.root, patterns)
+            ledger.put_artifacts(
+                arguments.run, arguments.stage, arguments.root, artifacts
+            )
+
+    def hand_off(self) -> None:
+        """Start uploading the outputs the running stage has finished"""
+        if self.uploader is not None:
+            self.uploader.hand_off()
+
+    def run_with_upload(self, arguments: UploadArgs) -> None:
+        run_fun = self.run_args_map[type(arguments.stage_args)]
+        with BackgroundUploader(
+            src_dir=arguments.src_dir,
+            dst_dir=arguments.dst_dir,
+            pattern=arguments.pattern,
+            jobs=arguments.jobs,
+            delete=arguments.delete,
+        ) as uploader:
+            self.uploader = uploader
+            try:
+                run_fun(arguments.stage_args)
+            finally:
+                self.uploader = None
+        self.logger.info(
+            f"Uploaded {uploader.uploaded_bytes / 1e6:.1f} MB to {arguments.dst_dir}"
+        )
+
     def run(self) -> None:
 
         self.logger.debug(f"Parsed parameters: {str(self.arguments)}")
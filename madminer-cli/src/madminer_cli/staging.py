@@ -0,0 +1,177 @@
+"""Copy only the files a stage needs between the shared filesystem and the
+scratch space of a node.
+
+Every stage has a manifest of the inputs it reads from the process directory and
+the outputs it leaves in the scratch space, as `fnmatch` patterns relative to the
+copied directory (`*` also matches `/`). Files are copied in parallel and
+checksummed while copied. The checksums are stored in a `SHA256SUMS` file (in
+`sha256sum` format) at the destination, so the next stage reading them can
+verify its inputs without reading them twice.
+"""
+
+from __future__ import annotations
+
+import fnmatch
+import hashlib
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from madminer_cli import LOGGER
+
+CHECKSUMS_FILENAME = "SHA256SUMS"
+CHUNK_SIZE = 1 << 22
+
+logger = LOGGER.getChild(__name__)
+
+
+class StageManifest(NamedTuple):
+    inputs: Tuple[str, ...]
+    outputs: Tuple[str, ...]
+
+
+STAGES: Dict[str, StageManifest] = {
+    # MadGraph needs the whole process directory, but only the events are
+    # needed downstream (see `madminer_cli.utils.get_delphes_sample`)
+    "generation": StageManifest(inputs=("*",), outputs=("Events/run_01/*",)),
+    # Prepare generation, generation and Delphes in one job: the ROOT files are
+    # shipped with the `delphes` stage, and analysis needs the LHE weights
+    "fused": StageManifest(
+        inputs=(), outputs=("Events/run_01/unweighted_events.lhe.gz",)
+    ),
+    "delphes": StageManifest(
+        inputs=("Events/run_01/tag_1_pythia8_events.hepmc.gz",),
+        outputs=("*.root",),
+    ),
+}
+
+
+def _has_magic(part: str) -> bool:
+    return any(c in part for c in "*?[")
+
+
+def expand(root: Path, pattern: str) -> Iterator[Tuple[str, bool]]:
+    """Paths relative to `root` matching `pattern`, and whether they are
+    directories. Only the subtree below the literal prefix of the pattern is
+    walked, to keep metadata operations on shared filesystems low"""
+    parts = Path(pattern).parts
+    n_literal = next((i for i, p in enumerate(parts) if _has_magic(p)), len(parts))
+    base = Path(*parts[:n_literal]) if n_literal else Path()
+
+    if n_literal == len(parts):
+        if (root / base).is_file() or (root / base).is_symlink():
+            yield str(base), False
+        return
+
+    for dirpath, dirnames, filenames in os.walk(root / base):
+        rel_dir = Path(dirpath).relative_to(root)
+        for name in dirnames:
+            rel = str(rel_dir / name)
+            if fnmatch.fnmatchcase(rel, pattern):
+                # Symlinks to directories are copied as symlinks
+                yield rel, not (Path(dirpath) / name).is_symlink()
+        for name in filenames:
+            rel = str(rel_dir / name)
+            if fnmatch.fnmatchcase(rel, pattern):
+                yield rel, False
+
+
+def read_checksums(root: Path) -> Dict[str, str]:
+    checksums = {}
+    path = root / CHECKSUMS_FILENAME
+    if path.exists():
+        with open(path, "r") as f:
+            for line in f:
+                digest, _, rel = line.rstrip("\n").partition("  ")
+                checksums[rel] = digest
+    return checksums
+
+
+def write_checksums(root: Path, checksums: Dict[str, str]) -> None:
+    # Keep the checksums of files staged by earlier stages
+    merged = {**read_checksums(root), **checksums}
+    tmp = root / f".{CHECKSUMS_FILENAME}.tmp"
+    with open(tmp, "w") as f:
+        f.writelines(f"{d}  {rel}\n" for rel, d in sorted(merged.items()))
+    os.replace(tmp, root / CHECKSUMS_FILENAME)
+
+
+def file_digest(path: Path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def copy_file(src: Path, dst: Path, verify: bool = True) -> Optional[str]:
+    """Copy `src` to `dst` keeping permissions. Returns the sha256 of the
+    contents (None for symlinks, copied as symlinks)"""
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    if src.is_symlink():
+        if dst.is_symlink() or dst.exists():
+            dst.unlink()
+        os.symlink(os.readlink(src), dst)
+        return None
+
+    h = hashlib.sha256()
+    with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+        for chunk in iter(lambda: fsrc.read(CHUNK_SIZE), b""):
+            h.update(chunk)
+            fdst.write(chunk)
+    shutil.copymode(src, dst)
+
+    digest = h.hexdigest()
+    if verify and file_digest(dst) != digest:
+        raise IOError(f"Checksum mismatch after copying {src} to {dst}")
+    return digest
+
+
+def stage(
+    patterns: Tuple[str, ...],
+    src_dir: Path,
+    dst_dir: Path,
+    jobs: int = 4,
+    verify: bool = True,
+) -> Dict[str, str]:
+    """Copy the files under `src_dir` matching `patterns` to `dst_dir`. Returns
+    relative path -> sha256 of the copied files"""
+    files: List[str] = []
+    for pattern in patterns:
+        matches = list(expand(src_dir, pattern))
+        if not matches:
+            raise FileNotFoundError(f"Nothing matches {pattern} in {src_dir}")
+        for rel, is_dir in matches:
+            if is_dir:
+                (dst_dir / rel).mkdir(parents=True, exist_ok=True)
+            elif rel != CHECKSUMS_FILENAME:
+                files.append(rel)
+    # Several patterns may match the same file
+    files = list(dict.fromkeys(files))
+
+    known = read_checksums(src_dir)
+    dst_dir.mkdir(parents=True, exist_ok=True)
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        digests = list(
+            executor.map(
+                lambda rel: copy_file(src_dir / rel, dst_dir / rel, verify), files
+            )
+        )
+
+    checksums = {}
+    for rel, digest in zip(files, digests):
+        if digest is None:
+            continue
+        if verify and rel in known and known[rel] != digest:
+            raise IOError(f"Checksum mismatch for {src_dir / rel}: corrupted input")
+        checksums[rel] = digest
+
+    write_checksums(dst_dir, checksums)
+    size = sum((dst_dir / rel).stat().st_size for rel in checksums)
+    logger.info(
+        f"Staged {len(files)} files ({size / 1e6:.1f} MB) "
+        f"from {src_dir} to {dst_dir}"
+    )
+    return checksums
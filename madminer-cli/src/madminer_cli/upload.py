@@ -0,0 +1,130 @@
+"""Upload the outputs of a stage to the shared filesystem while it still runs.
+
+Files are only uploaded once the stage says they are complete, by handing them
+off between outputs (`BackgroundUploader.hand_off`), and everything left is
+uploaded when the stage ends. Whether a file is still being written cannot be
+told from the outside: child processes (e.g. the workers of `--nproc`) write
+files this process has no descriptor of, and writers may pause for a while.
+Uploads go to a hidden temporary file in the destination, renamed into place
+once complete, so readers never see partial files. Files modified after their
+upload are uploaded again.
+"""
+
+from __future__ import annotations
+
+import fnmatch
+import os
+import shutil
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+from madminer_cli import LOGGER
+
+Stamp = Tuple[int, int]
+
+
+class BackgroundUploader:
+    def __init__(
+        self,
+        src_dir: Path,
+        dst_dir: Path,
+        pattern: str = "*",
+        jobs: int = 2,
+        delete: bool = False,
+    ) -> None:
+        self.logger = LOGGER.getChild(f"{__name__}.{self.__class__.__name__}")
+        self.src_dir = Path(src_dir)
+        self.dst_dir = Path(dst_dir)
+        self.pattern = pattern
+        self.delete = delete
+
+        self._executor = ThreadPoolExecutor(max_workers=jobs)
+        self._uploaded: Dict[str, Stamp] = {}
+        self._futures: Dict[str, Future] = {}
+
+    @property
+    def uploaded_bytes(self) -> int:
+        return sum(size for size, _ in self._uploaded.values())
+
+    def __enter__(self) -> BackgroundUploader:
+        self.dst_dir.mkdir(parents=True, exist_ok=True)
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        try:
+            # Outputs of a failed stage are not published
+            if exc_type is None:
+                # Let uploads in flight land first, so the final scan uploads again
+                # whatever changed since they started (or failed meanwhile)
+                wait(list(self._futures.values()))
+                self._futures.clear()
+                self._scan()
+                self._wait()
+        finally:
+            self._executor.shutdown(wait=True)
+
+    def hand_off(self) -> None:
+        """Upload in the background the files the stage finished so far: every
+        file changed since its last upload. The stage must not write any of
+        them anymore (or only to replace it, which uploads it again at the end)"""
+        self._raise_errors()
+        self._scan()
+
+    def _candidates(self) -> List[Path]:
+        files = []
+        for dirpath, _, filenames in os.walk(self.src_dir):
+            for name in filenames:
+                path = Path(dirpath) / name
+                rel = str(path.relative_to(self.src_dir))
+                if fnmatch.fnmatchcase(rel, self.pattern):
+                    files.append(path)
+        return files
+
+    def _scan(self) -> None:
+        for path in self._candidates():
+            rel = str(path.relative_to(self.src_dir))
+            try:
+                st = path.stat()
+            except FileNotFoundError:
+                continue
+            stamp = (st.st_size, st.st_mtime_ns)
+            if self._uploaded.get(rel) == stamp:
+                continue
+            future = self._futures.get(rel)
+            if future is not None and not future.done():
+                continue
+            self._futures[rel] = self._executor.submit(self._upload, rel, stamp)
+
+    def _upload(self, rel: str, stamp: Stamp) -> None:
+        src = self.src_dir / rel
+        dst = self.dst_dir / rel
+        dst.parent.mkdir(parents=True, exist_ok=True)
+        tmp = dst.parent / f".{dst.name}.part-{os.getpid()}"
+        start = time.perf_counter()
+        shutil.copyfile(src, tmp)
+        shutil.copymode(src, tmp)
+        os.replace(tmp, dst)
+
+        self._uploaded[rel] = stamp
+        elapsed = time.perf_counter() - start
+        self.logger.info(
+            f"Uploaded {src} to {dst} ({stamp[0] / 1e6:.1f} MB in {elapsed:.1f} s)"
+        )
+        # Only free the scratch space if the file did not change meanwhile
+        if self.delete:
+            st = src.stat()
+            if (st.st_size, st.st_mtime_ns) == stamp:
+                src.unlink()
+
+    def _raise_errors(self) -> None:
+        for rel, future in list(self._futures.items()):
+            if future.done():
+                del self._futures[rel]
+                future.result()
+
+    def _wait(self) -> None:
+        for future in list(self._futures.values()):
+            future.result()
+        self._futures.clear()
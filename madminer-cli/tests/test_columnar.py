@@ -0,0 +1,198 @@
+"""The columnar engine against MadMiner's event by event analysis, on a small
+Delphes ROOT file written by the test"""
+
+import pytest
+
+np = pytest.importorskip("numpy")
+ak = pytest.importorskip("awkward")
+uproot = pytest.importorskip("uproot")
+pytest.importorskip("vector")
+delphes_root = pytest.importorskip("madminer.utils.interfaces.delphes_root")
+
+from madminer.models import Cut, Observable  # noqa: E402
+
+from madminer_cli import columnar  # noqa: E402
+from madminer_cli.expressions import ExpressionGraph  # noqa: E402
+
+N_EVENTS = 300
+
+EXPRESSIONS = [
+    "j[0].pt",
+    "j[1].E",
+    "j[-1].m",
+    "j[0].rapidity",
+    "j[0].eta - j[1].eta",
+    "(j[0].E + j[1].E) ** 2 - (j[0].px + j[1].px) ** 2 - (j[0].py + j[1].py) ** 2",
+    "l[0].E",
+    "l[1].px",
+    "e[0].mass",
+    "mu[0].Et",
+    "a[0].pt",
+    "met.pt",
+    "met.phi",
+    "len(j)",
+    "len(e) / len(mu)",
+    "sqrt(l[0].E + l[1].E)",
+    "atan2(j[0].py, j[0].px)",
+    "abs(j[0].eta)",
+    "max(j[0].eta, j[1].eta)",
+    "j[0].pt / 0",
+    "j[0].pt if len(j) > 3 else -1",
+    "10 < j[0].pt < 50",
+    "j[0].pt > 40 and j[1].pt",
+]
+
+ACCEPTANCE = {
+    "acceptance_pt_min_e": 10.0,
+    "acceptance_eta_max_e": 2.47,
+    "acceptance_pt_min_mu": 10.0,
+    "acceptance_eta_max_mu": 2.7,
+    "acceptance_pt_min_j": 20.0,
+    "acceptance_pt_min_a": 7.0,
+}
+
+
+def _collection(rng, mean, **extra):
+    counts = rng.poisson(mean, N_EVENTS)
+    total = counts.sum()
+    fields = {
+        "PT": (rng.exponential(40, total) + 5).astype(np.float32),
+        "Eta": rng.normal(0, 1.8, total).astype(np.float32),
+        "Phi": rng.uniform(-np.pi, np.pi, total).astype(np.float32),
+    }
+    fields.update({name: make(total) for name, make in extra.items()})
+    # Delphes sorts the objects of every event by pt
+    starts = np.cumsum(counts) - counts
+    order = np.concatenate(
+        [
+            s + np.argsort(-fields["PT"][s : s + c], kind="stable")
+            for s, c in zip(starts, counts)
+        ]
+    )
+    return ak.zip({k: ak.unflatten(v[order], counts) for k, v in fields.items()})
+
+
+@pytest.fixture(scope="module")
+def delphes_file(tmp_path_factory):
+    rng = np.random.default_rng(1)
+
+    def charge(n):
+        return rng.choice(np.array([-1, 1], dtype=np.int32), n)
+
+    ones = np.ones(N_EVENTS, dtype=int)
+    data = {
+        "Jet": _collection(
+            rng,
+            4,
+            Mass=lambda n: rng.exponential(8, n).astype(np.float32),
+            BTag=lambda n: rng.integers(0, 2, n).astype(np.uint32),
+            TauTag=lambda n: np.zeros(n, np.uint32),
+        ),
+        "Electron": _collection(rng, 1.5, Charge=charge),
+        "Muon": _collection(rng, 1.5, Charge=charge),
+        "Photon": _collection(
+            rng, 0.5, E=lambda n: (rng.exponential(40, n) + 5).astype(np.float32)
+        ),
+        "MissingET": ak.zip(
+            {
+                "MET": ak.unflatten(
+                    np.abs(rng.normal(30, 10, N_EVENTS)).astype(np.float32), ones
+                ),
+                "Phi": ak.unflatten(
+                    rng.uniform(-3, 3, N_EVENTS).astype(np.float32), ones
+                ),
+                "Eta": ak.unflatten(np.zeros(N_EVENTS, np.float32), ones),
+            }
+        ),
+    }
+    path = tmp_path_factory.mktemp("delphes") / "delphes.root"
+    with uproot.recreate(path) as f:
+        f.mktree(
+            "Delphes",
+            {
+                **{name: array.type.content for name, array in data.items()},
+                "Event": np.int32,
+            },
+            counter_name=lambda collection: f"{collection}_size",
+            field_name=lambda outer, inner: f"{outer}.{inner}",
+        )
+        f["Delphes"].extend({**data, "Event": np.arange(N_EVENTS, dtype=np.int32)})
+    return str(path)
+
+
+def _analyse_with_both(path, observables, cuts, **options):
+    reference = delphes_root.parse_delphes_root_file(
+        path, observables, cuts, **ACCEPTANCE
+    )
+    graph = ExpressionGraph(
+        {name: obs.val_expression for name, obs in observables.items()},
+        [cut.val_expression for cut in cuts],
+    )
+    cutflows = []
+    result = columnar.parse_delphes_root_file(
+        path,
+        observables,
+        cuts,
+        {
+            name: (
+                ACCEPTANCE.get(f"acceptance_pt_min_{name}"),
+                ACCEPTANCE.get(f"acceptance_eta_max_{name}"),
+            )
+            for name in ("e", "mu", "j", "a")
+        },
+        graph,
+        cutflows,
+        **options,
+    )
+    return result, reference, cutflows
+
+
+def _assert_same(result, reference):
+    observations, _, combined_filter = result
+    ref_observations, _, ref_filter = reference
+    assert combined_filter.tobytes() == np.asarray(ref_filter).tobytes()
+    assert list(observations) == list(ref_observations)
+    for name, values in ref_observations.items():
+        assert (
+            observations[name].tobytes()
+            == np.asarray(values, dtype=np.float64).tobytes()
+        ), name
+
+
+@pytest.fixture(scope="module")
+def observables():
+    observables = {
+        f"o{i}": Observable(f"o{i}", expression, None, False)
+        for i, expression in enumerate(EXPRESSIONS)
+    }
+    observables["default"] = Observable("default", "j[9].pt", -10.5, False)
+    observables["required"] = Observable("required", "l[0].pt", None, True)
+    return observables
+
+
+@pytest.mark.filterwarnings("ignore::RuntimeWarning")
+def test_observables_match_madminer(delphes_file, observables):
+    result, reference, _ = _analyse_with_both(delphes_file, observables, [])
+    _assert_same(result, reference)
+
+
+@pytest.mark.filterwarnings("ignore::RuntimeWarning")
+@pytest.mark.parametrize("chunk_size", [64, 100_000])
+def test_cuts_match_madminer(delphes_file, observables, chunk_size):
+    cuts = [
+        Cut("c0", "o0 > 35.0", False),
+        Cut("c1", "len(l) >= 1", False),
+        Cut("c2", "j[5].pt > 1", True),
+    ]
+    result, reference, cutflows = _analyse_with_both(
+        delphes_file, observables, cuts, chunk_size=chunk_size
+    )
+    _assert_same(result, reference)
+    assert 0 < result[2].sum() < N_EVENTS
+
+    # Events passing every step, the last one the events kept
+    (cutflow,) = cutflows
+    passing = [n_pass for _, n_pass, _ in cutflow.rows]
+    assert passing[0] == N_EVENTS
+    assert passing == sorted(passing, reverse=True)
+    assert passing[-1] == result[2].sum()
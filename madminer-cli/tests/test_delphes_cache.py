@@ -0,0 +1,122 @@
+import dataclasses
+import os
+
+import pytest
+
+from madminer_cli.delphes_cache import DelphesCache
+from madminer_cli.parse_cls import DelphesArgs
+from madminer_cli.runner import Runner
+from madminer_cli.schemas import DelphesSample
+from madminer_cli.staging import stage
+
+
+def write(path, contents):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(contents)
+    return path
+
+
+def delphes_args(tmp_path, run):
+    """Arguments of the Delphes job of `run`, whose events are already staged in
+    its process directory"""
+    proc_dir = tmp_path / "runs" / str(run)
+    events = proc_dir / "Events" / "run_01"
+    return DelphesArgs(
+        delphes_card=tmp_path / "delphes_card.tcl",
+        delphes_dir=tmp_path / "Delphes",
+        sample=DelphesSample(
+            hepmc_filename=events / "tag_1_pythia8_events.hepmc.gz",
+            lhe_filename=events / "unweighted_events.lhe.gz",
+            delphes_filename=proc_dir / "delphes.root",
+        ),
+        log_file=tmp_path / "logs" / str(run) / "delphes.log",
+        proc_dir=proc_dir,
+        cache_dir=tmp_path / "store",
+    )
+
+
+@pytest.fixture
+def arguments(tmp_path):
+    write(tmp_path / "delphes_card.tcl", b"set ExecutionPath {}\n")
+    write(tmp_path / "Delphes" / "VERSION", b"3.5.0\n")
+    return [delphes_args(tmp_path, run) for run in (1, 2)]
+
+
+def test_key(arguments, tmp_path):
+    run1, run2 = arguments
+    for args in arguments:
+        write(args.sample.hepmc_filename, b"events")
+    # The same events simulated with the same card and version
+    assert DelphesCache.key(run1) == DelphesCache.key(run2)
+
+    write(run2.sample.hepmc_filename, b"other events")
+    assert DelphesCache.key(run1) != DelphesCache.key(run2)
+    key = DelphesCache.key(run1)
+    write(tmp_path / "delphes_card.tcl", b"set ExecutionPath {Calorimeter}\n")
+    assert DelphesCache.key(run1) != key
+    key = DelphesCache.key(run1)
+    write(tmp_path / "Delphes" / "VERSION", b"3.5.1\n")
+    assert DelphesCache.key(run1) != key
+
+
+def test_key_uses_staged_checksums(arguments, tmp_path):
+    run1, _ = arguments
+    generated = tmp_path / "generated" / "1"
+    write(generated / "Events" / "run_01" / "tag_1_pythia8_events.hepmc.gz", b"events")
+    stage(("Events/*",), generated, run1.proc_dir)
+    key = DelphesCache.key(run1)
+    # The checksum written when staging is trusted over the file
+    write(run1.sample.hepmc_filename, b"not read")
+    assert DelphesCache.key(run1) == key
+    assert DelphesCache.key(dataclasses.replace(run1, proc_dir=None)) != key
+
+
+def test_entries_are_built_once(tmp_path):
+    cache = DelphesCache(tmp_path / "store")
+    builds = []
+
+    def build(root_file):
+        builds.append(root_file)
+        root_file.write_bytes(b"root")
+
+    entry = cache.get("key", build)
+    assert entry == tmp_path / "store" / "key.root"
+    assert entry.read_bytes() == b"root"
+    assert cache.get("key", build) == entry
+    assert len(builds) == 1
+
+
+def test_failed_builds_leave_no_entry(tmp_path):
+    cache = DelphesCache(tmp_path / "store")
+
+    def build(root_file):
+        root_file.write_bytes(b"partial")
+        raise RuntimeError("Delphes failed")
+
+    with pytest.raises(RuntimeError, match="Delphes failed"):
+        cache.get("key", build)
+    assert sorted(p.name for p in cache.cache_dir.iterdir()) == ["key.lock"]
+
+
+def test_runs_with_the_same_events_are_simulated_once(
+    arguments, tmp_path, monkeypatch
+):
+    simulated = []
+
+    def run_delphes(self, arguments):
+        simulated.append(arguments.sample.delphes_filename)
+        write(arguments.sample.delphes_filename, b"root")
+
+    monkeypatch.setattr(Runner, "_run_delphes", run_delphes)
+    for args in arguments:
+        write(args.sample.hepmc_filename, b"events")
+        # Left over by an earlier attempt
+        write(args.sample.delphes_filename, b"stale")
+        Runner(args).run_delphes(args)
+
+    assert simulated == [arguments[0].sample.delphes_filename]
+    (entry,) = (tmp_path / "store").glob("*.root")
+    for args in arguments:
+        delphes_filename = args.sample.delphes_filename
+        assert os.readlink(delphes_filename) == str(entry)
+        assert delphes_filename.read_bytes() == b"root"
@@ -0,0 +1,143 @@
+import gzip
+import mmap
+import sys
+
+import pytest
+
+from madminer_cli.delphes_chunks import event_ranges, run_delphes_chunks
+
+HEADER = b"\nHepMC::Version 2.06.09\nHepMC::IO_GenEvent-START_EVENT_LISTING\n"
+FOOTER = b"HepMC::IO_GenEvent-END_EVENT_LISTING\n\n"
+
+
+def event(number, n_particles=3):
+    lines = [f"E {number} -1 -1.0 0.118 0 0 {n_particles}", "U GEV MM", "V -1 0 0 0"]
+    # Particles of the vertex, with a momentum starting like an event line
+    lines += [f"P {i} 21 0 0 E {i}.0 0 1 0 0 0" for i in range(n_particles)]
+    return ("\n".join(lines) + "\n").encode()
+
+
+EVENTS = [event(i, n_particles=1 + i % 4) for i in range(10)]
+HEPMC = HEADER + b"".join(EVENTS) + FOOTER
+
+
+def ranges(contents, n_chunks, tmp_path):
+    path = tmp_path / "events.hepmc"
+    path.write_bytes(contents)
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+        return event_ranges(m, n_chunks)
+
+
+def split(contents, n_chunks, tmp_path):
+    header, chunks, footer = ranges(contents, n_chunks, tmp_path)
+    return (
+        contents[slice(*header)],
+        [contents[slice(*c)] for c in chunks],
+        contents[slice(*footer)],
+    )
+
+
+@pytest.mark.parametrize("n_chunks", [1, 2, 3, 4, 10])
+def test_chunks_are_whole_events(n_chunks, tmp_path):
+    header, chunks, footer = split(HEPMC, n_chunks, tmp_path)
+    assert header == HEADER
+    assert footer == FOOTER
+    # Up to `n_chunks`: chunks end at the first event after their share
+    assert 1 <= len(chunks) <= n_chunks
+    assert header + b"".join(chunks) + footer == HEPMC
+    for chunk in chunks:
+        assert chunk.startswith(b"E ")
+        assert chunk.endswith(b"\n")
+    assert b"".join(chunks).count(b"\nE ") + 1 == len(EVENTS)
+
+
+def test_chunks_are_about_the_same_size(tmp_path):
+    events = [event(i, n_particles=3) for i in range(100)]
+    _, chunks, _ = split(HEADER + b"".join(events) + FOOTER, 4, tmp_path)
+    n_events = [chunk.count(b"\nE ") + 1 for chunk in chunks]
+    assert sum(n_events) == 100
+    assert max(n_events) - min(n_events) <= 2
+
+
+def test_more_chunks_than_events(tmp_path):
+    header, chunks, footer = split(HEADER + EVENTS[0] + EVENTS[1] + FOOTER, 5, tmp_path)
+    assert chunks == [EVENTS[0], EVENTS[1]]
+    assert footer == FOOTER
+
+
+def test_files_without_header_or_footer(tmp_path):
+    events = [event(i) for i in range(4)]
+    header, chunks, footer = split(b"".join(events), 2, tmp_path)
+    assert header == b""
+    assert chunks == [events[0] + events[1], events[2] + events[3]]
+    # Truncated files are simulated up to the end
+    assert footer == b""
+
+
+def test_files_without_events(tmp_path):
+    with pytest.raises(ValueError, match="No events"):
+        ranges(HEADER + FOOTER, 2, tmp_path)
+
+
+@pytest.fixture
+def delphes_dir(tmp_path):
+    """Delphes writing the events it reads to its output, and hadd appending its
+    inputs"""
+    delphes_dir = tmp_path / "Delphes"
+    delphes_dir.mkdir()
+    script = {
+        "DelphesHepMC2": "open(sys.argv[2], 'wb').write(sys.stdin.buffer.read())",
+        "DelphesFailing": "sys.stdin.buffer.read(); sys.exit('Segmentation fault')",
+        "hadd": "out = open(sys.argv[2], 'wb')\n"
+        "for name in sys.argv[3:]:\n    out.write(open(name, 'rb').read())",
+    }
+    for name, code in script.items():
+        path = delphes_dir / name
+        path.write_text(f"#!{sys.executable}\nimport sys\n{code}\n")
+        path.chmod(0o755)
+    return delphes_dir
+
+
+@pytest.mark.parametrize("jobs", [1, 3])
+def test_run_delphes_chunks(jobs, delphes_dir, tmp_path):
+    hepmc = tmp_path / "run_01" / "tag_1_pythia8_events.hepmc.gz"
+    hepmc.parent.mkdir()
+    with gzip.open(hepmc, "wb") as f:
+        f.write(HEPMC)
+    output = tmp_path / "run_01" / "delphes.root"
+    run_delphes_chunks(
+        delphes_directory=delphes_dir,
+        delphes_card_filename=tmp_path / "delphes_card.tcl",
+        hepmc_sample_filename=hepmc,
+        delphes_sample_filename=output,
+        jobs=jobs,
+        log_dir=tmp_path,
+        hadd=str(delphes_dir / "hadd"),
+    )
+    # Every Delphes process read the header, its chunk and the footer, and the
+    # outputs are merged in the order of the events
+    _, chunks, _ = split(HEPMC, jobs, tmp_path)
+    assert output.read_bytes() == b"".join(HEADER + c + FOOTER for c in chunks)
+    # Neither the unzipped file nor the outputs of the chunks are left behind
+    assert sorted(p.name for p in hepmc.parent.iterdir()) == [
+        "delphes.root",
+        "tag_1_pythia8_events.hepmc.gz",
+    ]
+
+
+def test_failed_chunks_are_errors(delphes_dir, tmp_path):
+    hepmc = tmp_path / "events.hepmc"
+    hepmc.write_bytes(HEPMC)
+    with pytest.raises(RuntimeError, match=r"Delphes failed for chunks 0 \(exit"):
+        run_delphes_chunks(
+            delphes_directory=delphes_dir,
+            delphes_card_filename=tmp_path / "delphes_card.tcl",
+            hepmc_sample_filename=hepmc,
+            delphes_sample_filename=tmp_path / "out" / "delphes.root",
+            jobs=2,
+            log_dir=tmp_path,
+            delphes_executable="DelphesFailing",
+        )
+    assert "Segmentation fault" in (tmp_path / "Delphes.1.log").read_text()
+    # Unzipped files are inputs, kept
+    assert hepmc.read_bytes() == HEPMC
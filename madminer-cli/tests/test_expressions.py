@@ -0,0 +1,61 @@
+import ast
+
+import pytest
+
+from madminer_cli.expressions import ExpressionGraph
+
+
+@pytest.mark.parametrize(
+    "expression",
+    [
+        "j[0].pt +",  # syntax error
+        "(yield j)",  # only raised by the compiler
+        "jet[0].pt",  # unknown name
+        "j[0].pt > pt_j2",  # observables are only names of cuts
+        42,  # not a string
+    ],
+)
+def test_invalid_observables_are_rejected(expression):
+    with pytest.raises(ValueError, match="Invalid observable o"):
+        ExpressionGraph({"o": expression})
+
+
+def test_cuts_use_observables():
+    graph = ExpressionGraph({"pt_j1": "j[0].pt"}, ["pt_j1 > 30"])
+    assert graph.tree("pt_j1 > 30") is not None
+    with pytest.raises(ValueError, match="unknown name pt_j2"):
+        ExpressionGraph({"pt_j1": "j[0].pt"}, ["pt_j2 > 30"])
+
+
+def test_names_bound_by_the_expression_are_known():
+    ExpressionGraph({"ht": "sum(x.pt for x in j)", "f": "(lambda y: y)(met.pt)"})
+
+
+def test_shared_sub_expressions_are_interned_once():
+    graph = ExpressionGraph(
+        {"e_l1": "l[0].E", "px_l1": "l[0].px", "e_ll": "l[0].E + l[1].E"},
+        ["l[0].E > 10", "l[0].E > 10"],
+    )
+    assert graph.n_expressions == 5
+    assert len(graph.trees) == 4
+    assert len(graph.code) == 4
+
+    e_l1 = graph.tree("l[0].E").body
+    assert graph.tree("l[0].E + l[1].E").body.left is e_l1
+    assert graph.tree("l[0].E > 10").body.left is e_l1
+    assert graph.tree("l[0].px").body.value is e_l1.value
+
+    dumps = [ast.dump(node) for node in graph.nodes.values()]
+    assert len(set(dumps)) == len(dumps)
+    assert dumps.count(ast.dump(e_l1.value)) == 1
+
+
+def test_eval_runs_the_compiled_code():
+    graph = ExpressionGraph({"o": "  sqrt(pi) + 1"})
+    assert graph.eval("  sqrt(pi) + 1", {"sqrt": abs, "pi": -4}) == 5
+    graph.code["  sqrt(pi) + 1"] = compile("0", "<stub>", "eval")
+    assert graph.eval("  sqrt(pi) + 1", {}) == 0
+    # Other expressions are evaluated as the builtin does, in the caller's scope
+    x = 9  # noqa: F841, read by eval from this frame
+    assert graph.eval("x + 1") == 10
+    assert graph.eval("x + 1", {"x": 1}) == 2
@@ -0,0 +1,128 @@
+import hashlib
+import os
+import sqlite3
+
+import pytest
+
+from madminer_cli.ledger import Artifact, Ledger, RunRecord, collect_artifacts
+from madminer_cli.staging import stage
+
+
+def write(path, contents):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(contents)
+    return path
+
+
+def sha256(contents):
+    return hashlib.sha256(contents).hexdigest()
+
+
+def test_put_and_get(tmp_path):
+    ledger = Ledger(tmp_path / "ledger")
+    assert ledger.get(1) is None
+    assert ledger.runs() == []
+
+    ledger.put(1, proc_dir="/tmp/runs/1", benchmark="sm", seed=10001)
+    ledger.put(2, benchmark="bsm")
+    assert ledger.get(1) == RunRecord(1, "/tmp/runs/1", "sm", 10001)
+    # Fields left to None keep their value
+    ledger.put(2, seed=10002)
+    assert ledger.get(2) == RunRecord(2, None, "bsm", 10002)
+    assert ledger.runs() == [1, 2]
+    # No temporary files are left behind
+    assert [p.name for p in (tmp_path / "ledger" / "1").iterdir()] == ["run.json"]
+
+
+def test_put_without_fields_leaves_the_run(tmp_path):
+    ledger = Ledger(tmp_path / "ledger")
+    ledger.put(1, benchmark="sm")
+    run_file = tmp_path / "ledger" / "1" / "run.json"
+    before = run_file.stat().st_mtime_ns, run_file.read_text()
+    ledger.put(1)
+    assert (run_file.stat().st_mtime_ns, run_file.read_text()) == before
+    # Unless the run was never recorded
+    ledger.put(2)
+    assert ledger.get(2) == RunRecord(2, None, None, None)
+
+
+def test_artifacts_per_root(tmp_path):
+    """Experiments sharing a run record their analyses separately"""
+    ledger = Ledger(tmp_path / "ledger")
+    h5_0, h5_1 = tmp_path / "exp0" / "h5", tmp_path / "exp1" / "h5"
+    ledger.put_artifacts(1, "analysis", h5_0, {f"{h5_0}/1.h5": (10, "a")})
+    ledger.put_artifacts(1, "analysis", h5_1, {f"{h5_1}/1.h5": (20, "b")})
+    ledger.put_artifacts(1, "delphes", tmp_path, {f"{tmp_path}/1.root": (30, None)})
+    assert ledger.artifacts(1, "analysis") == [
+        Artifact(1, "analysis", str(h5_0), f"{h5_0}/1.h5", 10, "a"),
+        Artifact(1, "analysis", str(h5_1), f"{h5_1}/1.h5", 20, "b"),
+    ]
+    assert len(ledger.artifacts(1)) == 3
+    assert ledger.artifacts(2) == []
+
+    # Recording again replaces the artifacts of the stage in that root only
+    ledger.put_artifacts(1, "analysis", h5_0, {f"{h5_0}/1.h5": (11, "c")})
+    assert [(a.path, a.size) for a in ledger.artifacts(1, "analysis")] == [
+        (f"{h5_0}/1.h5", 11),
+        (f"{h5_1}/1.h5", 20),
+    ]
+    # Runs only known from their artifacts are still runs
+    assert ledger.runs() == [1]
+    assert ledger.get(1) is None
+
+
+def test_load(tmp_path):
+    ledger = Ledger(tmp_path / "ledger")
+    ledger.put(1, proc_dir="/tmp/runs/1", benchmark="sm", seed=10001)
+    ledger.put(2, proc_dir="/tmp/runs/2", benchmark="bsm", seed=10002)
+    ledger.put_artifacts(
+        1, "generation", tmp_path, {"/a.lhe.gz": (1, "x"), "/b.hepmc.gz": (2, "y")}
+    )
+    db = tmp_path / "ledger.sqlite"
+    assert ledger.load(db) == (2, 2)
+
+    conn = sqlite3.connect(str(db))
+    try:
+        assert conn.execute(
+            "SELECT run, proc_dir, benchmark, seed FROM runs ORDER BY run"
+        ).fetchall() == [
+            (1, "/tmp/runs/1", "sm", 10001),
+            (2, "/tmp/runs/2", "bsm", 10002),
+        ]
+        assert conn.execute(
+            "SELECT run, stage, root, path, size, sha256 FROM artifacts ORDER BY path"
+        ).fetchall() == [
+            (1, "generation", str(tmp_path), "/a.lhe.gz", 1, "x"),
+            (1, "generation", str(tmp_path), "/b.hepmc.gz", 2, "y"),
+        ]
+    finally:
+        conn.close()
+
+    # Loading again replaces the file
+    ledger.put(3, benchmark="sm")
+    assert ledger.load(db) == (3, 2)
+
+
+def test_collect_artifacts(tmp_path):
+    scratch, shared = tmp_path / "scratch", tmp_path / "shared"
+    write(scratch / "Events" / "run_01" / "events.lhe.gz", b"lhe")
+    write(scratch / "Events" / "run_01" / "events.hepmc.gz", b"hepmc")
+    stage(("Events/*",), scratch, shared)
+
+    # Checksums written when staging are reused instead of reading the files
+    lhe = shared / "Events" / "run_01" / "events.lhe.gz"
+    lhe.write_bytes(b"not read again")
+    write(shared / "delphes.log", b"log")
+    store_file = write(tmp_path / "store" / "abc.root", b"root")
+    os.symlink(store_file, shared / "delphes.root")
+    artifacts = collect_artifacts(shared, ["Events/*", "*.log", "*.root"])
+    assert artifacts == {
+        str(lhe): (len(b"not read again"), sha256(b"lhe")),
+        str(shared / "Events/run_01/events.hepmc.gz"): (5, sha256(b"hepmc")),
+        str(shared / "delphes.log"): (3, sha256(b"log")),
+        # Symlinks to the Delphes store are recorded without checksum
+        str(shared / "delphes.root"): (4, None),
+    }
+
+    with pytest.raises(FileNotFoundError, match=r"Nothing matches \*\.h5"):
+        collect_artifacts(shared, ["*.h5"])
@@ -0,0 +1,142 @@
+import dataclasses
+import multiprocessing
+import time
+
+import pytest
+
+from madminer_cli.cards import insert_reweight_card, read_seed, set_seed
+from madminer_cli.parse_cls import GenArgs
+from madminer_cli.proc_cache import ProcessCache
+
+RUN_CARD = """\
+  10000 = nevents ! Number of unweighted events requested
+  {seed} = iseed   ! rnd seed (0=assigned automatically=default))
+  13000.0 = ebeam1 ! beam 1 total energy in GeV
+"""
+
+
+def write(path, contents):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(contents)
+    return path
+
+
+@pytest.fixture
+def arguments(tmp_path):
+    cards = tmp_path / "cards"
+    mg_dir = tmp_path / "MG5_aMC"
+    write(mg_dir / "VERSION", "version = 3.5.0\n")
+    return GenArgs(
+        setup_file=write(tmp_path / "setup.h5", "setup"),
+        log_file=tmp_path / "log.txt",
+        mg_dir=mg_dir,
+        proc_card=write(cards / "proc_card.dat", "generate p p > h\n"),
+        param_card=write(cards / "param_card.dat", "BLOCK MASS\n"),
+        run_card=write(cards / "run_card_1.dat", RUN_CARD.format(seed=1)),
+        pythia_card=None,
+        benchmarks=["sm", "bsm"],
+        mg_config_file=write(cards / "mg5_configuration.txt", "nb_core = 1\n"),
+        proc_dir=str(tmp_path / "runs" / "1"),
+        is_background=False,
+        now=False,
+        cache_dir=tmp_path / "cache",
+    )
+
+
+def test_key_ignores_the_seed(arguments, tmp_path):
+    run_card = write(tmp_path / "cards" / "run_card_2.dat", RUN_CARD.format(seed=2))
+    other_seed = dataclasses.replace(arguments, run_card=run_card)
+    assert ProcessCache.key(other_seed) == ProcessCache.key(arguments)
+    # Nor the order of the benchmarks
+    other_order = dataclasses.replace(arguments, benchmarks=["bsm", "sm"])
+    assert ProcessCache.key(other_order) == ProcessCache.key(arguments)
+
+
+def test_key_depends_on_the_inputs(arguments, tmp_path):
+    key = ProcessCache.key(arguments)
+    assert ProcessCache.key(dataclasses.replace(arguments, benchmarks=["sm"])) != key
+    assert ProcessCache.key(dataclasses.replace(arguments, is_background=True)) != key
+    pythia_card = write(tmp_path / "cards" / "pythia8_card.dat", "Tune:pp = 14\n")
+    assert (
+        ProcessCache.key(dataclasses.replace(arguments, pythia_card=pythia_card)) != key
+    )
+
+    arguments.run_card.write_text(RUN_CARD.replace("10000", "5000").format(seed=1))
+    assert ProcessCache.key(arguments) != key
+    key = ProcessCache.key(arguments)
+    write(arguments.mg_dir / "VERSION", "version = 3.5.1\n")
+    assert ProcessCache.key(arguments) != key
+
+
+def test_entries_are_built_once(tmp_path):
+    cache = ProcessCache(tmp_path / "cache")
+    builds = []
+
+    def build(proc_dir):
+        builds.append(proc_dir)
+        write(proc_dir / "madminer" / "run.sh", "#!/bin/sh\n")
+
+    entry = cache.get("key", build)
+    assert entry == tmp_path / "cache" / "key"
+    assert (entry / "madminer" / "run.sh").is_file()
+    assert cache.get("key", build) == entry
+    assert len(builds) == 1
+
+
+def test_failed_builds_leave_no_entry(tmp_path):
+    cache = ProcessCache(tmp_path / "cache")
+
+    def build(proc_dir):
+        write(proc_dir / "partial", "")
+        raise RuntimeError("MadGraph failed")
+
+    with pytest.raises(RuntimeError, match="MadGraph failed"):
+        cache.get("key", build)
+    assert sorted(p.name for p in cache.cache_dir.iterdir()) == ["key.lock"]
+
+
+def _build_slowly(proc_dir):
+    # Every build leaves a trace next to the cache, surviving the job
+    with open(proc_dir.parent.parent / "builds.txt", "a") as f:
+        f.write(f"{proc_dir}\n")
+    time.sleep(0.2)
+    write(proc_dir / "madminer" / "run.sh", "")
+
+
+def _job(cache_dir):
+    ProcessCache(cache_dir).get("key", _build_slowly)
+
+
+def test_concurrent_jobs_wait_for_the_build(tmp_path):
+    # POSIX locks are held per process, so jobs are processes and not threads
+    context = multiprocessing.get_context("fork")
+    jobs = [context.Process(target=_job, args=(tmp_path / "cache",)) for _ in range(2)]
+    for job in jobs:
+        job.start()
+    for job in jobs:
+        job.join()
+    assert [job.exitcode for job in jobs] == [0, 0]
+    assert len((tmp_path / "cache" / "builds.txt").read_text().splitlines()) == 1
+    assert (tmp_path / "cache" / "key" / "madminer" / "run.sh").is_file()
+
+
+def test_clones_are_independent_runs(tmp_path):
+    cache = ProcessCache(tmp_path / "cache")
+    cards = tmp_path / "cache" / "key" / "madminer" / "cards"
+    write(cards / "run_card_0.dat", RUN_CARD.format(seed=0))
+    write(cards / "reweight_card_0.dat", "launch\n")
+
+    run1, run2 = tmp_path / "runs" / "1", tmp_path / "runs" / "2"
+    for run, seed in ((run1, "11"), (run2, "12")):
+        cache.clone(cache.cache_dir / "key", run)
+        set_seed(run, seed)
+    insert = write(tmp_path / "insert.dat", "change rwgt_dir\n")
+    insert_reweight_card(run1, insert)
+
+    assert read_seed(run1 / "madminer" / "cards" / "run_card_0.dat") == "11"
+    assert read_seed(run2 / "madminer" / "cards" / "run_card_0.dat") == "12"
+    assert read_seed(cards / "run_card_0.dat") == "0"
+    rwg_card = "madminer/cards/reweight_card_0.dat"
+    assert (run1 / rwg_card).read_text() == "change rwgt_dir\nlaunch\n"
+    assert (run2 / rwg_card).read_text() == "launch\n"
+    assert (cards / "reweight_card_0.dat").read_text() == "launch\n"
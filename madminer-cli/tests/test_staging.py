@@ -0,0 +1,104 @@
+import hashlib
+import os
+import subprocess
+
+import pytest
+
+from madminer_cli.staging import (
+    CHECKSUMS_FILENAME,
+    STAGES,
+    expand,
+    read_checksums,
+    stage,
+)
+
+
+def write(path, contents):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(contents)
+    return path
+
+
+def sha256(contents):
+    return hashlib.sha256(contents).hexdigest()
+
+
+@pytest.fixture
+def proc_dir(tmp_path):
+    proc_dir = tmp_path / "proc"
+    write(proc_dir / "Cards" / "run_card.dat", b"run")
+    write(proc_dir / "Events" / "run_01" / "unweighted_events.lhe.gz", b"lhe")
+    write(proc_dir / "Events" / "run_01" / "tag_1_pythia8_events.hepmc.gz", b"hepmc")
+    script = write(proc_dir / "bin" / "generate_events", b"#!/bin/sh\n")
+    script.chmod(0o755)
+    os.symlink("Cards/run_card.dat", proc_dir / "run_card.dat")
+    return proc_dir
+
+
+def test_expand(proc_dir):
+    assert sorted(expand(proc_dir, "Events/run_01/*.gz")) == [
+        ("Events/run_01/tag_1_pythia8_events.hepmc.gz", False),
+        ("Events/run_01/unweighted_events.lhe.gz", False),
+    ]
+    # `*` also matches `/`
+    assert sorted(expand(proc_dir, "Events/*")) == [
+        ("Events/run_01", True),
+        ("Events/run_01/tag_1_pythia8_events.hepmc.gz", False),
+        ("Events/run_01/unweighted_events.lhe.gz", False),
+    ]
+    assert list(expand(proc_dir, "Cards/run_card.dat")) == [
+        ("Cards/run_card.dat", False)
+    ]
+    assert list(expand(proc_dir, "run_card.dat")) == [("run_card.dat", False)]
+    assert list(expand(proc_dir, "Cards/param_card.dat")) == []
+    assert list(expand(proc_dir, "Missing/*")) == []
+
+
+def test_stage_writes_checksums(proc_dir, tmp_path):
+    scratch = tmp_path / "scratch"
+    checksums = stage(("*",), proc_dir, scratch)
+    # Symlinks are copied as symlinks, without checksum
+    assert os.readlink(scratch / "run_card.dat") == "Cards/run_card.dat"
+    assert "run_card.dat" not in checksums
+    assert os.access(scratch / "bin" / "generate_events", os.X_OK)
+    assert checksums["Events/run_01/unweighted_events.lhe.gz"] == sha256(b"lhe")
+    assert read_checksums(scratch) == checksums
+    # The file is in `sha256sum` format
+    check = subprocess.run(
+        ["sha256sum", "--check", "--quiet", CHECKSUMS_FILENAME], cwd=scratch
+    )
+    assert check.returncode == 0
+
+
+def test_checksums_of_earlier_stages_are_kept(proc_dir, tmp_path):
+    scratch, shared = tmp_path / "scratch", tmp_path / "shared"
+    stage(STAGES["generation"].inputs, proc_dir, scratch)
+    stage(STAGES["generation"].outputs, scratch, shared)
+    stage(STAGES["delphes"].inputs, shared, tmp_path / "delphes")
+    assert read_checksums(shared) == {
+        "Events/run_01/tag_1_pythia8_events.hepmc.gz": sha256(b"hepmc"),
+        "Events/run_01/unweighted_events.lhe.gz": sha256(b"lhe"),
+    }
+    assert read_checksums(tmp_path / "delphes") == {
+        "Events/run_01/tag_1_pythia8_events.hepmc.gz": sha256(b"hepmc"),
+    }
+
+    write(scratch / "delphes_1.root", b"root")
+    stage(STAGES["delphes"].outputs, scratch, shared)
+    assert read_checksums(shared)["delphes_1.root"] == sha256(b"root")
+    assert len(read_checksums(shared)) == 3
+
+
+def test_corrupted_inputs_are_detected(proc_dir, tmp_path):
+    scratch = tmp_path / "scratch"
+    stage(("Events/*",), proc_dir, scratch)
+    write(scratch / "Events" / "run_01" / "unweighted_events.lhe.gz", b"bit flip")
+    with pytest.raises(IOError, match="corrupted input"):
+        stage(("Events/*",), scratch, tmp_path / "next")
+    # Unless verification is disabled
+    stage(("Events/*",), scratch, tmp_path / "next", verify=False)
+
+
+def test_missing_inputs_are_errors(proc_dir, tmp_path):
+    with pytest.raises(FileNotFoundError, match=r"Nothing matches \*\.root"):
+        stage(("*.root",), proc_dir, tmp_path / "scratch")
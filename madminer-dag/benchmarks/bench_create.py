@@ -0,0 +1,107 @@
+#!/bin/env python3
+
+"""
+Benchmark `madminer_dag create` for an increasing number of runs.
+
+A synthetic config dir with a single process entry is created for every
+value of `runs` and the time and peak (python) memory of `create` are
+reported. Both should grow linearly, i.e. the per-run columns should
+stay (roughly) constant.
+
+    python benchmarks/bench_create.py --runs 100 1000 10000 100000
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from typing import List
+
+import yaml
+
+from madminer_dag.parse_args import parse_args
+from madminer_dag.run import run
+
+PROCESS = {
+    "cards_dir": "cards/bench/tzq",
+    "proc_card": "proc_card_mg5_sm_tdecay.dat",
+    "run_card": "run_card_signal_large.dat",
+    "param_card": "restrict_SMlimit_massless.dat",
+    "pythia_card": "pythia8_card.dat",
+    "benchmark": "sm",
+    "reweight_card_insert": "cards/bench/tzq/reweight_card_insert_tdecay.dat",
+    "n_subprocesses": 6,
+}
+
+
+def make_config_dir(root: Path, runs: int) -> Path:
+    config_dir = root / "conf" / f"bench_{runs}"
+    config_dir.mkdir(parents=True)
+    dag_yml = {
+        "tmp_dir": "/tmp/bench/share",
+        "log_dir": "logs/bench",
+        "setup_dir": "/tmp/bench/setup",
+        "setup_file": "setup.h5",
+        "setup_conf": str(config_dir / "benchmarks.yml"),
+        "processes_dir": "/tmp/bench/processes",
+        "mg_dir": "/tmp/bench/MG5_aMC",
+        "processes": [dict(PROCESS, runs=runs)],
+        "delphes_card": "cards/bench/delphes_card_ATLAS.dat",
+        "delphes_dir": "/tmp/bench/MG5_aMC/Delphes",
+        "ld_library_path": "/tmp/bench/lib",
+        "root_files_dir": "/tmp/bench/root",
+        "observables": str(config_dir / "observables.yml"),
+        "h5_dir": "/tmp/bench/h5",
+        "augmentation": {"outdir": "/tmp/bench/samples", "nproc": 1},
+    }
+    with open(config_dir / "dag.yml", "w") as f:
+        yaml.safe_dump(dag_yml, f)
+    for name in ("benchmarks.yml", "observables.yml", "dag.conf"):
+        (config_dir / name).touch()
+    # Rendered for every run by `create`
+    cards_dir = root / PROCESS["cards_dir"]
+    cards_dir.mkdir(parents=True)
+    (cards_dir / PROCESS["run_card"]).write_text("  RND_SEED   = iseed\n")
+    Path(root / PROCESS["reweight_card_insert"]).write_text("change process p p > t\n")
+    return config_dir
+
+
+def bench(runs: int) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp)
+        config_dir = make_config_dir(root, runs)
+        cwd = os.getcwd()
+        os.chdir(root)
+        try:
+            tracemalloc.start()
+            start = time.perf_counter()
+            run(parse_args(["create", "-c", str(config_dir.relative_to(root))]))
+            elapsed = time.perf_counter() - start
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+        finally:
+            os.chdir(cwd)
+
+    print(
+        f"{runs:>8d} {elapsed:>10.3f} {1e6 * elapsed / runs:>12.1f} "
+        f"{peak / 2**20:>10.1f} {peak / runs / 2**10:>12.2f}"
+    )
+
+
+def main(args: List[str]) -> None:
+    parser = argparse.ArgumentParser(prog="bench_create")
+    parser.add_argument(
+        "--runs", type=int, nargs="+", default=[100, 1_000, 10_000, 100_000]
+    )
+    arguments = parser.parse_args(args)
+
+    print(f"{'runs':>8} {'time [s]':>10} {'us / run':>12} {'peak [MB]':>10} {'kB / run':>12}")
+    for runs in arguments.runs:
+        bench(runs)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
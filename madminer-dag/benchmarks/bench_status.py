@@ -0,0 +1,106 @@
+#!/bin/env python3
+
+"""
+Benchmark the parsing of DAGMan node status files.
+
+A synthetic `.dag.status` file with the layout written by DAGMan is
+created for every number of nodes, and the time of a full parse and of
+a call on the unchanged file (which is not parsed again) is reported.
+
+    python benchmarks/bench_status.py --nodes 1000 10000 100000
+"""
+
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import List
+
+from madminer_dag.node_parser import NodeStatusParser
+from madminer_dag.schemas import NodeStatus
+
+PHASES = ("PREPARE_GENERATION", "RUN_GENERATION", "RUN_DELPHES", "RUN_ANALYSIS")
+
+DAG_BLOCK = """[
+  Type = "DagStatus";
+  DagFiles = {
+    "bench.dag"
+  };
+  Timestamp = 1700000000; /* "Tue Nov 14 22:13:20 2023" */
+  DagStatus = 3; /* "STATUS_SUBMITTED ()" */
+  NodesTotal = {total};
+  NodesDone = 0;
+]
+"""
+
+NODE_BLOCK = """[
+  Type = "NodeStatus";
+  Node = "{name}";
+  NodeStatus = {status}; /* "STATUS_{status_name}" */
+  StatusDetails = "";
+  RetryCount = 0;
+  JobProcsQueued = 0;
+  JobProcsHeld = 0;
+]
+"""
+
+END_BLOCK = """[
+  Type = "StatusEnd";
+  EndTime = 1700000000; /* "Tue Nov 14 22:13:20 2023" */
+  NextUpdate = 1700000045; /* "Tue Nov 14 22:14:05 2023" */
+]
+"""
+
+
+def write_status_file(filename: Path, n_nodes: int) -> None:
+    statuses = list(NodeStatus)
+    with open(filename, "w") as f:
+        f.write(DAG_BLOCK.replace("{total}", str(n_nodes)))
+        for i in range(n_nodes):
+            run, phase = divmod(i, len(PHASES))
+            status = statuses[i % len(statuses)]
+            f.write(
+                NODE_BLOCK.format(
+                    name=f"PH_{run + 1}+{PHASES[phase]}_{run + 1}",
+                    status=status.value,
+                    status_name=status.name,
+                )
+            )
+        f.write(END_BLOCK)
+
+
+def bench(n_nodes: int) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        filename = Path(tmp) / "bench.dag.status"
+        write_status_file(filename, n_nodes)
+        size = filename.stat().st_size
+
+        parser = NodeStatusParser(filename)
+        start = time.perf_counter()
+        nodes = parser.all_nodes()
+        parsed = time.perf_counter() - start
+        assert len(nodes) == n_nodes
+
+        start = time.perf_counter()
+        parser.all_nodes()
+        cached = time.perf_counter() - start
+
+    print(
+        f"{n_nodes:>8d} {size / 2**20:>10.1f} {parsed:>10.3f} "
+        f"{n_nodes / parsed:>12.0f} {1e3 * cached:>12.3f}"
+    )
+
+
+def main(args: List[str]) -> None:
+    parser = argparse.ArgumentParser(prog="bench_status")
+    parser.add_argument("--nodes", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    arguments = parser.parse_args(args)
+
+    print(f"{'nodes':>8} {'size [MB]':>10} {'parse [s]':>10} {'nodes / s':>12} {'cached [ms]':>12}")
+    for n_nodes in arguments.nodes:
+        bench(n_nodes)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
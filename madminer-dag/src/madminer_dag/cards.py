@@ -0,0 +1,108 @@
+from __future__ import annotations
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from madminer_dag.typing import PathLike
+
+__all__ = ["CardRenderer"]
+
+
+class CardRenderer:
+    """Render the cards of every run at DAG creation time, so that jobs read
+    them as they are instead of being post-processed on the submit host:
+        1. The run card, with the `RND_SEED` placeholder filled in
+        2. The reweight card insert, pasted on top of the reweight cards
+           MadMiner creates (these depend on the setup file, which does not
+           exist yet)
+    Templates are read and split once, and runs are rendered from the splits"""
+
+    SEED_PLACEHOLDER = "RND_SEED"
+    RUN_CARD = "run_card.dat"
+    REWEIGHT_CARD_INSERT = "reweight_card_insert.dat"
+
+    def __init__(self, seed: int) -> None:
+        self.seed = seed
+        self._templates: Dict[Path, List[str]] = {}
+        # (directory of the run cards, run card template, seed, reweight insert)
+        self._runs: List[Tuple[Path, Path, int, Optional[Path]]] = []
+
+    def __len__(self) -> int:
+        return len(self._runs)
+
+    def _template(self, path: Path) -> List[str]:
+        if path not in self._templates:
+            with open(path, "r") as f:
+                self._templates[path] = f.read().split(self.SEED_PLACEHOLDER)
+        return self._templates[path]
+
+    def run_seed(
+        self, run: int, n_subprocesses: int, seed: Optional[int] = None
+    ) -> int:
+        # Every subprocess of a run gets its own seed, see
+        # https://answers.launchpad.net/mg5amcnlo/+question/254698
+        return (self.seed if seed is None else seed) + run * n_subprocesses
+
+    def add(
+        self,
+        run: int,
+        process: Dict[str, Any],
+        dirname: PathLike,
+        seed: Optional[int] = None,
+    ) -> None:
+        """Add the cards of a run. `seed` is the base seed of the experiment
+        the run belongs to, if not the one of the renderer"""
+        run_card = Path(process["cards_dir"]) / process["run_card"]
+        # Fail at creation time rather than in every job
+        self._template(run_card)
+        rwg_card = process.get("reweight_card_insert")
+        if rwg_card is None or str(rwg_card).lower() == "none":
+            rwg_card = None
+        else:
+            rwg_card = Path(rwg_card)
+            self._template(rwg_card)
+
+        run_seed = self.run_seed(run, int(process["n_subprocesses"]), seed)
+        self._runs.append((Path(dirname), run_card, run_seed, rwg_card))
+
+    def render(
+        self, run_card: Path, seed: int, rwg_card: Optional[Path]
+    ) -> Dict[str, str]:
+        """Filename -> contents of the cards of a run"""
+        cards = {self.RUN_CARD: str(seed).join(self._template(run_card))}
+        if rwg_card is not None:
+            insert = self.SEED_PLACEHOLDER.join(self._template(rwg_card))
+            cards[self.REWEIGHT_CARD_INSERT] = (
+                f"# Contents pasted from card {rwg_card}\n\n{insert.rstrip()}\n"
+            )
+        return cards
+
+    def _write(self, run: Tuple[Path, Path, int, Optional[Path]]) -> int:
+        dirname, run_card, seed, rwg_card = run
+        dirname.mkdir(parents=True, exist_ok=True)
+        written = 0
+        cards = self.render(run_card, seed, rwg_card)
+        if self.REWEIGHT_CARD_INSERT not in cards:
+            # Left over from a configuration with reweight card insert
+            (dirname / self.REWEIGHT_CARD_INSERT).unlink(missing_ok=True)
+        for name, contents in cards.items():
+            path = dirname / name
+            # Unchanged cards are not rewritten (see `create --incremental`)
+            if path.exists() and path.read_text() == contents:
+                continue
+            path.write_text(contents)
+            written += 1
+        return written
+
+    def write(self, jobs: int = 1) -> Tuple[int, float]:
+        """Write the cards of every run. Returns the number of files written and
+        the time it took"""
+        start = time.perf_counter()
+        if jobs > 1:
+            with ThreadPoolExecutor(max_workers=jobs) as executor:
+                written = sum(executor.map(self._write, self._runs))
+        else:
+            written = sum(self._write(run) for run in self._runs)
+        return written, time.perf_counter() - start
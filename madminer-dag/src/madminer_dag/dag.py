@@ -1,7 +1,12 @@
 from __future__ import annotations
 
+import hashlib
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, Iterator, List, Optional, Tuple
 
 from madminer_dag.node import Node
 from madminer_dag.schemas import NodeType
@@ -9,16 +14,36 @@ from madminer_dag.typing import PathLike
 from madminer_dag.utils import validate_var
 
 
+@dataclass
+class WriteReport:
+    written: int = 0
+    skipped: int = 0
+    removed: int = 0
+    # Per-run cards written (see `CardRenderer`)
+    cards: int = 0
+    # Phase name -> wall-clock seconds (of the whole worker pool)
+    timings: Dict[str, float] = field(default_factory=dict)
+
+    def __str__(self) -> str:
+        report = (
+            f"Written {self.written} DAG files, skipped {self.skipped} unchanged, "
+            f"removed {self.removed} orphaned run directories, "
+            f"written {self.cards} run cards"
+        )
+        for phase, seconds in self.timings.items():
+            report += f"\n  {phase:<8} {seconds:8.3f} s"
+        return report
+
+
 class DAG:
 
     def __init__(self, filename: PathLike, name: Optional[str] = None) -> None:
         self.filename = Path(filename).with_suffix(".dag")
         self.name = name if name else self.filename.stem
         self._contents = []
-        self._nodes: List[Node] = []
+        # Indexed by node name, so parent lookups don't scan every node
+        self._nodes: Dict[str, Node] = {}
         self._subdags: List[DAG] = []
-        self._dag = ""
-        self._is_compiled = False
         self._is_splice = False
 
     @property
@@ -29,15 +54,30 @@ class DAG:
     def is_splice(self) -> bool:
         return self._is_splice
 
+    @property
+    def nodes(self) -> List[Node]:
+        return list(self._nodes.values())
+
     @property
     def dag(self) -> str:
-        if not self._is_compiled:
-            self.compile()
-        return self._dag
+        return "".join(self.render())
+
+    def parents(self) -> Dict[str, List[str]]:
+        """Node name -> names of its parent nodes in this DAG"""
+        parents: Dict[str, List[str]] = {name: [] for name in self._nodes}
+        for node in self._nodes.values():
+            for child in node.children:
+                if child.name in parents:
+                    parents[child.name].append(node.name)
+        return parents
 
     def add(self, string: str) -> None:
         self._contents.append(string + "\n")
 
+    def _ensure_parent(self, parent: Node) -> None:
+        if self._nodes.get(parent.name) is not parent:
+            raise ValueError(f"Parent node {parent.name} not in DAG {self.name}")
+
     def add_subdag(
         self, dag: DAG, is_splice: bool = False, from_parent: Optional[Node] = None
     ) -> None:
@@ -46,7 +86,7 @@ class DAG:
             self._contents.append(f"SPLICE {dag.name} {dag.filename}\n")
 
         if from_parent is not None:
-            assert from_parent in self._nodes
+            self._ensure_parent(from_parent)
             from_parent.add_child(Node(name=dag.name, script="", type=NodeType.SPLICE))
 
         self._subdags.append(dag)
@@ -58,28 +98,74 @@ class DAG:
         self._contents.append("\n".join(variables) + "\n")
 
     def add_node(self, node: Node, from_parent: Optional[Node] = None) -> None:
-        self._nodes.append(node)
+        if node.name in self._nodes:
+            raise ValueError(f"Duplicated node {node.name} in DAG {self.name}")
+        self._nodes[node.name] = node
         self._contents.append(node)
         if from_parent is not None:
-            assert from_parent in self._nodes
+            self._ensure_parent(from_parent)
             from_parent.add_child(node)
 
-    def compile(self) -> None:
-        self._dag = "\n".join(str(c) for c in self._contents)
-        for node in self._nodes:
-            if node.children:
-                self._dag += f"\nPARENT {node.name} CHILD {' '.join(child.name for child in node.children)}"
-
-        for subdag in self._subdags:
-            subdag.compile()
-
-        self._is_compiled = True
+    def render(self) -> Iterator[str]:
+        """Yield the DAG file contents chunk by chunk"""
+        sep = ""
+        for c in self._contents:
+            yield sep + str(c)
+            sep = "\n"
 
-    def write(self) -> None:
+        for node in self._nodes.values():
+            if node.children:
+                yield f"\nPARENT {node.name} CHILD {' '.join(child.name for child in node.children)}"
+
+    def iter_dags(self) -> Iterator[DAG]:
+        """Walk this DAG and all its subdags (pre-order)"""
+        stack: List[DAG] = [self]
+        while stack:
+            dag = stack.pop()
+            yield dag
+            stack.extend(reversed(dag._subdags))
+
+    def _write(self, old_digest: Optional[str]) -> Tuple[str, bool]:
+        """Render, hash and write the DAG file in a single pass, to a temporary
+        file renamed into place only if the contents changed"""
         self.dirname.mkdir(parents=True, exist_ok=True)
-
-        with open(self.filename, "w") as f:
-            f.write(self.dag)
-
-        for subdag in self._subdags:
-            subdag.write()
+        tmp = self.dirname / f".{self.filename.name}.tmp"
+        h = hashlib.sha256()
+        with open(tmp, "w") as f:
+            for chunk in self.render():
+                h.update(chunk.encode())
+                f.write(chunk)
+        digest = h.hexdigest()
+
+        written = old_digest != digest or not self.filename.exists()
+        if written:
+            os.replace(tmp, self.filename)
+        else:
+            tmp.unlink()
+        return digest, written
+
+    def write(
+        self, hashes: Optional[Dict[str, str]] = None, jobs: int = 1
+    ) -> WriteReport:
+        """Write this DAG and its subdags using `jobs` threads. If `hashes`
+        (filename -> content hash of the file on disk) is given, files whose
+        content did not change are not rewritten and `hashes` is updated in place"""
+        start = time.perf_counter()
+        dags = list(self.iter_dags())
+        old = [hashes.get(str(dag.filename)) if hashes else None for dag in dags]
+
+        if jobs > 1:
+            with ThreadPoolExecutor(max_workers=jobs) as executor:
+                results = list(executor.map(DAG._write, dags, old))
+        else:
+            results = [dag._write(o) for dag, o in zip(dags, old)]
+
+        # Results keep the order of `dags`, whatever the number of workers
+        report = WriteReport()
+        for dag, (digest, written) in zip(dags, results):
+            if hashes is not None:
+                hashes[str(dag.filename)] = digest
+            report.written += written
+            report.skipped += not written
+        report.timings["write"] = time.perf_counter() - start
+        return report
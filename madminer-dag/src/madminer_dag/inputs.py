@@ -0,0 +1,115 @@
+import hashlib
+import json
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+
+import yaml
+
+from madminer_dag.schemas import PhPhases
+from madminer_dag.typing import PathLike
+
+
+class InputHasher:
+    """Content hashes of the inputs of every phase. Files are hashed once and
+    cached, since most runs share the same cards"""
+
+    def __init__(self) -> None:
+        self._files: Dict[Path, str] = {}
+        self._setups: Dict[Path, Any] = {}
+
+    def file(self, path: PathLike) -> str:
+        path = Path(path)
+        if path not in self._files:
+            if path.is_file():
+                h = hashlib.sha256()
+                with open(path, "rb") as f:
+                    for chunk in iter(lambda: f.read(1 << 20), b""):
+                        h.update(chunk)
+                self._files[path] = h.hexdigest()
+            else:
+                self._files[path] = f"missing:{path}"
+        return self._files[path]
+
+    def hash(self, files: Iterable[PathLike], values: Dict[str, Any]) -> str:
+        h = hashlib.sha256()
+        for f in files:
+            h.update(f"{f}:{self.file(f)}\n".encode())
+        h.update(json.dumps(values, sort_keys=True, default=str).encode())
+        return h.hexdigest()
+
+    @staticmethod
+    def _cards(process: Dict[str, Any]) -> List[Path]:
+        cards_dir = Path(process["cards_dir"])
+        cards = [
+            cards_dir / process[k]
+            for k in ("proc_card", "run_card", "param_card", "pythia_card")
+        ]
+        rwg_card = process.get("reweight_card_insert")
+        if rwg_card and str(rwg_card).lower() != "none":
+            cards.append(Path(rwg_card))
+        return cards
+
+    def setup(self, setup_conf: PathLike) -> Any:
+        """Parsed setup configuration, so that files differing only in
+        formatting or comments compare equal"""
+        path = Path(setup_conf)
+        if path not in self._setups:
+            if path.is_file():
+                with open(path, "r") as f:
+                    self._setups[path] = yaml.safe_load(f)
+            else:
+                self._setups[path] = f"missing:{path}"
+        return self._setups[path]
+
+    def sample(self, conf: Dict[str, Any], process: Dict[str, Any]) -> str:
+        """Hash of the contents of everything the events of a process depend on
+        up to Delphes, wherever the files are. Events are reweighted to the
+        benchmarks of the setup, so processes of experiments with different
+        setups never hash equal"""
+        return self.hash(
+            [],
+            {
+                "cards": [self.file(card) for card in self._cards(process)],
+                "benchmark": process["benchmark"],
+                "n_subprocesses": process.get("n_subprocesses"),
+                "seed": conf["seed"],
+                "mg_dir": conf["mg_dir"],
+                "setup": self.setup(conf["setup_conf"]),
+                "delphes_card": self.file(conf["delphes_card"]),
+                "delphes_dir": conf["delphes_dir"],
+            },
+        )
+
+    def phase(
+        self,
+        phase: PhPhases,
+        conf: Dict[str, Any],
+        process: Optional[Dict[str, Any]] = None,
+    ) -> str:
+        """Hash of the inputs a phase reads directly. Inputs of earlier phases
+        (e.g. `setup.h5`) are covered by the parent nodes"""
+        if phase == PhPhases.SETUP:
+            return self.hash([conf["setup_conf"]], {"setup_file": conf["setup_file"]})
+        if phase == PhPhases.RUN_AUGMENTATION:
+            return self.hash([], conf["augmentation"])
+
+        assert process is not None
+        if phase == PhPhases.PREPARE_GENERATION:
+            return self.hash(
+                self._cards(process),
+                {
+                    "benchmark": process["benchmark"],
+                    "n_subprocesses": process.get("n_subprocesses"),
+                    "seed": conf["seed"],
+                    "mg_dir": conf["mg_dir"],
+                },
+            )
+        if phase == PhPhases.RUN_GENERATION:
+            return self.hash([], {"mg_dir": conf["mg_dir"]})
+        if phase == PhPhases.RUN_DELPHES:
+            return self.hash(
+                [conf["delphes_card"]], {"delphes_dir": conf["delphes_dir"]}
+            )
+        if phase == PhPhases.RUN_ANALYSIS:
+            return self.hash([conf["observables"]], {})
+        raise ValueError(f"Invalid phase: {phase}")
@@ -0,0 +1,489 @@
+"""Run a DAG on the local machine, as a stand-in for HTCondor/DAGMan.
+
+Only the subset of the DAG language written by `madminer_dag create` is
+supported: JOB, VARS (including ALL_NODES), SCRIPT PRE/POST, PARENT/CHILD,
+SPLICE, INCLUDE, CONFIG, CATEGORY, MAXJOBS, PRIORITY and NODE_STATUS_FILE.
+Submit files are read for `executable`, `arguments`, `output` and `error`,
+with `$(MACRO)` (and `$(MACRO:default)`) expansion from the node VARS.
+"""
+
+from __future__ import annotations
+
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+
+from madminer_dag.schemas import NodeStatus
+from madminer_dag.typing import PathLike
+
+VARS_RGX = re.compile(r'(\w+)\s*=\s*"((?:[^"\\]|\\.)*)"')
+ESCAPE_RGX = re.compile(r"\\(.)")
+# `$(NAME)` or `$(NAME:default)`, the default being used if NAME is undefined
+MACRO_RGX = re.compile(r"\$\((\w+)(?::([^)]*))?\)")
+
+
+def unescape(value: str) -> str:
+    # DAGMan unescapes `\\` and `\"` in VARS values, then the submit file
+    # sees the remaining `\"` as a literal quote
+    return ESCAPE_RGX.sub(r"\1", value).replace('\\"', '"')
+
+
+@dataclass
+class LocalNode:
+    name: str
+    submit: Path
+    vars: Dict[str, str] = field(default_factory=dict)
+    pre: Optional[List[str]] = None
+    post: Optional[List[str]] = None
+    parents: Set[str] = field(default_factory=set)
+    children: Set[str] = field(default_factory=set)
+    category: Optional[str] = None
+    priority: int = 0
+    status: NodeStatus = NodeStatus.NOT_READY
+    details: str = ""
+    # Seconds spent in every step of the node
+    timings: Dict[str, float] = field(default_factory=dict)
+
+
+@dataclass
+class _Scope:
+    """Nodes, splices, ALL_NODES vars and edges of one DAG file (and the files
+    it INCLUDEs). Spliced nodes get the `<splice>+` prefix"""
+
+    prefix: str
+    nodes: Dict[str, str] = field(default_factory=dict)
+    splices: Dict[str, Tuple[List[str], List[str]]] = field(default_factory=dict)
+    all_vars: Dict[str, str] = field(default_factory=dict)
+    node_vars: Dict[str, Dict[str, str]] = field(default_factory=dict)
+    edges: List[Tuple[List[str], List[str]]] = field(default_factory=list)
+    members: List[str] = field(default_factory=list)
+
+
+class DAGFileParser:
+    def __init__(self) -> None:
+        self.nodes: Dict[str, LocalNode] = {}
+        self.config: Dict[str, str] = {}
+        # Category -> max. number of nodes of the category running at once
+        self.maxjobs: Dict[str, int] = {}
+        self.status_file: Optional[Path] = None
+        self.status_interval = 45.0
+
+    def parse(
+        self, filename: PathLike, prefix: str = ""
+    ) -> Tuple[List[str], List[str]]:
+        """Parse a DAG file and return its initial and final node names"""
+        return self._parse_scope(Path(filename), _Scope(prefix))
+
+    def _parse_scope(
+        self, filename: Path, scope: _Scope
+    ) -> Tuple[List[str], List[str]]:
+        self._parse_file(filename, scope)
+
+        for local, full in scope.nodes.items():
+            self.nodes[full].vars = {**scope.all_vars, **scope.node_vars.get(local, {})}
+
+        for parent_names, child_names in scope.edges:
+            parents = [p for n in parent_names for p in self._resolve(scope, n, 1)]
+            children = [c for n in child_names for c in self._resolve(scope, n, 0)]
+            for parent in parents:
+                for child in children:
+                    self.nodes[parent].children.add(child)
+                    self.nodes[child].parents.add(parent)
+
+        members = set(scope.members)
+        initial = [n for n in scope.members if not self.nodes[n].parents & members]
+        final = [n for n in scope.members if not self.nodes[n].children & members]
+        return initial, final
+
+    def _resolve(self, scope: _Scope, name: str, which: int) -> List[str]:
+        if name in scope.nodes:
+            return [scope.nodes[name]]
+        if name in scope.splices:
+            return scope.splices[name][which]
+        raise ValueError(f"Unknown node or splice {name}")
+
+    @staticmethod
+    def _category(scope: _Scope, category: str) -> str:
+        # Categories are local to their splice unless they start with `+`
+        return category if category.startswith("+") else scope.prefix + category
+
+    def _parse_file(self, filename: Path, scope: _Scope) -> None:
+        with open(filename, "r") as f:
+            for line in f:
+                line = line.strip()
+                if not line or line.startswith("#"):
+                    continue
+                keyword, _, rest = line.partition(" ")
+                self._parse_line(keyword.upper(), rest.strip(), scope)
+
+    def _parse_line(self, keyword: str, rest: str, scope: _Scope) -> None:
+        words = rest.split()
+        if keyword == "JOB":
+            name, submit = words[0], Path(words[1])
+            full = scope.prefix + name
+            if full in self.nodes:
+                raise ValueError(f"Duplicated node {full}")
+            self.nodes[full] = LocalNode(full, submit)
+            if "DONE" in (w.upper() for w in words[2:]):
+                self.nodes[full].status = NodeStatus.DONE
+            scope.nodes[name] = full
+            scope.members.append(full)
+        elif keyword == "VARS":
+            name, _, assignments = rest.partition(" ")
+            variables = {
+                k.upper(): unescape(v) for k, v in VARS_RGX.findall(assignments)
+            }
+            if name == "ALL_NODES":
+                scope.all_vars.update(variables)
+            else:
+                scope.node_vars.setdefault(name, {}).update(variables)
+        elif keyword == "SCRIPT":
+            # SCRIPT [DEFER status time] PRE|POST node executable [args]
+            if words[0].upper() == "DEFER":
+                words = words[3:]
+            node = self.nodes[scope.prefix + words[1]]
+            setattr(node, words[0].lower(), words[2:])
+        elif keyword == "CATEGORY":
+            node = self.nodes[scope.prefix + words[0]]
+            node.category = self._category(scope, words[1])
+        elif keyword == "MAXJOBS":
+            self.maxjobs[self._category(scope, words[0])] = int(words[1])
+        elif keyword == "PRIORITY":
+            self.nodes[scope.prefix + words[0]].priority = int(words[1])
+        elif keyword == "PARENT":
+            parents, _, children = rest.partition(" CHILD ")
+            scope.edges.append((parents.split(), children.split()))
+        elif keyword == "SPLICE":
+            name, filename = words[0], Path(words[1])
+            # Members of the splice, including those of its own splices
+            spliced = _Scope(f"{scope.prefix}{name}+")
+            scope.splices[name] = self._parse_scope(filename, spliced)
+            scope.members.extend(spliced.members)
+        elif keyword == "INCLUDE":
+            self._parse_file(Path(words[0]), scope)
+        elif keyword == "CONFIG":
+            self.config.update(read_config(words[0]))
+        elif keyword == "NODE_STATUS_FILE":
+            self.status_file = Path(words[0])
+            if len(words) > 1:
+                self.status_interval = float(words[1])
+        # Anything else (DOT, ...) is irrelevant to run the DAG locally
+
+
+def read_config(filename: PathLike) -> Dict[str, str]:
+    config = {}
+    with open(filename, "r") as f:
+        for line in f:
+            key, sep, value = line.partition("=")
+            if sep and not key.strip().startswith("#"):
+                config[key.strip().upper()] = value.strip()
+    return config
+
+
+def read_submit(filename: PathLike) -> Dict[str, str]:
+    submit = {}
+    with open(filename, "r") as f:
+        for line in f:
+            line = line.strip()
+            key, sep, value = line.partition("=")
+            if sep and not line.startswith("#"):
+                submit[key.strip().lower()] = value.strip()
+    return submit
+
+
+def resolve(executable: str) -> str:
+    # Like condor, relative executables are looked up from the submit directory
+    return os.path.abspath(executable) if os.path.exists(executable) else executable
+
+
+def expand(value: str, macros: Dict[str, str]) -> str:
+    # Macros may expand to other macros, e.g. `$(request_cpus)` to `$(SLOT_CPUS:2)`
+    for _ in range(10):
+        expanded = MACRO_RGX.sub(
+            lambda m: macros.get(m.group(1).upper(), m.group(2) or ""), value
+        )
+        if expanded == value:
+            break
+        value = expanded
+    return value
+
+
+@dataclass
+class LocalReport:
+    wall: float
+    nodes: List[LocalNode]
+
+    def __str__(self) -> str:
+        counts: Dict[str, int] = {}
+        steps: Dict[str, float] = {}
+        for node in self.nodes:
+            counts[node.status.name] = counts.get(node.status.name, 0) + 1
+            for step, seconds in node.timings.items():
+                steps[step] = steps.get(step, 0.0) + seconds
+
+        summary = ", ".join(f"{n} {status}" for status, n in sorted(counts.items()))
+        lines = [f"Finished in {self.wall:.2f} s: {summary}"]
+        for step, seconds in steps.items():
+            lines.append(f"  {step:<6} {seconds:10.2f} s (summed over nodes)")
+        failed = [n for n in self.nodes if n.status == NodeStatus.ERROR]
+        lines.extend(f"  FAILED {n.name}: {n.details}" for n in failed)
+        return "\n".join(lines)
+
+    @property
+    def ok(self) -> bool:
+        return all(n.status == NodeStatus.DONE for n in self.nodes)
+
+
+class LocalExecutor:
+    """Run the nodes of a DAG with a pool of worker threads, each one driving
+    the PRE script, job and POST script of a node as subprocesses"""
+
+    def __init__(
+        self,
+        dag_file: PathLike,
+        jobs: Optional[int] = None,
+        done: Optional[Set[str]] = None,
+    ) -> None:
+        self.dag_file = Path(dag_file)
+        self.parser = DAGFileParser()
+        self.parser.parse(self.dag_file)
+        self.nodes = self.parser.nodes
+        for name in done or ():
+            self.nodes[name].status = NodeStatus.DONE
+
+        config = self.parser.config
+        self.jobs = jobs or os.cpu_count() or 1
+        max_submitted = int(config.get("DAGMAN_MAX_JOBS_SUBMITTED", 0))
+        if max_submitted > 0:
+            self.jobs = min(self.jobs, max_submitted)
+        # Jobs handed to the pool but still waiting for a worker are idle
+        self.max_idle = int(config.get("DAGMAN_MAX_JOBS_IDLE", 0)) or len(self.nodes)
+        self._pre = threading.Semaphore(int(config.get("DAGMAN_MAX_PRE_SCRIPTS", 20)))
+        self._post = threading.Semaphore(int(config.get("DAGMAN_MAX_POST_SCRIPTS", 20)))
+
+        self._cluster = 0
+        self._lock = threading.Lock()
+
+    def _next_cluster(self) -> int:
+        with self._lock:
+            self._cluster += 1
+            return self._cluster
+
+    @staticmethod
+    def _script(args: List[str], macros: Dict[str, str]) -> int:
+        args = [macros.get(a, a) for a in args]
+        return subprocess.run([resolve(args[0]), *args[1:]]).returncode
+
+    def _job(self, node: LocalNode, cluster: int) -> int:
+        submit = read_submit(node.submit)
+        macros = {**{k.upper(): v for k, v in submit.items()}, **node.vars}
+        macros.update({"CLUSTER": str(cluster), "CLUSTERID": str(cluster)})
+        macros.update({"PROCESS": "0", "PROCID": "0"})
+
+        executable = resolve(expand(submit["executable"], macros))
+        arguments = expand(submit.get("arguments", ""), macros).split()
+        streams = {}
+        for key in ("output", "error"):
+            if key in submit:
+                path = Path(expand(submit[key], macros))
+                path.parent.mkdir(parents=True, exist_ok=True)
+                streams[key] = path
+
+        scratch = tempfile.mkdtemp(prefix=f"{node.name}.")
+        env = dict(os.environ, TMP=scratch, _CONDOR_SCRATCH_DIR=scratch)
+        try:
+            with open(streams.get("output", os.devnull), "w") as out, open(
+                streams.get("error", os.devnull), "w"
+            ) as err:
+                return subprocess.run(
+                    [executable, *arguments], stdout=out, stderr=err, env=env
+                ).returncode
+        finally:
+            shutil.rmtree(scratch, ignore_errors=True)
+
+    def _run_node(self, node: LocalNode) -> bool:
+        cluster = self._next_cluster()
+        macros = {"$JOB": node.name, "$JOBID": f"{cluster}.0"}
+
+        if node.pre:
+            node.status = NodeStatus.PRERUN
+            start = time.perf_counter()
+            with self._pre:
+                rc = self._script(node.pre, macros)
+            node.timings["pre"] = time.perf_counter() - start
+            if rc != 0:
+                node.details = f"PRE script failed with exit code {rc}"
+                return False
+            macros["$PRE_SCRIPT_RETURN"] = str(rc)
+
+        node.status = NodeStatus.SUBMITTED
+        start = time.perf_counter()
+        rc = self._job(node, cluster)
+        node.timings["job"] = time.perf_counter() - start
+        node.details = f"Job exited with code {rc}" if rc else ""
+
+        if node.post:
+            node.status = NodeStatus.POSTRUN
+            macros["$RETURN"] = str(rc)
+            start = time.perf_counter()
+            with self._post:
+                rc = self._script(node.post, macros)
+            node.timings["post"] = time.perf_counter() - start
+            node.details = f"POST script failed with exit code {rc}" if rc else ""
+        return rc == 0
+
+    def _set_futile(self, node: LocalNode) -> None:
+        stack = list(node.children)
+        while stack:
+            child = self.nodes[stack.pop()]
+            if child.status != NodeStatus.FUTILE:
+                child.status = NodeStatus.FUTILE
+                stack.extend(child.children)
+
+    def _is_ready(self, node: LocalNode) -> bool:
+        return node.status == NodeStatus.NOT_READY and all(
+            self.nodes[p].status == NodeStatus.DONE for p in node.parents
+        )
+
+    def run(self) -> LocalReport:
+        start = time.perf_counter()
+        ready = [n for n in self.nodes.values() if self._is_ready(n)]
+        for node in ready:
+            node.status = NodeStatus.READY
+        running: Dict[Future, LocalNode] = {}
+        last_status = 0.0
+
+        with ThreadPoolExecutor(max_workers=self.jobs) as executor:
+            while ready or running:
+                idle = sum(n.status == NodeStatus.READY for n in running.values())
+                in_category: Dict[Optional[str], int] = {}
+                for n in running.values():
+                    in_category[n.category] = in_category.get(n.category, 0) + 1
+
+                # Highest priority first, in the order nodes became ready
+                ready.sort(key=lambda n: -n.priority)
+                for node in list(ready):
+                    if idle >= self.max_idle:
+                        break
+                    limit = self.parser.maxjobs.get(node.category or "")
+                    if limit is not None and in_category.get(node.category, 0) >= limit:
+                        continue
+                    ready.remove(node)
+                    running[executor.submit(self._run_node, node)] = node
+                    in_category[node.category] = in_category.get(node.category, 0) + 1
+                    idle += 1
+                if ready and not running:
+                    # Nothing running would ever free a slot for them
+                    blocked = {n.name: n.category for n in ready[:5]}
+                    raise ValueError(
+                        f"Nodes can never run, check MAXJOBS of their categories "
+                        f"and DAGMAN_MAX_JOBS_IDLE: {blocked}"
+                    )
+
+                finished, _ = wait(
+                    running,
+                    timeout=self.parser.status_interval,
+                    return_when=FIRST_COMPLETED,
+                )
+                for future in finished:
+                    node = running.pop(future)
+                    try:
+                        ok = future.result()
+                    except Exception as ex:
+                        ok, node.details = False, f"{type(ex).__name__}: {ex}"
+                    node.status = NodeStatus.DONE if ok else NodeStatus.ERROR
+                    if not ok:
+                        self._set_futile(node)
+                        continue
+                    for child in sorted(node.children):
+                        if self._is_ready(self.nodes[child]):
+                            self.nodes[child].status = NodeStatus.READY
+                            ready.append(self.nodes[child])
+
+                if time.monotonic() - last_status >= self.parser.status_interval:
+                    self.write_status()
+                    last_status = time.monotonic()
+
+        self.write_status(final=True)
+        return LocalReport(time.perf_counter() - start, list(self.nodes.values()))
+
+    def write_status(self, final: bool = False) -> None:
+        """Write a node status file with the layout of the DAGMan one"""
+        if self.parser.status_file is None:
+            return
+        now = int(time.time())
+        interval = self.parser.status_interval
+        nodes = list(self.nodes.values())
+        count = {s: sum(n.status == s for n in nodes) for s in NodeStatus}
+        if final:
+            failed = count[NodeStatus.ERROR] + count[NodeStatus.FUTILE]
+            dag_status = NodeStatus.ERROR if failed else NodeStatus.DONE
+        else:
+            dag_status = NodeStatus.SUBMITTED
+
+        blocks = [
+            "[\n"
+            '  Type = "DagStatus";\n'
+            f'  DagFiles = {{\n    "{self.dag_file}"\n  }};\n'
+            f'  Timestamp = {now}; /* "{time.ctime(now)}" */\n'
+            f'  DagStatus = {dag_status.value}; /* "STATUS_{dag_status.name} ()" */\n'
+            f"  NodesTotal = {len(nodes)};\n"
+            f"  NodesDone = {count[NodeStatus.DONE]};\n"
+            f"  NodesPre = {count[NodeStatus.PRERUN]};\n"
+            f"  NodesQueued = {count[NodeStatus.SUBMITTED]};\n"
+            f"  NodesPost = {count[NodeStatus.POSTRUN]};\n"
+            f"  NodesReady = {count[NodeStatus.READY]};\n"
+            f"  NodesUnready = {count[NodeStatus.NOT_READY]};\n"
+            f"  NodesFutile = {count[NodeStatus.FUTILE]};\n"
+            f"  NodesFailed = {count[NodeStatus.ERROR]};\n"
+            "  JobProcsHeld = 0;\n"
+            "  JobProcsIdle = 0;\n"
+            "]\n"
+        ]
+        for n in nodes:
+            blocks.append(
+                "[\n"
+                '  Type = "NodeStatus";\n'
+                f'  Node = "{n.name}";\n'
+                f'  NodeStatus = {n.status.value}; /* "STATUS_{n.status.name}" */\n'
+                f'  StatusDetails = "{n.details}";\n'
+                "  RetryCount = 0;\n"
+                f"  JobProcsQueued = {int(n.status == NodeStatus.SUBMITTED)};\n"
+                "  JobProcsHeld = 0;\n"
+                "]\n"
+            )
+        blocks.append(
+            "[\n"
+            '  Type = "StatusEnd";\n'
+            f'  EndTime = {now}; /* "{time.ctime(now)}" */\n'
+            f"  NextUpdate = {0 if final else now + int(interval)};\n"
+            "]\n"
+        )
+
+        # Readers polling the file never see it half written
+        tmp = self.parser.status_file.with_suffix(".tmp")
+        with open(tmp, "w") as f:
+            f.writelines(blocks)
+        os.replace(tmp, self.parser.status_file)
+
+    def dry_run(self) -> List[str]:
+        """Node names in a valid execution order"""
+        order: List[str] = []
+        done = {n for n, node in self.nodes.items() if node.status == NodeStatus.DONE}
+        pending = [n for n in self.nodes if n not in done]
+        while pending:
+            batch = [n for n in pending if self.nodes[n].parents <= done]
+            if not batch:
+                raise ValueError(f"Cycle in DAG between nodes {pending[:5]}")
+            order.extend(batch)
+            done.update(batch)
+            pending = [n for n in pending if n not in done]
+        return order
@@ -0,0 +1,145 @@
+from __future__ import annotations
+
+import json
+from collections import deque
+from dataclasses import asdict, dataclass, field
+from typing import Dict, Iterable, List, Optional, Set
+
+from madminer_dag.node_parser import Node, PhaseNode
+from madminer_dag.schemas import PhPhases
+from madminer_dag.typing import PathLike
+
+
+@dataclass
+class ManifestNode:
+    phase: PhPhases
+    parents: List[str] = field(default_factory=list)
+    outputs: List[str] = field(default_factory=list)
+    run: Optional[int] = None
+    # Runs packed in the node (`runs_per_job`), `run` being the first one
+    runs: List[int] = field(default_factory=list)
+    process: Optional[int] = None
+    benchmark: Optional[str] = None
+    # Content hash of the inputs the node reads directly (cards, config, ...)
+    inputs: Optional[str] = None
+
+
+class Manifest:
+    """Structure of a created DAG, indexed by the node names DAGMan uses in the
+    status file (`<splice>+<node>` for nodes inside splices)"""
+
+    VERSION = 1
+
+    def __init__(
+        self,
+        nodes: Optional[Dict[str, ManifestNode]] = None,
+        config_dir: Optional[str] = None,
+        shared_config_dirs: Optional[List[str]] = None,
+        seed: Optional[int] = None,
+    ) -> None:
+        self.nodes: Dict[str, ManifestNode] = nodes if nodes is not None else {}
+        self.config_dir = config_dir
+        # Config folders of the other experiments of the DAG (`create` with
+        # several config folders)
+        self.shared_config_dirs = shared_config_dirs or []
+        # Base seed of the DAG, reused by `create --incremental` and `redo --auto`
+        self.seed = seed
+        self._children: Optional[Dict[str, List[str]]] = None
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.nodes
+
+    def __getitem__(self, name: str) -> ManifestNode:
+        return self.nodes[name]
+
+    def __len__(self) -> int:
+        return len(self.nodes)
+
+    def add(self, name: str, node: ManifestNode) -> None:
+        if name in self.nodes:
+            raise ValueError(f"Duplicated node {name} in manifest")
+        self.nodes[name] = node
+        self._children = None
+
+    @property
+    def children(self) -> Dict[str, List[str]]:
+        if self._children is None:
+            self._children = {name: [] for name in self.nodes}
+            for name, node in self.nodes.items():
+                for parent in node.parents:
+                    self._children[parent].append(name)
+        return self._children
+
+    def downstream(self, names: Iterable[str]) -> Set[str]:
+        """`names` and every node that (transitively) depends on them"""
+        closure = set(names)
+        queue = deque(closure)
+        while queue:
+            for child in self.children[queue.popleft()]:
+                if child not in closure:
+                    closure.add(child)
+                    queue.append(child)
+        return closure
+
+    def validate(self, names: Iterable[str]) -> None:
+        names = set(names)
+        missing = self.nodes.keys() - names
+        unknown = names - self.nodes.keys()
+        if missing or unknown:
+            raise ValueError(
+                "Status file does not match the DAG manifest: "
+                f"{len(missing)} nodes missing (e.g. {sorted(missing)[:3]}), "
+                f"{len(unknown)} unknown nodes (e.g. {sorted(unknown)[:3]})"
+            )
+
+    def changed_inputs(self, other: Manifest) -> Set[str]:
+        """Nodes whose inputs differ in `other`, a manifest of the same DAG built
+        from the current configuration"""
+        if self.nodes.keys() != other.nodes.keys():
+            raise ValueError(
+                "The DAG structure changed (different processes or runs), "
+                "create the DAG again instead"
+            )
+        return {
+            name
+            for name, node in self.nodes.items()
+            if node.inputs != other.nodes[name].inputs
+        }
+
+    def phase_nodes(self, nodes: List[Node]) -> List[PhaseNode]:
+        self.validate(n.name for n in nodes)
+        return [
+            PhaseNode(n.name, n.status, self.nodes[n.name].phase)  # type: ignore
+            for n in nodes
+        ]
+
+    def save(self, filename: PathLike) -> None:
+        with open(filename, "w") as f:
+            json.dump(
+                {
+                    "version": self.VERSION,
+                    "config_dir": self.config_dir,
+                    "shared_config_dirs": self.shared_config_dirs,
+                    "seed": self.seed,
+                    "nodes": {k: asdict(v) for k, v in self.nodes.items()},
+                },
+                f,
+                separators=(",", ":"),
+            )
+
+    @classmethod
+    def load(cls, filename: PathLike) -> Manifest:
+        with open(filename, "r") as f:
+            manifest = json.load(f)
+        if manifest.get("version") != cls.VERSION:
+            raise ValueError(f"Unsupported manifest version in {filename}")
+        nodes = {}
+        for name, node in manifest["nodes"].items():
+            node["phase"] = PhPhases(node["phase"])
+            nodes[name] = ManifestNode(**node)
+        return cls(
+            nodes,
+            config_dir=manifest.get("config_dir"),
+            shared_config_dirs=manifest.get("shared_config_dirs"),
+            seed=manifest.get("seed"),
+        )
@@ -0,0 +1,230 @@
+from __future__ import annotations
+
+import json
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from madminer_dag.manifest import Manifest
+from madminer_dag.node_parser import NodeStatusParser
+from madminer_dag.schemas import NodeStatus, PhPhases
+
+# Node status -> column in the progress table
+status2column = {
+    NodeStatus.NOT_READY: "waiting",
+    NodeStatus.READY: "waiting",
+    NodeStatus.PRERUN: "running",
+    NodeStatus.SUBMITTED: "running",
+    NodeStatus.POSTRUN: "running",
+    NodeStatus.DONE: "done",
+    NodeStatus.ERROR: "failed",
+    NodeStatus.FUTILE: "failed",
+}
+COLUMNS = ("done", "running", "waiting", "failed")
+
+# Phase name -> node count per column (in `COLUMNS` order)
+Counts = Dict[str, List[int]]
+
+
+@dataclass
+class PhaseProgress:
+    phase: PhPhases
+    done: int
+    running: int
+    waiting: int
+    failed: int
+    rate: Optional[float]  # done nodes per hour
+    stalled: bool
+
+    @property
+    def total(self) -> int:
+        return self.done + self.running + self.waiting + self.failed
+
+    @property
+    def eta(self) -> Optional[float]:
+        """Seconds left for the phase to finish at the current rate"""
+        remaining = self.total - self.done - self.failed
+        if remaining == 0:
+            return 0.0
+        if not self.rate:
+            return None
+        return 3600 * remaining / self.rate
+
+    def __str__(self) -> str:
+        pct = 100 * self.done / self.total if self.total else 0.0
+        rate = f"{self.rate:.1f}" if self.rate is not None else "-"
+        eta = format_seconds(self.eta) if self.eta is not None else "-"
+        flag = "  STALLED" if self.stalled else ""
+        return (
+            f"{self.phase.name:<20} {self.done:>6} {self.running:>8} {self.waiting:>8} "
+            f"{self.failed:>7} {self.total:>6} {pct:>6.1f} {rate:>8} {eta:>10}{flag}"
+        )
+
+
+def format_seconds(seconds: float) -> str:
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}"
+
+
+class StatusMonitor:
+    """Aggregate the node status file per phase and keep a time series of the
+    counts on disk to compute rates. Only updates changing the counts are
+    recorded (one JSON line each), and records older than the rate and stall
+    windows are dropped but for the last one, the counts at the start of them"""
+
+    HEADER = (
+        f"{'phase':<20} {'done':>6} {'running':>8} {'waiting':>8} "
+        f"{'failed':>7} {'total':>6} {'%':>6} {'done/h':>8} {'ETA':>10}"
+    )
+
+    def __init__(
+        self,
+        status_file: Path,
+        history_file: Path,
+        window: float = 3600.0,
+        stall_after: float = 1800.0,
+        manifest: Optional[Manifest] = None,
+    ) -> None:
+        self.parser = NodeStatusParser(status_file)
+        self.manifest = manifest
+        self.history_file = history_file
+        self.window = window
+        self.stall_after = stall_after
+        # Records dropped from memory but still in the history file
+        self._stale = 0
+        self.history: List[Tuple[float, Counts]] = self.load_history()
+        # Time of the last status file update, recorded or not
+        self.now = self.history[-1][0] if self.history else 0.0
+        self.prune()
+
+    @property
+    def horizon(self) -> float:
+        """Seconds of history needed to compute rates and find stalls"""
+        return max(self.window, self.stall_after)
+
+    def load_history(self) -> List[Tuple[float, Counts]]:
+        if not self.history_file.exists():
+            return []
+        with open(self.history_file, "r") as f:
+            history = [json.loads(line) for line in f if line.strip()]
+        return [(timestamp, counts) for timestamp, counts in history]
+
+    def save_history(self) -> None:
+        tmp = self.history_file.with_suffix(".tmp")
+        with open(tmp, "w") as f:
+            for record in self.history:
+                f.write(json.dumps(record, separators=(",", ":")) + "\n")
+        tmp.replace(self.history_file)
+        self._stale = 0
+
+    def prune(self) -> None:
+        """Drop the records older than the horizon but the last of them, and
+        rewrite the history file once it holds more dropped records than kept"""
+        start = self.now - self.horizon
+        first = 0
+        while first + 1 < len(self.history) and self.history[first + 1][0] <= start:
+            first += 1
+        del self.history[:first]
+        self._stale += first
+        if self._stale > len(self.history):
+            self.save_history()
+
+    def counts(self) -> Counts:
+        counts: Counts = {}
+        nodes = self.parser.all_nodes()
+        if self.manifest is not None:
+            nodes = self.manifest.phase_nodes(nodes)
+        for node in nodes:
+            phase = node.phase
+            if phase is None or node.status is None:
+                continue
+            column = COLUMNS.index(status2column[NodeStatus(node.status)])
+            # Nodes packing several runs (`runs_per_job`) count once per run
+            runs = len(self.manifest[node.name].runs) if self.manifest else 0
+            counts.setdefault(PhPhases(phase).name, [0] * len(COLUMNS))[column] += (
+                runs or 1
+            )
+        return counts
+
+    def update(self) -> bool:
+        """Read the status file if it changed, and record the counts if they
+        changed too"""
+        if not self.parser.changed():
+            return False
+        counts = self.counts()
+        timestamp = self.parser.stamp()[0] / 1e9
+        if timestamp <= self.now:
+            return False
+        self.now = timestamp
+
+        if not self.history or self.history[-1][1] != counts:
+            self.history.append((timestamp, counts))
+            with open(self.history_file, "a") as f:
+                f.write(json.dumps([timestamp, counts], separators=(",", ":")) + "\n")
+        self.prune()
+        return True
+
+    def _done_at(self, phase: str, t: float) -> int:
+        # Counts only change at the records
+        for timestamp, counts in reversed(self.history):
+            if timestamp <= t:
+                return counts.get(phase, [0])[0]
+        return self.history[0][1].get(phase, [0])[0]
+
+    def _rate(self, phase: str) -> Tuple[Optional[float], bool]:
+        counts = self.history[-1][1]
+        done = counts[phase][0]
+
+        start = max(self.now - self.window, self.history[0][0])
+        rate = None
+        if self.now > start:
+            rate = 3600 * (done - self._done_at(phase, start)) / (self.now - start)
+
+        # Last time the number of done nodes changed
+        last_change = self.history[0][0]
+        for i in range(len(self.history) - 1, 0, -1):
+            if self.history[i - 1][1].get(phase, [0])[0] != done:
+                last_change = self.history[i][0]
+                break
+        stalled = counts[phase][1] > 0 and self.now - last_change >= self.stall_after
+        return rate, stalled
+
+    def progress(self) -> List[PhaseProgress]:
+        if not self.history:
+            return []
+        _, counts = self.history[-1]
+        progress = []
+        for phase in PhPhases:
+            if phase.name not in counts:
+                continue
+            rate, stalled = self._rate(phase.name)
+            done, running, waiting, failed = counts[phase.name]
+            progress.append(
+                PhaseProgress(phase, done, running, waiting, failed, rate, stalled)
+            )
+        return progress
+
+    def report(self) -> str:
+        if not self.history:
+            return "No status recorded yet"
+        timestamp = time.strftime(
+            "%Y-%m-%d %H:%M:%S", time.localtime(self.now)
+        )
+        lines = [f"Status at {timestamp}", self.HEADER]
+        lines.extend(str(p) for p in self.progress())
+        return "\n".join(lines)
+
+    def watch(self, interval: float) -> None:
+        """Poll the status file every `interval` seconds until interrupted.
+        Polling is cheap: the file is only parsed when its mtime or size change"""
+        self.update()
+        print(self.report() + "\n", flush=True)
+        try:
+            while True:
+                time.sleep(interval)
+                if self.update():
+                    print(self.report() + "\n", flush=True)
+        except KeyboardInterrupt:
+            pass
@@ -7,6 +7,18 @@ from madminer_dag.utils import validate_var
 
 
 class Node:
+    __slots__ = (
+        "name",
+        "script",
+        "children",
+        "_job",
+        "_vars",
+        "_post",
+        "_pre",
+        "_category",
+        "_priority",
+    )
+
     def __init__(self, name: str, script: str, type: NodeType = NodeType.JOB):
         self.name = name
         self.script = script
@@ -15,6 +27,8 @@ class Node:
         self._vars = ""
         self._post = ""
         self._pre = ""
+        self._category = ""
+        self._priority = ""
 
     def _create_script(self, type: ScriptType, script: str, args: List[Any]) -> str:
         arguments = [str(a) for a in args]
@@ -30,8 +44,21 @@ class Node:
     def add_pre(self, script: str, args: List[Any]) -> None:
         self._pre = self._create_script(ScriptType.PRE, script, args)
 
+    def set_category(self, category: str) -> None:
+        self._category = f"CATEGORY {self.name} {category}\n"
+
+    def set_priority(self, priority: int) -> None:
+        self._priority = f"PRIORITY {self.name} {priority}\n"
+
     def add_child(self, node: Node) -> None:
         self.children.append(node)
 
     def __str__(self):
-        return self._job + self._vars + self._pre + self._post
+        return (
+            self._job
+            + self._vars
+            + self._pre
+            + self._post
+            + self._category
+            + self._priority
+        )
@@ -1,17 +1,26 @@
+import os
 import re
 from dataclasses import dataclass
-from typing import List, Optional
+from typing import Iterator, List, Optional, Tuple
 
 from madminer_dag.schemas import NodeStatus, PhPhases, StatusNodeType
+from madminer_dag.typing import PathLike
 
 str2phase = {
     "RUN_SETUP": PhPhases.SETUP,
     "PREPARE_GENERATION": PhPhases.PREPARE_GENERATION,
     "RUN_GENERATION": PhPhases.RUN_GENERATION,
     "RUN_DELPHES": PhPhases.RUN_DELPHES,
+    # Prepare generation, generation and Delphes in one node (fused layout)
+    "RUN_FUSED": PhPhases.RUN_DELPHES,
     "RUN_ANALYSIS": PhPhases.RUN_ANALYSIS,
     "RUN_AUGMENTATION": PhPhases.RUN_AUGMENTATION,
 }
+PHASE_RGX = re.compile("|".join(str2phase))
+
+
+def run_id_of(name: str) -> int:
+    return int(name.rsplit("_", 1)[-1])
 
 
 @dataclass
@@ -21,14 +30,12 @@ class Node:
 
     @property
     def id(self) -> int:
-        return int(self.name.rsplit("_", 1)[-1])
+        return run_id_of(self.name)
 
     @property
     def phase(self) -> Optional[int]:
-        for key, value in str2phase.items():
-            if key in self.name.upper():
-                return value
-        return None
+        m = PHASE_RGX.search(self.name.upper())
+        return str2phase[m.group(0)] if m else None
 
 
 @dataclass
@@ -39,51 +46,80 @@ class PhaseNode:
 
 
 class NodeStatusParser:
+    """Single pass parser of the DAGMan node status file. Blocks are read
+    line by line and only `NodeStatus` blocks are turned into `Node`s"""
 
-    BLOCK_RGX = re.compile(r"\[(.*?)\]", flags=re.DOTALL)
     TYPE_RGX = re.compile(r"Type = \"(\w*)\"")
     STATUS_RGX = re.compile(r"NodeStatus = (\d)")
     NAME_RGX = re.compile(r"Node = \"(.*)\"")
 
-    def __init__(self, status_lines: List[str], phase: int) -> None:
-        self._status_lines = status_lines
+    def __init__(self, status_file: PathLike, phase: Optional[int] = None) -> None:
+        self.status_file = status_file
         self.from_phase = phase
+        self._stamp: Optional[Tuple[int, int]] = None
+        self._nodes: List[Node] = []
 
-    @staticmethod
-    def get_match(regex: re.Pattern, string: str) -> str:
-        m = re.search(regex, string)
-        if not m:
-            raise ValueError
-        return m.group(1)
+    def stamp(self) -> Tuple[int, int]:
+        st = os.stat(self.status_file)
+        return st.st_mtime_ns, st.st_size
 
-    @staticmethod
-    def parse_lines(lines: List[str]) -> str:
-        return "\n".join(l.partition(";")[0].rstrip() for l in lines)
+    def changed(self) -> bool:
+        """Whether the status file changed since it was last fully parsed"""
+        return self._stamp is None or self._stamp != self.stamp()
 
-    @classmethod
-    def parse_status_blocks(cls, status_str: str) -> List[str]:
-        return re.findall(cls.BLOCK_RGX, status_str)
+    def iter_nodes(self) -> Iterator[Node]:
+        """Lazily yield the nodes in the status file, in file order"""
+        with open(self.status_file, "r") as f:
+            yield from self.parse(f)
 
     @classmethod
-    def parse_block(cls, block: str) -> Node:
-        node_type = cls.get_match(cls.TYPE_RGX, block)
-
-        if node_type != StatusNodeType.STATUS_NODE:
-            return Node("", None)
-
-        node_name = cls.get_match(cls.NAME_RGX, block)
-        node_status = int(cls.get_match(cls.STATUS_RGX, block))
-        return Node(node_name, node_status)  # type: ignore
+    def parse(cls, lines: Iterator[str]) -> Iterator[Node]:
+        in_block = False
+        node_type = name = status = None
+        for line in lines:
+            line = line.partition(";")[0].strip()
+            if not in_block:
+                if line == "[":
+                    in_block = True
+                    node_type = name = status = None
+                continue
+
+            if line == "]":
+                in_block = False
+                if node_type == StatusNodeType.STATUS_NODE:
+                    if name is None or status is None:
+                        raise ValueError(f"Incomplete node status block: {name}")
+                    yield Node(name, NodeStatus(status))
+                continue
+
+            # Fields may come in any order, and each one is matched only once
+            if node_type is None:
+                m = cls.TYPE_RGX.match(line)
+                if m:
+                    node_type = m.group(1)
+                    continue
+            if name is None:
+                m = cls.NAME_RGX.match(line)
+                if m:
+                    name = m.group(1)
+                    continue
+            if status is None:
+                m = cls.STATUS_RGX.match(line)
+                if m:
+                    status = int(m.group(1))
 
     def all_nodes(self) -> List[Node]:
-        return [
-            self.parse_block(b)
-            for b in self.parse_status_blocks(self.parse_lines(self._status_lines))
-        ]
+        """All nodes in the status file. The file is only parsed again if its
+        modification time or size changed since the last call"""
+        stamp = self.stamp()
+        if stamp != self._stamp:
+            self._nodes = list(self.iter_nodes())
+            self._stamp = stamp
+        return self._nodes
 
     def phase_nodes(self) -> List[PhaseNode]:
         return [
-            PhaseNode(name=n.name, status=n.status, phase=n.phase)
+            PhaseNode(name=n.name, status=n.status, phase=n.phase)  # type: ignore
             for n in self.all_nodes()
             if n.status is not None and n.phase is not None
         ]
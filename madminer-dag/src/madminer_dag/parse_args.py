@@ -3,7 +3,13 @@ import sys
 from pathlib import Path
 from typing import List
 
-from madminer_dag.parse_utils import Args, parse_create, parse_redo
+from madminer_dag.parse_utils import (
+    Args,
+    parse_create,
+    parse_redo,
+    parse_run_local,
+    parse_status,
+)
 
 
 def parse_args(args: List[str]) -> Args:
@@ -17,8 +23,18 @@ def parse_args(args: List[str]) -> Args:
         "--config-dir",
         dest="config_dir",
         required=True,
+        nargs="+",
         type=Path,
-        help="Path to the experiment config folder.",
+        help="Path to the experiment config folder. With several folders, a single "
+        "DAG is created where processes with the same inputs are generated once for "
+        "all the experiments listing them",
+    )
+    create.add_argument(
+        "-n",
+        "--name",
+        default=None,
+        help="Name of the dag folder (by default the config folder names, joined "
+        "with '-')",
     )
     create.add_argument(
         "-v",
@@ -27,6 +43,27 @@ def parse_args(args: List[str]) -> Args:
         type=Path,
         help="Name of the file to store global macros",
     )
+    create.add_argument(
+        "-i",
+        "--incremental",
+        action="store_true",
+        help="Keep the existing dag folder and only rewrite the DAG files that changed",
+    )
+    create.add_argument(
+        "-s",
+        "--seed",
+        type=int,
+        default=None,
+        help="Base random seed of the experiments without `seed` in dag.yml (by "
+        "default a new one, or the one of the existing DAG with --incremental)",
+    )
+    create.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        help="Number of threads used to render and write the sub-DAG files",
+    )
 
     create.set_defaults(func=parse_create)
 
@@ -38,20 +75,104 @@ def parse_args(args: List[str]) -> Args:
         help="Experimet DAG folder with the required files",
         required=True,
     )
-    redo.add_argument(
+    redo_mode = redo.add_mutually_exclusive_group(required=True)
+    redo_mode.add_argument(
         "-p",
         "--from-phase",
         dest="from_phase",
         type=str,
-        required=True,
         choices=("delphes", "analysis", "augmentation"),
         help="Phase to redo existing dag from",
     )
+    redo_mode.add_argument(
+        "--failed-only",
+        dest="failed_only",
+        action="store_true",
+        help="Redo only failed (or futile) nodes and the nodes that depend on them",
+    )
+    redo_mode.add_argument(
+        "--auto",
+        action="store_true",
+        help="Redo only the nodes whose inputs (cards, config files) changed since "
+        "the DAG was created, and the nodes that depend on them",
+    )
+    redo.add_argument(
+        "-c",
+        "--config-dir",
+        dest="config_dir",
+        type=Path,
+        default=None,
+        help="Config folder for --auto (defaults to the one used to create the DAG)",
+    )
     redo.add_argument(
         "--rescue", type=int, default=1, help="Rescue number for the created file"
     )
     redo.set_defaults(func=parse_redo)
 
+    status = subparsers.add_parser("status")
+    status.add_argument(
+        "-e",
+        "--experiment",
+        type=Path,
+        help="Experimet DAG folder with the required files",
+        required=True,
+    )
+    status.add_argument(
+        "-w",
+        "--watch",
+        action="store_true",
+        help="Keep polling the status file and print progress on every update",
+    )
+    status.add_argument(
+        "--interval",
+        type=float,
+        default=45.0,
+        help="Seconds between polls of the status file",
+    )
+    status.add_argument(
+        "--window",
+        type=float,
+        default=3600.0,
+        help="Seconds of history used to compute completion rates",
+    )
+    status.add_argument(
+        "--stall-after",
+        dest="stall_after",
+        type=float,
+        default=1800.0,
+        help="Flag a phase as stalled after these many seconds without progress",
+    )
+    status.set_defaults(func=parse_status)
+
+    run_local = subparsers.add_parser("run-local")
+    run_local.add_argument(
+        "-e",
+        "--experiment",
+        type=Path,
+        help="Experimet DAG folder created with `create`",
+        required=True,
+    )
+    run_local.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=None,
+        help="Number of jobs running at once (defaults to the number of CPUs)",
+    )
+    run_local.add_argument(
+        "--rescue",
+        type=int,
+        default=None,
+        help="Skip the nodes marked as DONE in this rescue file (see `redo`)",
+    )
+    run_local.add_argument(
+        "--dry-run",
+        dest="dry_run",
+        action="store_true",
+        help="Print the nodes in execution order without running them",
+    )
+    run_local.set_defaults(func=parse_run_local)
+
     arguments = parser.parse_args(args)
 
     try:
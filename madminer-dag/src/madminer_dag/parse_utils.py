@@ -1,10 +1,11 @@
 import argparse
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Any, Dict, List, Union
+from typing import Any, Dict, List, Optional, Tuple, Union
 
 import yaml
 
+from madminer_dag.manifest import Manifest
 from madminer_dag.schemas import PhPhases
 
 
@@ -19,6 +20,7 @@ class ExperimentDir:
     name: Path
     status_file: Path
     dag_file: Path
+    manifest_file: Optional[Path] = None
 
 
 @dataclass
@@ -27,17 +29,48 @@ class CreateArgs:
     name: Path
     dag_conf: Path
     gvars: Path
+    incremental: bool = False
+    jobs: int = 1
+    config_dir: Optional[Path] = None
+    seed: Optional[int] = None
+    # (configuration, config folder) of the other experiments of the DAG
+    shared: List[Tuple[Dict[str, Any], Path]] = field(default_factory=list)
 
 
 @dataclass
 class RedoArgs:
     dirname: Path
-    status_lines: List[str]
-    phase: PhPhases
+    status_file: Path
+    phase: Optional[PhPhases]
     rescue: int
+    failed_only: bool = False
+    auto: bool = False
+    manifest_file: Optional[Path] = None
+    # Current configuration, to compare inputs against with `--auto`
+    conf: Optional[Dict[str, Any]] = None
+    shared: List[Tuple[Dict[str, Any], Path]] = field(default_factory=list)
+
+
+@dataclass
+class StatusArgs:
+    status_file: Path
+    history_file: Path
+    watch: bool
+    interval: float
+    window: float
+    stall_after: float
+    manifest_file: Optional[Path] = None
 
 
-Args = Union[CreateArgs, RedoArgs]
+@dataclass
+class RunLocalArgs:
+    dag_file: Path
+    jobs: Optional[int]
+    rescue_file: Optional[Path]
+    dry_run: bool
+
+
+Args = Union[CreateArgs, RedoArgs, StatusArgs, RunLocalArgs]
 
 
 def ensure_config_dir(config_dir: Path) -> ConfigDir:
@@ -62,17 +95,28 @@ def ensure_config_dir(config_dir: Path) -> ConfigDir:
 
 
 def parse_create(arguments: argparse.Namespace) -> CreateArgs:
-    config_dir = Path(arguments.config_dir)
-    if not config_dir.exists() or not config_dir.is_dir():
-        raise ValueError(f"Invalid experiment dir {config_dir}")
-
-    config = ensure_config_dir(config_dir)
+    config_dirs = [Path(d) for d in arguments.config_dir]
+    for config_dir in config_dirs:
+        if not config_dir.exists() or not config_dir.is_dir():
+            raise ValueError(f"Invalid experiment dir {config_dir}")
+    if arguments.jobs < 1:
+        raise ValueError(f"Invalid number of jobs {arguments.jobs}")
+    if arguments.seed is not None and arguments.seed < 0:
+        raise ValueError(f"Invalid seed {arguments.seed}")
+
+    configs = [ensure_config_dir(config_dir) for config_dir in config_dirs]
+    name = arguments.name or "-".join(config_dir.stem for config_dir in config_dirs)
 
     return CreateArgs(
-        conf=config.conf_yml,
-        name=Path("dag", config_dir.stem, config_dir.stem + ".dag"),
-        dag_conf=config.dag_conf,
+        conf=configs[0].conf_yml,
+        name=Path("dag", name, name + ".dag"),
+        dag_conf=configs[0].dag_conf,
         gvars=arguments.vars,
+        incremental=arguments.incremental,
+        jobs=arguments.jobs,
+        config_dir=config_dirs[0],
+        seed=arguments.seed,
+        shared=[(c.conf_yml, d) for c, d in zip(configs[1:], config_dirs[1:])],
     )
 
 
@@ -81,7 +125,14 @@ def ensure_experiment_dir(experiment_dir: Path):
     dag_file = experiment_dir / (experiment_dir.stem + ".dag")
     if not status_file.exists() or not dag_file.exists():
         raise FileNotFoundError(f"Missing either {status_file} or {dag_file}")
-    return ExperimentDir(experiment_dir, status_file, dag_file)
+    # DAG folders created before manifests existed don't have one
+    manifest_file = Path(str(dag_file) + ".manifest.json")
+    return ExperimentDir(
+        experiment_dir,
+        status_file,
+        dag_file,
+        manifest_file if manifest_file.exists() else None,
+    )
 
 
 str2phase = {
@@ -93,11 +144,65 @@ str2phase = {
 
 def parse_redo(arguments: argparse.Namespace) -> RedoArgs:
     experimet_dir = ensure_experiment_dir(arguments.experiment)
-    with open(experimet_dir.status_file, "r") as f:
-        status_lines = f.readlines()
+
+    conf = None
+    shared = []
+    if arguments.auto:
+        if experimet_dir.manifest_file is None:
+            raise FileNotFoundError(
+                f"No manifest in {experimet_dir.name}, create the DAG again"
+            )
+        config_dir = arguments.config_dir
+        if config_dir is None:
+            config_dir = Manifest.load(experimet_dir.manifest_file).config_dir
+        if config_dir is None:
+            raise ValueError("Unknown config dir, pass it with --config-dir")
+        conf = ensure_config_dir(Path(config_dir)).conf_yml
+        shared = [
+            (ensure_config_dir(Path(d)).conf_yml, Path(d))
+            for d in Manifest.load(experimet_dir.manifest_file).shared_config_dirs
+        ]
+
     return RedoArgs(
         experimet_dir.name,
-        status_lines,
-        str2phase[arguments.from_phase],
+        experimet_dir.status_file,
+        str2phase[arguments.from_phase] if arguments.from_phase else None,
         arguments.rescue,
+        arguments.failed_only,
+        arguments.auto,
+        experimet_dir.manifest_file,
+        conf,
+        shared,
+    )
+
+
+def parse_status(arguments: argparse.Namespace) -> StatusArgs:
+    experimet_dir = ensure_experiment_dir(arguments.experiment)
+    if arguments.interval <= 0:
+        raise ValueError(f"Invalid polling interval {arguments.interval}")
+    return StatusArgs(
+        status_file=experimet_dir.status_file,
+        history_file=experimet_dir.dag_file.with_suffix(".dag.history"),
+        watch=arguments.watch,
+        interval=arguments.interval,
+        window=arguments.window,
+        stall_after=arguments.stall_after,
+        manifest_file=experimet_dir.manifest_file,
     )
+
+
+def parse_run_local(arguments: argparse.Namespace) -> RunLocalArgs:
+    experiment_dir = Path(arguments.experiment)
+    dag_file = experiment_dir / (experiment_dir.stem + ".dag")
+    if not dag_file.exists():
+        raise FileNotFoundError(f"Missing {dag_file}")
+    if arguments.jobs is not None and arguments.jobs < 1:
+        raise ValueError(f"Invalid number of jobs {arguments.jobs}")
+
+    rescue_file = None
+    if arguments.rescue is not None:
+        rescue_file = Path(str(dag_file) + f".rescue{arguments.rescue:03d}")
+        if not rescue_file.exists():
+            raise FileNotFoundError(f"Missing {rescue_file}")
+
+    return RunLocalArgs(dag_file, arguments.jobs, rescue_file, arguments.dry_run)
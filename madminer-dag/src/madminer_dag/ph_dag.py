@@ -1,21 +1,115 @@
 from __future__ import annotations
 
+import json
+import re
+import secrets
 import shutil
+import time
+from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Any, Dict, Optional
+from typing import Any, Dict, List, Optional, Sequence, Tuple
 
-from madminer_dag.dag import DAG
+from madminer_dag.cards import CardRenderer
+from madminer_dag.dag import DAG, WriteReport
+from madminer_dag.inputs import InputHasher
+from madminer_dag.manifest import Manifest, ManifestNode
 from madminer_dag.node import Node
-from madminer_dag.schemas import PhPhases
+from madminer_dag.schemas import NodeType, PhPhases
 from madminer_dag.typing import PathLike
 
 __all__ = ["PhMetaDAG"]
 
+# Keys of a process read by the jobs preparing its process directory
+PREPARATION_VARS = (
+    "cards_dir",
+    "proc_card",
+    "param_card",
+    "pythia_card",
+    "benchmark",
+    "proc_dir",
+)
+
+
+@dataclass
+class Experiment:
+    """An experiment of the DAG. `name` tells apart the nodes of experiments
+    sharing a DAG and is empty when there is only one"""
+
+    name: str
+    conf: Dict[str, Any]
+    config_dir: Optional[str] = None
+    gvars_filename: Optional[Path] = None
+    gvars: Dict[str, Any] = field(default_factory=dict)
+
+    def node_name(self, prefix: str, id: Optional[int] = None) -> str:
+        suffix = "" if id is None else str(id)
+        return "_".join(p for p in (prefix, self.name, suffix) if p)
+
+
+@dataclass
+class Consumer:
+    """Experiment analysing some of the runs of a subdag"""
+
+    experiment: Optional[Experiment]
+    runs: List[int]
+
+
+@dataclass
+class Sample:
+    """Process generated once for all the experiments listing it with the same
+    inputs (see `InputHasher.sample`), by the first of them"""
+
+    experiment: Experiment
+    process_idx: int
+    process: Dict[str, Any]
+    # Experiments listing the process, with the number of runs they asked for
+    consumers: List[Tuple[Experiment, int]] = field(default_factory=list)
+
+    @property
+    def runs(self) -> int:
+        return max(n for _, n in self.consumers)
+
 
 class PhDAG(DAG):
-    def __init__(self, id: int, dirname: PathLike, **kwds):
+    LAYOUTS = ("split", "fused")
+    # request_cpus, request_disk (GB) and request_memory (GB) of one run, the
+    # defaults of the submit files. Nodes running `parallel_runs` runs at once
+    # ask for as many times these (runs remove their scratch space when they end)
+    RESOURCES = {
+        "submit/prepare_generation.sub": (2, 2, 1),
+        "submit/run_generation.sub": (2, 10, 8),
+        "submit/run_delphes.sub": (2, 20, 1),
+        "submit/run_fused.sub": (2, 30, 8),
+        "submit/run_analysis.sub": (2, 8, 1),
+    }
+
+    def __init__(
+        self,
+        id: int,
+        dirname: PathLike,
+        layout: str = "split",
+        runs: Optional[List[int]] = None,
+        parallel_runs: int = 1,
+        consumers: Optional[List[Consumer]] = None,
+        **kwds,
+    ) -> None:
         super().__init__(Path(dirname) / f"{id}.dag", **kwds)
+        if layout not in self.LAYOUTS:
+            raise ValueError(f"Invalid layout: {layout}. Valid are: {self.LAYOUTS}")
         self.id = id
+        self.layout = layout
+        # Runs packed in every node of the subdag (see `scripts/run_packed`)
+        self.runs = runs if runs is not None else [id]
+        self.parallel_runs = parallel_runs
+        # Every experiment using the runs gets its own analysis node
+        self.consumers = (
+            consumers if consumers is not None else [Consumer(None, self.runs)]
+        )
+        # Analysis node name -> consumer
+        self.analyses: Dict[str, Consumer] = {}
+        # Log folders of the nodes that must exist before submission
+        self.log_dirs: List[Path] = []
+        self.node_phases: Dict[str, PhPhases] = {}
         self.phases = {
             PhPhases.PREPARE_GENERATION: self.add_prepare_generation,
             PhPhases.RUN_GENERATION: self.add_run_generation,
@@ -23,35 +117,41 @@ class PhDAG(DAG):
             PhPhases.RUN_ANALYSIS: self.add_run_analysis,
         }
 
+    def vars_of(self, runs: List[int], script: str) -> Dict[str, Any]:
+        """VARS of the node of `script` running `runs`"""
+        run_vars: Dict[str, Any] = {"ngen": ",".join(str(r) for r in runs)}
+        parallel = min(len(runs), self.parallel_runs)
+        if parallel > 1:
+            run_vars["parallel_runs"] = self.parallel_runs
+            cpus, disk, memory = self.RESOURCES[script]
+            run_vars["slot_cpus"] = cpus * parallel
+            run_vars["slot_disk"] = f"{disk * parallel}GB"
+            run_vars["slot_memory"] = f"{memory * parallel}GB"
+        return run_vars
+
+    def preparation_vars(self, script: str, process: Dict[str, Any]) -> Dict[str, Any]:
+        """VARS of the nodes preparing the process directory of the runs: the
+        keys of the process they read, and those of the runs (which win)"""
+        process_vars = {k: process[k] for k in PREPARATION_VARS if k in process}
+        return {**process_vars, **self.vars_of(self.runs, script)}
+
     def add_prepare_generation(
         self, parent_node: Optional[Node] = None, **kwds
     ) -> Node:
         node = Node(
             name=f"PREPARE_GENERATION_{self.id}", script="submit/prepare_generation.sub"
         )
-        job_vars = [
-            "cards_dir",
-            "proc_card",
-            "run_card",
-            "param_card",
-            "pythia_card",
-            "benchmark",
-            "proc_dir",
-        ]
-        node.add_vars({k: v for k, v in kwds.items() if k in job_vars})
-        node.add_post(
-            script="scripts/POST_prepare_generation",
-            args=[
-                self.id,
-                "$JOBID",
-                kwds["proc_dir"],
-                kwds["n_subprocesses"],
-                kwds["benchmark"],
-                kwds["reweight_card_insert"],
-                kwds["tmp_dir"],
-                self.filename.parent,
-            ],
-        )
+        # The run card and reweight card insert are rendered per run at creation
+        # time (see `CardRenderer`), under `LOG_DIR/cards/<run>`
+        node.add_vars(self.preparation_vars(node.script, kwds))
+        self.add_node(node, from_parent=parent_node)
+        return node
+
+    def add_run_fused(self, parent_node: Optional[Node] = None, **kwds) -> Node:
+        """Prepare generation, run generation and Delphes in one job, in the
+        scratch space of the node. Only the LHE and ROOT files are shipped out"""
+        node = Node(name=f"RUN_FUSED_{self.id}", script="submit/run_fused.sub")
+        node.add_vars(self.preparation_vars(node.script, kwds))
         self.add_node(node, from_parent=parent_node)
         return node
 
@@ -59,20 +159,38 @@ class PhDAG(DAG):
         node = Node(
             name=f"RUN_GENERATION_{self.id}", script="submit/run_generation.sub"
         )
-        node.add_vars({"ngen": self.id})
+        node.add_vars(self.vars_of(self.runs, node.script))
         self.add_node(node, from_parent=parent_node)
         return node
 
     def add_run_delphes(self, parent_node: Optional[Node] = None, **kwds) -> Node:
         node = Node(name=f"RUN_DELPHES_{self.id}", script="submit/run_delphes.sub")
-        node.add_vars({"ngen": self.id})
+        node.add_vars(self.vars_of(self.runs, node.script))
         self.add_node(node, from_parent=parent_node)
         return node
 
     def add_run_analysis(self, parent_node: Optional[Node] = None, **kwds) -> Node:
-        node = Node(name=f"RUN_ANALYSIS_{self.id}", script="submit/run_analysis.sub")
-        node.add_vars({"ngen": self.id})
-        self.add_node(node, from_parent=parent_node)
+        node = None
+        for consumer in self.consumers:
+            experiment = consumer.experiment
+            name = f"RUN_ANALYSIS_{self.id}"
+            node_vars = self.vars_of(consumer.runs, "submit/run_analysis.sub")
+            if experiment is not None and experiment.name:
+                # Experiments sharing the runs analyse them with their own
+                # observables, setup file and output folder. The ledger and the
+                # ROOT files are those of the experiment generating the runs
+                name = experiment.node_name("RUN_ANALYSIS", self.id)
+                conf = experiment.conf
+                node_vars.update(
+                    {k: conf[k] for k in ("observables", "setup_file", "h5_dir")}
+                )
+                node_vars["log_dir"] = self.dirname / experiment.name
+                self.log_dirs.append(node_vars["log_dir"])
+            node = Node(name=name, script="submit/run_analysis.sub")
+            node.add_vars(node_vars)
+            self.add_node(node, from_parent=parent_node)
+            self.analyses[node.name] = consumer
+        assert node is not None, f"No experiment analyses the runs of {self.name}"
         return node
 
     def add_from_phase(self, phase: PhPhases, **kwds) -> None:
@@ -80,49 +198,226 @@ class PhDAG(DAG):
             raise ValueError(
                 f"Invalid phase: {phase}. Valid phases are: {self.phases.keys()}"
             )
-        parent_node = self.phases[phase](parent_node=None, **kwds)
+        if self.layout == "fused" and phase <= PhPhases.RUN_DELPHES:
+            # Recorded as the last phase it runs, so that redoing from analysis
+            # marks it as done
+            parent_node = self.add_run_fused(parent_node=None, **kwds)
+            phase = PhPhases.RUN_DELPHES
+        else:
+            parent_node = self.phases[phase](parent_node=None, **kwds)
+        self.set_phase(phase)
         for i in range(phase + 1, max(self.phases) + 1):
             node = self.phases[i](parent_node=parent_node, **kwds)  # type: ignore
+            self.set_phase(PhPhases(i))
             parent_node = node
 
+    def set_phase(self, phase: PhPhases) -> None:
+        """Record the phase of the nodes just added (a phase may add several,
+        e.g. one analysis per experiment)"""
+        for name in self._nodes:
+            self.node_phases.setdefault(name, phase)
+
+    def remaining(self, downstream: int = 0) -> Dict[str, int]:
+        """Node name -> number of nodes on the longest path from the node to the
+        end of the DAG, `downstream` being the nodes after this subdag"""
+        remaining: Dict[str, int] = {}
+        # Nodes are added after their parents
+        for node in reversed(self.nodes):
+            remaining[node.name] = 1 + max(
+                (remaining.get(c.name, downstream) for c in node.children),
+                default=downstream,
+            )
+        return remaining
+
 
 class PhMetaDAG(DAG):
-    def __init__(self, filename: PathLike, conf: Dict[str, Any], **kwds) -> None:
+
+    HASHES_FILENAME = ".dag.hashes.json"
+    # Phases that can be throttled with the `maxjobs` section of `dag.yml`
+    THROTTLED_PHASES = (
+        PhPhases.PREPARE_GENERATION,
+        PhPhases.RUN_GENERATION,
+        PhPhases.RUN_DELPHES,
+        PhPhases.RUN_ANALYSIS,
+    )
+
+    def __init__(
+        self,
+        filename: PathLike,
+        conf: Dict[str, Any],
+        config_dir: Optional[PathLike] = None,
+        shared: Sequence[Tuple[Dict[str, Any], PathLike]] = (),
+        seed: Optional[int] = None,
+        **kwds,
+    ) -> None:
+        """`shared` are the configurations (and config folders) of other
+        experiments in the same DAG. Their processes with the same inputs as
+        those of an earlier experiment are generated once, and analysed by
+        every experiment listing them. DAG wide settings (`maxjobs`, `layout`,
+        `runs_per_job` and `parallel_runs`) are those of `conf`. `seed` is the
+        base seed of the experiments without `seed`, a new one if not given"""
         super().__init__(filename, **kwds)
-        self._conf = self.preprocess_conf(conf)
-        self.gvars_filename = None
-        self.gvars = {}
+        # Experiments without `seed` take the one of the DAG, so that they share
+        # samples with each other but not with other DAGs (or creations of it)
+        self.seed = seed if seed is not None else self.new_seed()
+        self._conf = self.preprocess_conf(conf, self.seed)
+        self.maxjobs = self.parse_maxjobs(conf.get("maxjobs"))
+        self.layout = conf.get("layout", "split")
+        self.runs_per_job = self.positive(conf, "runs_per_job")
+        self.parallel_runs = self.positive(conf, "parallel_runs")
+        self.cards = CardRenderer(seed=self._conf["seed"])
+        self.config_dir = str(config_dir) if config_dir is not None else None
+        self.shared_config_dirs = [str(d) for _, d in shared]
+        self.experiments = [Experiment("", self._conf, self.config_dir)]
+        if shared:
+            self.experiments = [
+                Experiment(self.experiment_name(d), c, str(d))
+                for c, d in [(self._conf, config_dir)]
+                + [(self.preprocess_conf(c, self.seed), d) for c, d in shared]
+            ]
+            self.validate_experiments()
+        self._samples: List[Sample] = []
+        # (subdag, generating experiment, process index, process config) for
+        # every run
+        self._ph_subdags: List[Tuple[PhDAG, Experiment, int, Dict[str, Any]]] = []
+
+    @property
+    def hashes_filename(self) -> Path:
+        return self.dirname / self.HASHES_FILENAME
+
+    @property
+    def manifest_filename(self) -> Path:
+        return Path(str(self.filename) + ".manifest.json")
 
     @staticmethod
-    def preprocess_conf(conf: Dict[str, Any]) -> Dict[str, Any]:
+    def preprocess_conf(conf: Dict[str, Any], seed: int) -> Dict[str, Any]:
         conf["setup_file"] = str(Path(conf["setup_dir"]) / conf["setup_file"])
+        conf["seed"] = int(conf.get("seed", seed))
         return conf
 
+    @staticmethod
+    def new_seed() -> int:
+        # A multiple of 10000 below 9e8, leaving room for the seeds of the runs and
+        # subprocesses (`seed + run * n_subprocesses`) within the 9 digits of iseed
+        return secrets.randbelow(90000) * 10000
+
+    @staticmethod
+    def experiment_name(config_dir: Optional[PathLike]) -> str:
+        if config_dir is None:
+            raise ValueError("Experiments sharing a DAG need a config folder")
+        # Used in node names
+        return re.sub(r"\W", "_", Path(config_dir).name)
+
+    def validate_experiments(self) -> None:
+        names = [e.name for e in self.experiments]
+        if len(set(names)) != len(names):
+            raise ValueError(f"Duplicated experiments: {names}")
+        # The setup of every experiment empties these folders
+        for key in ("log_dir", "setup_dir", "tmp_dir", "processes_dir", "h5_dir"):
+            values = [str(e.conf[key]) for e in self.experiments]
+            if len(set(values)) != len(values):
+                raise ValueError(f"Experiments sharing a DAG need different {key}")
+
+    @classmethod
+    def parse_maxjobs(cls, maxjobs: Optional[Dict[str, Any]]) -> Dict[PhPhases, int]:
+        valid = {phase.name.lower(): phase for phase in cls.THROTTLED_PHASES}
+        parsed = {}
+        for name, n in (maxjobs or {}).items():
+            if name not in valid:
+                raise ValueError(
+                    f"Invalid phase in maxjobs: {name}. Valid phases are: {list(valid)}"
+                )
+            if int(n) < 1:
+                raise ValueError(f"Invalid maxjobs for {name}: {n}")
+            parsed[valid[name]] = int(n)
+        return parsed
+
+    @staticmethod
+    def positive(conf: Dict[str, Any], key: str) -> int:
+        value = int(conf.get(key, 1))
+        if value < 1:
+            raise ValueError(f"Invalid {key}: {value}")
+        return value
+
+    @staticmethod
+    def category(phase: PhPhases) -> str:
+        # The leading `+` makes the category global across splices
+        return f"+{phase.name}"
+
     @staticmethod
     def get_proc_dir(base_dir: PathLike, cards_dir: PathLike, benchmark: str) -> Path:
         cdir = str(Path(cards_dir).name)
         return Path(base_dir) / (cdir + "_" + benchmark)
 
-    def init_directory(self) -> None:
-        if self.dirname.exists() and self.dirname.is_dir():
+    def init_directory(self, incremental: bool = False) -> None:
+        if not incremental and self.dirname.exists() and self.dirname.is_dir():
             shutil.rmtree(self.dirname)
         self.dirname.mkdir(parents=True, exist_ok=True)
 
+    def load_hashes(self) -> Dict[str, str]:
+        if not self.hashes_filename.exists():
+            return {}
+        with open(self.hashes_filename, "r") as f:
+            return json.load(f)
+
+    def save_hashes(self, hashes: Dict[str, str]) -> None:
+        with open(self.hashes_filename, "w") as f:
+            json.dump(hashes, f, indent=0, sort_keys=True)
+
+    def remove_orphans(self, hashes: Dict[str, str]) -> int:
+        """Remove run directories (and their hashes) not part of this DAG anymore"""
+        dags = list(self.iter_dags())
+        run_dirs = {dag.dirname for dag in dags}
+        removed = 0
+        for path in self.dirname.iterdir():
+            if path.is_dir() and path.name.isdigit() and path not in run_dirs:
+                shutil.rmtree(path)
+                removed += 1
+
+        filenames = {str(dag.filename) for dag in dags}
+        for key in [k for k in hashes if k not in filenames]:
+            del hashes[key]
+        return removed
+
     def run(
         self,
         gvars_filename: str = "global.vars.dag",
         dag_conf: Optional[PathLike] = None,
-    ) -> None:
-        self.init_directory()
+        incremental: bool = False,
+        jobs: int = 1,
+    ) -> WriteReport:
+        start = time.perf_counter()
+        self.init_directory(incremental=incremental)
+        self.build(gvars_filename=gvars_filename, dag_conf=dag_conf)
+        built = time.perf_counter()
 
+        hashes = self.load_hashes() if incremental else {}
+        removed = self.remove_orphans(hashes) if incremental else 0
+        report = self.write(hashes=hashes, jobs=jobs)
+        for subdag, *_ in self._ph_subdags:
+            for log_dir in subdag.log_dirs:
+                log_dir.mkdir(parents=True, exist_ok=True)
+        report.removed = removed
+        report.cards, report.timings["cards"] = self.cards.write(jobs=jobs)
+        self.save_hashes(hashes)
+        self.build_manifest().save(self.manifest_filename)
+        report.timings = {"build": built - start, **report.timings}
+        return report
+
+    def build(
+        self,
+        gvars_filename: str = "global.vars.dag",
+        dag_conf: Optional[PathLike] = None,
+    ) -> PhMetaDAG:
+        """Add all the nodes and subdags to the DAG, without touching the disk"""
         # 1. Add Config
         if dag_conf:
             self.add(f"CONFIG {dag_conf}")
+        for phase, n in self.maxjobs.items():
+            self.add(f"MAXJOBS {self.category(phase)} {n}")
 
-        # 2. Add global variables (across all DAGs)
+        # 2. Add global variables (across all DAGs), one file per experiment
         # NOTE: DON'T include them in MetaDAG (naming collisions)
-        self.gvars_filename = self.dirname / gvars_filename
-        gvars_subdag = DAG(filename=self.gvars_filename)
 
         # gvars_keys = [
         #     "setup_file",
@@ -137,27 +432,204 @@ class PhMetaDAG(DAG):
         #     "root_files_dir",
         # ]
 
-        self.gvars = {k: v for k, v in self._conf.items() if isinstance(v, str)}
-        gvars_subdag.add_global_vars(self.gvars)
-        self.add_subdag(gvars_subdag)
+        for experiment in self.experiments:
+            filename = ".".join(filter(None, [experiment.name, gvars_filename]))
+            experiment.gvars_filename = self.dirname / filename
+            gvars_subdag = DAG(filename=experiment.gvars_filename)
+            experiment.gvars = {
+                k: v for k, v in experiment.conf.items() if isinstance(v, str)
+            }
+            gvars_subdag.add_global_vars(experiment.gvars)
+            self.add_subdag(gvars_subdag)
 
         # 3. Add physics subdags
         self.add_ph_subdags()
+        self.add_priorities()
 
         # 4. Add additional output files
         status_filename = self.dirname / (self.filename.name + ".status")
         self.add(f"NODE_STATUS_FILE {status_filename} 45")
         dot_filename = str(self.filename).replace(".dag", ".dot")
         self.add(f"DOT {dot_filename}")
+        return self
 
-        self.compile()
-        self.write()
+    def build_manifest(self) -> Manifest:
+        hasher = InputHasher()
+        manifest = Manifest(
+            config_dir=self.config_dir,
+            shared_config_dirs=self.shared_config_dirs,
+            seed=self.seed,
+        )
+        for experiment in self.experiments:
+            manifest.add(
+                experiment.node_name("RUN_SETUP"),
+                ManifestNode(
+                    PhPhases.SETUP,
+                    outputs=[experiment.conf["setup_file"]],
+                    inputs=hasher.phase(PhPhases.SETUP, experiment.conf),
+                ),
+            )
 
-    def add_ph_subdags(self) -> None:
-        # 1. Add setup step
-        setup_node = Node(name="RUN_SETUP", script="submit/run_setup.sub")
+        # Experiment name -> last nodes of its runs
+        final_nodes: Dict[str, List[str]] = {e.name: [] for e in self.experiments}
+        for subdag, experiment, process_idx, process in self._ph_subdags:
+            conf = experiment.conf
+            # The process dir gets the cluster and process id of the
+            # PREPARE_GENERATION job appended at runtime, and the run if several
+            # runs are packed in the job
+            proc_dirs = [
+                f"{process['proc_dir']}.$(cluster).$(process)"
+                + (f".{r}" if len(subdag.runs) > 1 else "")
+                for r in subdag.runs
+            ]
+            proc_names = {r: Path(d).name for r, d in zip(subdag.runs, proc_dirs)}
+            outputs = {
+                PhPhases.PREPARE_GENERATION: proc_dirs,
+                PhPhases.RUN_GENERATION: [f"{d}/Events/run_01" for d in proc_dirs],
+                PhPhases.RUN_DELPHES: [
+                    f"{conf['root_files_dir']}/{n}" for n in proc_names.values()
+                ],
+            }
+            # The runs wait for the setup of every experiment using them
+            setups = [experiment.node_name("RUN_SETUP")] + [
+                c.experiment.node_name("RUN_SETUP")
+                for c in subdag.consumers
+                if c.experiment is not None
+            ]
+
+            parents = subdag.parents()
+            for node in subdag.nodes:
+                phase = subdag.node_phases[node.name]
+                node_parents = [f"{subdag.name}+{p}" for p in parents[node.name]]
+                consumer = subdag.analyses.get(node.name)
+                runs = subdag.runs
+                if consumer is not None:
+                    # Analysis of the experiment using the runs
+                    consumer_conf = (consumer.experiment or experiment).conf
+                    runs = consumer.runs
+                    node_outputs = [
+                        f"{consumer_conf['h5_dir']}/{proc_names[r]}.h5" for r in runs
+                    ]
+                    inputs = hasher.phase(phase, consumer_conf, process)
+                elif subdag.layout == "fused" and phase == PhPhases.RUN_DELPHES:
+                    # Only the LHE and ROOT files leave the fused node
+                    node_outputs = [
+                        f"{d}/Events/run_01/unweighted_events.lhe.gz"
+                        for d in proc_dirs
+                    ] + outputs[PhPhases.RUN_DELPHES]
+                    inputs = hasher.hash(
+                        [],
+                        {
+                            p.name: hasher.phase(p, conf, process)
+                            for p in PhPhases
+                            if PhPhases.PREPARE_GENERATION <= p <= phase
+                        },
+                    )
+                else:
+                    node_outputs = outputs[phase]
+                    inputs = hasher.phase(phase, conf, process)
+                manifest.add(
+                    f"{subdag.name}+{node.name}",
+                    ManifestNode(
+                        phase=phase,
+                        parents=node_parents or list(dict.fromkeys(setups)),
+                        outputs=node_outputs,
+                        run=subdag.id,
+                        runs=runs,
+                        process=process_idx,
+                        benchmark=process["benchmark"],
+                        inputs=inputs,
+                    ),
+                )
+                if not node.children:
+                    owner = consumer.experiment if consumer else None
+                    final_nodes[(owner or experiment).name].append(
+                        f"{subdag.name}+{node.name}"
+                    )
+
+        for experiment in self.experiments:
+            manifest.add(
+                experiment.node_name("RUN_AUGMENTATION"),
+                ManifestNode(
+                    PhPhases.RUN_AUGMENTATION,
+                    parents=final_nodes[experiment.name],
+                    outputs=[str(experiment.conf["augmentation"]["outdir"])],
+                    inputs=hasher.phase(PhPhases.RUN_AUGMENTATION, experiment.conf),
+                ),
+            )
+        return manifest
+
+    def shared_report(self) -> str:
+        """Runs generated for the runs the experiments asked for, and the
+        processes they share"""
+        requested = sum(n for sample in self._samples for _, n in sample.consumers)
+        generated = sum(sample.runs for sample in self._samples)
+        shared = [sample for sample in self._samples if len(sample.consumers) > 1]
+        report = (
+            f"Generating {generated} runs for {requested} runs requested, "
+            f"{len(shared)} processes shared between experiments"
+        )
+        for sample in shared:
+            users = ", ".join(f"{e.name} ({n} runs)" for e, n in sample.consumers)
+            report += (
+                f"\n  {sample.process['cards_dir']} {sample.process['benchmark']}: "
+                f"{users}"
+            )
+        return report
+
+    def add_priorities(self) -> None:
+        """Prioritize nodes by critical-path depth: the closer a node is to
+        feeding RUN_AUGMENTATION, the higher its priority, so runs already
+        started finish before new ones start. Among nodes of the same depth,
+        those of the samples with the most runs left go first, since
+        RUN_AUGMENTATION waits for the last run of every sample"""
+        subdags = [subdag for subdag, *_ in self._ph_subdags]
+        # RUN_AUGMENTATION follows every subdag
+        remaining = [subdag.remaining(downstream=1) for subdag in subdags]
+        longest = max((max(r.values()) for r in remaining), default=0)
+
+        # Runs of the sample in the subdag and the ones after it
+        runs_left: Dict[str, int] = {}
+        left: Dict[Tuple[str, int], int] = {}
+        for subdag, experiment, process_idx, _ in reversed(self._ph_subdags):
+            key = (experiment.name, process_idx)
+            left[key] = left.get(key, 0) + len(subdag.runs)
+            runs_left[subdag.name] = left[key]
+        weight = max(runs_left.values(), default=0) + 1
+
+        for subdag, r in zip(subdags, remaining):
+            for node in subdag.nodes:
+                depth = longest - r[node.name]
+                node.set_priority(depth * weight + runs_left[subdag.name])
+
+    def samples(self) -> List[Sample]:
+        """Processes of every experiment, those with the same inputs as a
+        process of an earlier experiment merged into its sample. Entries
+        repeated within an experiment are still generated once per entry"""
+        hasher = InputHasher()
+        samples: Dict[Tuple[str, int], Sample] = {}
+        for experiment in self.experiments:
+            seen: Dict[str, int] = {}
+            for process_idx, process in enumerate(experiment.conf["processes"]):
+                digest = (
+                    hasher.sample(experiment.conf, process)
+                    if len(self.experiments) > 1
+                    else str(process_idx)
+                )
+                key = (digest, seen.get(digest, 0))
+                seen[digest] = key[1] + 1
+                if key not in samples:
+                    samples[key] = Sample(experiment, process_idx, process)
+                samples[key].consumers.append((experiment, int(process["runs"])))
+        return list(samples.values())
+
+    def add_setup(self, experiment: Experiment) -> Node:
+        conf = experiment.conf
+        setup_node = Node(
+            name=experiment.node_name("RUN_SETUP"), script="submit/run_setup.sub"
+        )
         setup_vars = ["setup_file", "setup_conf", "log_dir"]
-        setup_node.add_vars({k: v for k, v in self._conf.items() if k in setup_vars})
+        setup_node.add_vars({k: v for k, v in conf.items() if k in setup_vars})
         pre_setup_vars = [
             "setup_dir",
             "tmp_dir",
@@ -167,48 +639,28 @@ class PhMetaDAG(DAG):
         ]
         setup_node.add_pre(
             script="scripts/PRE_run_setup",
-            args=[self._conf[v] for v in pre_setup_vars],
+            args=[conf[v] for v in pre_setup_vars],
         )
         self.add_node(setup_node)
+        return setup_node
 
-        # 2. Add subdags from config file
-        c = 1
-        ph_subdags_names = []
-        for process in self._conf["processes"]:
-            proc_dir = self.get_proc_dir(
-                base_dir=self._conf["processes_dir"],
-                cards_dir=process["cards_dir"],
-                benchmark=process["benchmark"],
-            )
-            process.update({"proc_dir": proc_dir, "tmp_dir": self._conf["tmp_dir"]})
-            for _ in range(int(process["runs"])):
-                ph_subdag = PhDAG(id=c, dirname=self.dirname / str(c), name=f"PH_{c}")
-                if self.gvars_filename is not None:
-                    ph_subdag.add(f"INCLUDE {self.gvars_filename}")
-                ph_subdag.add_global_vars({"log_dir": ph_subdag.dirname})
-
-                # Start from first phase (prepare generation)
-                ph_subdag.add_from_phase(PhPhases.PREPARE_GENERATION, **process)
-
-                self.add_subdag(ph_subdag, is_splice=True, from_parent=setup_node)
-                ph_subdags_names.append(ph_subdag.name)
-                c += 1
-
-        # 4. Run data augmentation
-        h5_dir = self.gvars["h5_dir"]
+    def add_augmentation(self, experiment: Experiment, ph_subdags_names: List[str]):
+        h5_dir = experiment.gvars["h5_dir"]
         augment_node = Node(
-            name="RUN_AUGMENTATION", script="submit/run_augmentation.sub"
+            name=experiment.node_name("RUN_AUGMENTATION"),
+            script="submit/run_augmentation.sub",
         )
-        augment_vars = self._conf["augmentation"]
+        augment_vars = experiment.conf["augmentation"]
         augment_vars.update(
             {
                 "events_file": Path(h5_dir).parent / (Path(h5_dir).parent.name + ".h5"),
-                "log_dir": self.gvars["log_dir"],
+                "log_dir": experiment.gvars["log_dir"],
             }
         )
         augment_node.add_vars(augment_vars)
         augment_node.add_pre(
-            script="scripts/PRE_run_augmentation", args=[h5_dir, self.gvars["log_dir"]]
+            script="scripts/PRE_run_augmentation",
+            args=[h5_dir, experiment.gvars["log_dir"]],
         )
         self.add_node(augment_node)
 
@@ -219,3 +671,82 @@ class PhMetaDAG(DAG):
         # then `augment_node = Node(..., from_parents=[phsb.name for phsb in ph_subdags])`
         # Note that this 'fake' nodes already exist, since act as childs of `setup_node`
         self.add(f"PARENT {' '.join(ph_subdags_names)} CHILD {augment_node.name}")
+
+    def add_ph_subdags(self) -> None:
+        # 1. Add setup step
+        setup_nodes = {e.name: self.add_setup(e) for e in self.experiments}
+
+        # 2. Add subdags from config file
+        c = 1
+        ph_subdags_names: Dict[str, List[str]] = {e.name: [] for e in self.experiments}
+        self._samples = self.samples()
+        for sample in self._samples:
+            experiment, process = sample.experiment, sample.process
+            conf = experiment.conf
+            proc_dir = self.get_proc_dir(
+                base_dir=conf["processes_dir"],
+                cards_dir=process["cards_dir"],
+                benchmark=process["benchmark"],
+            )
+            process.update({"proc_dir": proc_dir, "tmp_dir": conf["tmp_dir"]})
+            # Pack `runs_per_job` runs in every job, to amortize the scheduling
+            # and startup overhead of short runs
+            runs_per_job = self.positive(
+                {"runs_per_job": self.runs_per_job, **process}, "runs_per_job"
+            )
+            n_runs = sample.runs
+            for start in range(0, n_runs, runs_per_job):
+                runs = list(range(c, c + min(runs_per_job, n_runs - start)))
+                # Every experiment analyses the first runs of the sample, as
+                # many as it asked for
+                consumers = [
+                    Consumer(e, runs[: n - start])
+                    for e, n in sample.consumers
+                    if n > start
+                ]
+                ph_subdag = PhDAG(
+                    id=c,
+                    dirname=self.dirname / str(c),
+                    layout=self.layout,
+                    runs=runs,
+                    parallel_runs=self.parallel_runs,
+                    consumers=consumers,
+                    name=f"PH_{c}",
+                )
+                if experiment.gvars_filename is not None:
+                    ph_subdag.add(f"INCLUDE {experiment.gvars_filename}")
+                ph_subdag.add_global_vars({"log_dir": ph_subdag.dirname})
+                for run in runs:
+                    self.cards.add(
+                        run,
+                        process,
+                        ph_subdag.dirname / "cards" / str(run),
+                        seed=conf["seed"],
+                    )
+
+                # Start from first phase (prepare generation)
+                ph_subdag.add_from_phase(PhPhases.PREPARE_GENERATION, **process)
+                for node in ph_subdag.nodes:
+                    phase = ph_subdag.node_phases[node.name]
+                    if phase in self.maxjobs:
+                        node.set_category(self.category(phase))
+
+                self.add_subdag(
+                    ph_subdag, is_splice=True, from_parent=setup_nodes[experiment.name]
+                )
+                for consumer in consumers:
+                    name = consumer.experiment.name  # type: ignore
+                    ph_subdags_names[name].append(ph_subdag.name)
+                    # Shared runs also wait for the setup of the other experiments
+                    if name != experiment.name:
+                        setup_nodes[name].add_child(
+                            Node(name=ph_subdag.name, script="", type=NodeType.SPLICE)
+                        )
+                self._ph_subdags.append(
+                    (ph_subdag, experiment, sample.process_idx, process)
+                )
+                c += len(runs)
+
+        # 4. Run data augmentation
+        for experiment in self.experiments:
+            self.add_augmentation(experiment, ph_subdags_names[experiment.name])
@@ -1,42 +1,196 @@
 from pathlib import Path
+from typing import Dict, List, Optional, Set
 
-from madminer_dag.node_parser import NodeStatusParser
-from madminer_dag.parse_utils import Args, CreateArgs, RedoArgs
+from madminer_dag.local import LocalExecutor
+from madminer_dag.manifest import Manifest
+from madminer_dag.monitor import StatusMonitor
+from madminer_dag.node_parser import NodeStatusParser, PhaseNode, run_id_of
+from madminer_dag.parse_utils import (
+    Args,
+    CreateArgs,
+    RedoArgs,
+    RunLocalArgs,
+    StatusArgs,
+)
 from madminer_dag.ph_dag import PhMetaDAG
+from madminer_dag.schemas import NodeStatus, PhPhases
+
+
+FAILED_STATUSES = (NodeStatus.ERROR, NodeStatus.FUTILE)
 
 
 def create(args: CreateArgs):
-    PhMetaDAG(filename=args.name, conf=args.conf).run(
-        gvars_filename=str(args.gvars), dag_conf=args.dag_conf
+    seed = args.seed
+    manifest_file = Path(str(args.name.with_suffix(".dag")) + ".manifest.json")
+    if seed is None and args.incremental and manifest_file.exists():
+        # Keep the events of the existing DAG, only what changed is rewritten
+        seed = Manifest.load(manifest_file).seed
+    ph_dag = PhMetaDAG(
+        filename=args.name,
+        conf=args.conf,
+        config_dir=args.config_dir,
+        shared=args.shared,
+        seed=seed,
+    )
+    report = ph_dag.run(
+        gvars_filename=str(args.gvars),
+        dag_conf=args.dag_conf,
+        incremental=args.incremental,
+        jobs=args.jobs,
     )
+    print(report)
+    print(f"Base random seed {ph_dag.seed} (pass --seed to create the same events)")
+    if args.shared:
+        print(ph_dag.shared_report())
+
+
+def failed_closure(nodes: List[PhaseNode]) -> Set[str]:
+    """Names of the failed nodes and of all the nodes downstream of them, for DAG
+    folders without manifest. Runs are independent chains of phases, and every
+    run feeds augmentation"""
+    failed = [n for n in nodes if n.status in FAILED_STATUSES]
+    if not failed:
+        return set()
+
+    if any(n.phase == PhPhases.SETUP for n in failed):
+        return {n.name for n in nodes}
+
+    # Earliest failed phase per run
+    first_failed: Dict[int, int] = {}
+    for n in failed:
+        if n.phase != PhPhases.RUN_AUGMENTATION:
+            run_id = run_id_of(n.name)
+            first_failed[run_id] = min(n.phase, first_failed.get(run_id, n.phase))
+
+    closure = set()
+    for n in nodes:
+        if n.phase == PhPhases.RUN_AUGMENTATION:
+            closure.add(n.name)
+        elif n.phase != PhPhases.SETUP:
+            phase = first_failed.get(run_id_of(n.name))
+            if phase is not None and n.phase >= phase:
+                closure.add(n.name)
+    return closure
 
 
 def redo(args: RedoArgs):
-    node_parser = NodeStatusParser(status_lines=args.status_lines, phase=args.phase)
-    set_done = [
-        node
-        for node in node_parser.phase_nodes()
-        if node.phase < node_parser.from_phase
-    ]
+    node_parser = NodeStatusParser(status_file=args.status_file, phase=args.phase)
+    manifest = Manifest.load(args.manifest_file) if args.manifest_file else None
+    if manifest is not None:
+        nodes = manifest.phase_nodes(node_parser.all_nodes())
+    else:
+        nodes = node_parser.phase_nodes()
+
+    if args.auto:
+        assert manifest is not None and args.conf is not None
+        if manifest.seed is None:
+            raise ValueError("No seed in the manifest, create the DAG again")
+        current = PhMetaDAG(
+            filename=args.dirname / (args.dirname.stem + ".dag"),
+            conf=args.conf,
+            config_dir=manifest.config_dir,
+            shared=args.shared,
+            seed=manifest.seed,
+        )
+        new_manifest = current.build().build_manifest()
+        changed = manifest.changed_inputs(new_manifest)
+        not_done = {n.name for n in nodes if n.status != NodeStatus.DONE}
+        redo_nodes = manifest.downstream(changed) | not_done
+        if not redo_nodes:
+            print("No inputs changed, nothing to redo")
+            return
+        set_done = [node for node in nodes if node.name not in redo_nodes]
+        print(
+            f"Inputs changed for {len(changed)} nodes, redoing {len(redo_nodes)} "
+            f"nodes, marking {len(set_done)} as done"
+        )
+    elif args.failed_only:
+        if manifest is not None:
+            redo_nodes = manifest.downstream(
+                n.name for n in nodes if n.status in FAILED_STATUSES
+            )
+        else:
+            redo_nodes = failed_closure(nodes)
+        if not redo_nodes:
+            print("No failed nodes found, nothing to redo")
+            return
+        # Nodes that did not finish (e.g. removed from the queue) run again too
+        set_done = [
+            node
+            for node in nodes
+            if node.name not in redo_nodes and node.status == NodeStatus.DONE
+        ]
+        print(
+            f"Redoing {len(redo_nodes)} failed and downstream nodes, marking "
+            f"{len(set_done)} as done, {len(nodes) - len(set_done)} will run"
+        )
+    else:
+        set_done = [node for node in nodes if node.phase < node_parser.from_phase]
 
     dag_file = (args.dirname / args.dirname.stem).with_suffix(".dag")
     rescue_file = Path(str(dag_file) + f".rescue{args.rescue:03d}")
     with open(rescue_file, "w") as f:
         f.writelines(f"DONE {node.name}\n" for node in set_done)
 
+    if args.auto:
+        # Next `--auto` compares against the inputs scheduled now
+        new_manifest.save(args.manifest_file)  # type: ignore
+
     print(
         f"Run \ncondor_submit_dag -DoRescueFrom {args.rescue} {dag_file}\nto redo DAG"
     )
 
 
-args2fun = {CreateArgs: create, RedoArgs: redo}
+def status(args: StatusArgs) -> Optional[int]:
+    monitor = StatusMonitor(
+        status_file=args.status_file,
+        history_file=args.history_file,
+        window=args.window,
+        stall_after=args.stall_after,
+        manifest=Manifest.load(args.manifest_file) if args.manifest_file else None,
+    )
+    try:
+        if args.watch:
+            monitor.watch(interval=args.interval)
+            return None
+        monitor.update()
+    except ValueError as ex:
+        # The status file is of another creation of the DAG than the manifest
+        print(f"{ex}\nThe manifest is stale, run `madminer-dag create` again")
+        return 1
+    print(monitor.report())
+    return None
+
+
+def run_local(args: RunLocalArgs) -> int:
+    done = set()
+    if args.rescue_file is not None:
+        with open(args.rescue_file, "r") as f:
+            done = {line.split()[1] for line in f if line.startswith("DONE ")}
+
+    executor = LocalExecutor(args.dag_file, jobs=args.jobs, done=done)
+    if args.dry_run:
+        print("\n".join(executor.dry_run()))
+        return 0
+
+    report = executor.run()
+    print(report)
+    return 0 if report.ok else 1
+
+
+args2fun = {
+    CreateArgs: create,
+    RedoArgs: redo,
+    StatusArgs: status,
+    RunLocalArgs: run_local,
+}
 
 
-def run(args: Args) -> None:
+def run(args: Args) -> Optional[int]:
     args_cls = type(args)
 
     func = args2fun.get(args_cls)
 
     assert func, f"Invalid arguments class: {args_cls}"
 
-    func(args)
+    return func(args)
@@ -0,0 +1,103 @@
+import os
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+import pytest
+
+from madminer_dag.ph_dag import PhMetaDAG
+from madminer_dag.schemas import NodeStatus
+
+
+def write(path: Path, contents: str) -> Path:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(contents)
+    return path
+
+
+def write_status(
+    path: Path, statuses: Dict[str, NodeStatus], mtime: Optional[float] = None
+) -> Path:
+    """Node status file of DAGMan with `statuses` (node name -> status),
+    modified at `mtime`"""
+    blocks = ['[\n  Type = "DagStatus";\n  DagStatus = 3; /* "STATUS_SUBMITTED" */\n]']
+    blocks += [
+        "[\n"
+        '  Type = "NodeStatus";\n'
+        f'  Node = "{name}";\n'
+        f'  NodeStatus = {status.value}; /* "STATUS_{status.name}" */\n'
+        '  StatusDetails = "";\n'
+        "]"
+        for name, status in statuses.items()
+    ]
+    blocks.append('[\n  Type = "StatusEnd";\n  EndTime = 0;\n]')
+    write(path, "\n".join(blocks) + "\n")
+    if mtime is not None:
+        os.utime(path, (mtime, mtime))
+    return path
+
+
+@pytest.fixture
+def make_conf(tmp_path):
+    """Configuration of an experiment `name`, with its cards and setup in
+    `tmp_path`. Processes are (benchmark, runs) pairs"""
+    cards_dir = tmp_path / "cards" / "tzq"
+    for card in ("proc_card.dat", "param_card.dat", "pythia8_card.dat"):
+        write(cards_dir / card, f"{card}\n")
+    write(cards_dir / "run_card.dat", "RND_SEED = iseed\n")
+    write(tmp_path / "delphes_card.dat", "delphes\n")
+
+    def make_conf(name: str = "exp", processes=(("sm", 2),)) -> Dict[str, Any]:
+        base = tmp_path / name
+        setup_conf = write(base / "conf" / "benchmarks.yml", "benchmarks: [sm]\n")
+        observables = write(base / "conf" / "observables.yml", "observables: []\n")
+        return {
+            "tmp_dir": str(base / "share"),
+            "log_dir": str(base / "logs"),
+            "setup_dir": str(base / "setup"),
+            "setup_file": "setup.h5",
+            "setup_conf": str(setup_conf),
+            "processes_dir": str(base / "processes"),
+            "mg_dir": "/opt/MG5_aMC",
+            "processes": [
+                {
+                    "cards_dir": str(cards_dir),
+                    "proc_card": "proc_card.dat",
+                    "run_card": "run_card.dat",
+                    "param_card": "param_card.dat",
+                    "pythia_card": "pythia8_card.dat",
+                    "benchmark": benchmark,
+                    "reweight_card_insert": "None",
+                    "runs": runs,
+                    "n_subprocesses": 2,
+                }
+                for benchmark, runs in processes
+            ],
+            "delphes_card": str(tmp_path / "delphes_card.dat"),
+            "delphes_dir": "/opt/Delphes",
+            "ld_library_path": "/opt/lib",
+            "root_files_dir": str(base / "root"),
+            "observables": str(observables),
+            "h5_dir": str(base / "h5"),
+            "augmentation": {"outdir": str(base / "samples"), "n_samples": 10},
+        }
+
+    return make_conf
+
+
+@pytest.fixture
+def make_dag(tmp_path):
+    """Meta DAG of the experiment configurations `confs`, with a fixed seed"""
+
+    def make_dag(*confs: Dict[str, Any], name: str = "exp") -> PhMetaDAG:
+        return PhMetaDAG(
+            filename=tmp_path / "dag" / name / f"{name}.dag",
+            conf=confs[0],
+            config_dir=tmp_path / "config" / "exp0",
+            shared=[
+                (conf, tmp_path / "config" / f"exp{i}")
+                for i, conf in enumerate(confs[1:], 1)
+            ],
+            seed=10000,
+        )
+
+    return make_dag
@@ -0,0 +1,89 @@
+import json
+import shutil
+
+from madminer_dag.dag import DAG
+from madminer_dag.node import Node
+
+
+def make_dag(tmp_path, n_subdags=3, script="submit/run.sub"):
+    dag = DAG(tmp_path / "meta.dag")
+    for i in range(1, n_subdags + 1):
+        subdag = DAG(tmp_path / str(i) / f"{i}.dag", name=f"PH_{i}")
+        subdag.add_node(Node(name=f"RUN_{i}", script=script))
+        dag.add_subdag(subdag, is_splice=True)
+    return dag
+
+
+def test_write_skips_unchanged_files(tmp_path):
+    hashes = {}
+    report = make_dag(tmp_path).write(hashes=hashes)
+    assert (report.written, report.skipped) == (4, 0)
+    assert len(hashes) == 4
+    assert set(report.timings) == {"write"}
+
+    mtimes = {f: (tmp_path / f).stat().st_mtime_ns for f in hashes}
+    before = dict(hashes)
+    report = make_dag(tmp_path).write(hashes=hashes)
+    assert (report.written, report.skipped) == (0, 4)
+    assert hashes == before
+    assert {f: (tmp_path / f).stat().st_mtime_ns for f in hashes} == mtimes
+    # No temporary file left behind
+    assert not list(tmp_path.rglob(".*.tmp"))
+
+
+def test_write_rewrites_changed_and_missing_files(tmp_path):
+    hashes = {}
+    make_dag(tmp_path).write(hashes=hashes)
+    (tmp_path / "2" / "2.dag").unlink()
+    before = dict(hashes)
+
+    report = make_dag(tmp_path, script="submit/other.sub").write(hashes=hashes)
+    assert (report.written, report.skipped) == (3, 1)
+    assert hashes[str(tmp_path / "meta.dag")] == before[str(tmp_path / "meta.dag")]
+    assert "submit/other.sub" in (tmp_path / "2" / "2.dag").read_text()
+
+    report = make_dag(tmp_path, script="submit/other.sub").write(hashes=hashes)
+    assert (report.written, report.skipped) == (0, 4)
+
+
+def test_write_with_a_pool_writes_the_same_files(tmp_path):
+    serial, pooled = {}, {}
+    make_dag(tmp_path, n_subdags=20).write(hashes=serial)
+    contents = {path: path.read_text() for path in tmp_path.rglob("*.dag")}
+    shutil.rmtree(tmp_path)
+
+    make_dag(tmp_path, n_subdags=20).write(hashes=pooled, jobs=4)
+    assert pooled == serial
+    assert {path: path.read_text() for path in tmp_path.rglob("*.dag")} == contents
+
+
+def test_incremental_create_only_writes_what_changed(make_conf, make_dag):
+    dag = make_dag(make_conf(processes=[("sm", 3)]))
+    report = dag.run()
+    assert report.written == 5  # meta DAG, global VARS and 3 runs
+    assert (report.skipped, report.removed) == (0, 0)
+    assert report.cards == 3
+
+    report = make_dag(make_conf(processes=[("sm", 3)])).run(incremental=True)
+    assert (report.written, report.skipped, report.removed) == (0, 5, 0)
+    assert report.cards == 0
+
+
+def test_incremental_create_removes_orphaned_runs(make_conf, make_dag):
+    dag = make_dag(make_conf(processes=[("sm", 3)]))
+    dag.run()
+    assert (dag.dirname / "3").is_dir()
+    stray = dag.dirname / "logs"
+    stray.mkdir()
+
+    dag = make_dag(make_conf(processes=[("sm", 2)]))
+    report = dag.run(incremental=True)
+    assert report.removed == 1
+    assert not (dag.dirname / "3").exists()
+    # Only numbered run directories are removed
+    assert stray.is_dir()
+
+    with open(dag.hashes_filename) as f:
+        hashes = json.load(f)
+    assert str(dag.dirname / "3" / "3.dag") not in hashes
+    assert set(hashes) == {str(d.filename) for d in dag.iter_dags()}
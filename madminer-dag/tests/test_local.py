@@ -0,0 +1,154 @@
+import os
+import stat
+
+import pytest
+
+from conftest import write
+from madminer_dag.local import DAGFileParser, LocalExecutor, expand, unescape
+from madminer_dag.node_parser import NodeStatusParser
+from madminer_dag.schemas import NodeStatus
+
+
+@pytest.fixture
+def dag_file(tmp_path):
+    """Meta DAG with a setup node and two runs of two nodes, spliced. Every job
+    appends `<node> start` and `<node> end` to `jobs.log`"""
+    job = write(
+        tmp_path / "job.sh",
+        '#!/bin/sh\necho "$1 start" >> "$2"\nsleep 0.05\n'
+        '[ "$3" = fail ] && exit 3\necho "$1 end" >> "$2"\n',
+    )
+    job.chmod(job.stat().st_mode | stat.S_IXUSR)
+    submit = write(
+        tmp_path / "job.sub",
+        f"executable = {job}\n"
+        "arguments = $(NAME) $(LOG) $(MODE:ok)\n"
+        "output = $(LOG_DIR)/$(NAME).out\n"
+        "queue 1\n",
+    )
+    write(
+        tmp_path / "global.vars.dag",
+        f'VARS ALL_NODES LOG="{tmp_path / "jobs.log"}"\n',
+    )
+    for run in (1, 2):
+        write(
+            tmp_path / str(run) / f"{run}.dag",
+            f"INCLUDE {tmp_path / 'global.vars.dag'}\n"
+            f'VARS ALL_NODES LOG_DIR="{tmp_path / str(run)}"\n'
+            f"JOB GEN_{run} {submit}\n"
+            f'VARS GEN_{run} NAME="gen{run}"\n'
+            f"CATEGORY GEN_{run} +GEN\n"
+            f"JOB ANA_{run} {submit}\n"
+            f'VARS ANA_{run} NAME="ana{run}"\n'
+            f"CATEGORY ANA_{run} local\n"
+            f"PRIORITY ANA_{run} {run}\n"
+            f"PARENT GEN_{run} CHILD ANA_{run}\n",
+        )
+    return write(
+        tmp_path / "exp.dag",
+        f"INCLUDE {tmp_path / 'global.vars.dag'}\n"
+        f"JOB SETUP {submit}\n"
+        'VARS SETUP NAME="setup"\n'
+        f"SPLICE PH_1 {tmp_path / '1' / '1.dag'}\n"
+        f"SPLICE PH_2 {tmp_path / '2' / '2.dag'}\n"
+        "MAXJOBS +GEN 1\n"
+        "MAXJOBS local 5\n"
+        "PARENT SETUP CHILD PH_1 PH_2\n"
+        f"NODE_STATUS_FILE {tmp_path / 'exp.dag.status'} 1\n"
+        "DOT exp.dot\n",
+    )
+
+
+def jobs_log(dag_file):
+    with open(dag_file.parent / "jobs.log") as f:
+        return [line.split() for line in f]
+
+
+def test_macros():
+    assert expand("$(A) $(B:2) $(C)", {"A": "$(B:3)", "C": "x"}) == "3 2 x"
+    # DAGMan unescapes `\\` and `\"`, the submit file then reads `\"` as `"`
+    assert unescape(r"a \\\" b") == 'a " b'
+
+
+def test_parse_splices_includes_and_categories(dag_file):
+    parser = DAGFileParser()
+    initial, final = parser.parse(dag_file)
+    assert (initial, final) == (["SETUP"], ["PH_1+ANA_1", "PH_2+ANA_2"])
+
+    nodes = parser.nodes
+    assert set(nodes) == {
+        "SETUP",
+        "PH_1+GEN_1",
+        "PH_1+ANA_1",
+        "PH_2+GEN_2",
+        "PH_2+ANA_2",
+    }
+    # Splices are connected through their initial and final nodes
+    assert nodes["SETUP"].children == {"PH_1+GEN_1", "PH_2+GEN_2"}
+    assert nodes["PH_2+ANA_2"].parents == {"PH_2+GEN_2"}
+    # ALL_NODES VARS of the file and its includes, then those of the node
+    assert nodes["PH_1+ANA_1"].vars == {
+        "LOG": str(dag_file.parent / "jobs.log"),
+        "LOG_DIR": str(dag_file.parent / "1"),
+        "NAME": "ana1",
+    }
+    assert "LOG_DIR" not in nodes["SETUP"].vars
+    # Categories starting with `+` are global, others local to the splice
+    assert nodes["PH_1+GEN_1"].category == nodes["PH_2+GEN_2"].category == "+GEN"
+    assert nodes["PH_1+ANA_1"].category == "PH_1+local"
+    assert nodes["PH_2+ANA_2"].priority == 2
+    assert parser.maxjobs == {"+GEN": 1, "local": 5}
+
+
+def test_run_honours_dependencies_and_maxjobs(dag_file):
+    report = LocalExecutor(dag_file, jobs=4).run()
+    assert report.ok, str(report)
+
+    log = jobs_log(dag_file)
+    events = [f"{name} {event}" for name, event in log]
+    for parent, child in [("setup", "gen1"), ("gen1", "ana1"), ("gen2", "ana2")]:
+        assert events.index(f"{parent} end") < events.index(f"{child} start")
+    # A single generation at once
+    gen = [event for event in events if event.startswith("gen")]
+    assert gen in (
+        ["gen1 start", "gen1 end", "gen2 start", "gen2 end"],
+        ["gen2 start", "gen2 end", "gen1 start", "gen1 end"],
+    )
+    assert (dag_file.parent / "1" / "gen1.out").exists()
+
+    statuses = NodeStatusParser(dag_file.parent / "exp.dag.status").all_nodes()
+    assert {n.status for n in statuses} == {NodeStatus.DONE}
+
+
+def test_failed_nodes_make_their_children_futile(dag_file):
+    text = (dag_file.parent / "1" / "1.dag").read_text()
+    (dag_file.parent / "1" / "1.dag").write_text(
+        text + 'VARS GEN_1 MODE="fail"\n'
+    )
+    executor = LocalExecutor(dag_file, jobs=2)
+    report = executor.run()
+    assert not report.ok
+    assert executor.nodes["PH_1+GEN_1"].status == NodeStatus.ERROR
+    assert executor.nodes["PH_1+GEN_1"].details == "Job exited with code 3"
+    assert executor.nodes["PH_1+ANA_1"].status == NodeStatus.FUTILE
+    assert executor.nodes["PH_2+ANA_2"].status == NodeStatus.DONE
+    assert "FAILED PH_1+GEN_1" in str(report)
+
+
+def test_done_nodes_are_skipped(dag_file):
+    executor = LocalExecutor(dag_file, jobs=2, done={"SETUP", "PH_1+GEN_1"})
+    assert executor.dry_run() == ["PH_1+ANA_1", "PH_2+GEN_2", "PH_2+ANA_2"]
+    assert executor.run().ok
+    assert sorted(name for name, event in jobs_log(dag_file) if event == "end") == [
+        "ana1",
+        "ana2",
+        "gen2",
+    ]
+
+
+def test_blocked_nodes_fail_instead_of_hanging(dag_file):
+    text = dag_file.read_text().replace("MAXJOBS +GEN 1", "MAXJOBS +GEN 0")
+    dag_file.write_text(text)
+    with pytest.raises(ValueError, match="Nodes can never run"):
+        LocalExecutor(dag_file, jobs=2, done={"SETUP"}).run()
+    assert not os.path.exists(dag_file.parent / "jobs.log")
@@ -0,0 +1,99 @@
+import json
+
+import pytest
+
+from conftest import write_status
+from madminer_dag.monitor import StatusMonitor
+from madminer_dag.schemas import NodeStatus, PhPhases
+
+DONE, RUNNING = NodeStatus.DONE, NodeStatus.SUBMITTED
+# Modification time of the first status file
+T0 = 1_700_000_000
+
+
+def generation(n_done, n_running=0, n_waiting=0):
+    """Statuses of the generation nodes of runs 1, 2, ..."""
+    statuses = [DONE] * n_done + [RUNNING] * n_running
+    statuses += [NodeStatus.NOT_READY] * n_waiting
+    return {
+        f"PH_{i}+RUN_GENERATION_{i}": status
+        for i, status in enumerate(statuses, 1)
+    }
+
+
+@pytest.fixture
+def files(tmp_path):
+    return tmp_path / "exp.dag.status", tmp_path / "exp.dag.history"
+
+
+def history_lines(history_file):
+    with open(history_file) as f:
+        return [json.loads(line) for line in f]
+
+
+def test_only_changed_counts_are_recorded(files):
+    status_file, history_file = files
+    monitor = StatusMonitor(status_file, history_file)
+    write_status(status_file, generation(0, 2, 2), mtime=T0)
+    assert monitor.update()
+    # Unchanged file
+    assert not monitor.update()
+
+    # Changed file, same counts: the time advances but nothing is recorded
+    write_status(status_file, generation(0, 2, 2), mtime=T0 + 60)
+    assert monitor.update()
+    assert monitor.now == T0 + 60
+    assert len(monitor.history) == 1
+
+    write_status(status_file, generation(1, 1, 2), mtime=T0 + 120)
+    assert monitor.update()
+    assert [t for t, _ in history_lines(history_file)] == [T0, T0 + 120]
+    assert monitor.history[-1][1] == {"RUN_GENERATION": [1, 1, 2, 0]}
+
+
+def test_rates_and_eta(files):
+    status_file, history_file = files
+    monitor = StatusMonitor(status_file, history_file, window=3600)
+    for minute, done in [(0, 0), (30, 2), (60, 4)]:
+        write_status(status_file, generation(done, 10 - done), mtime=T0 + minute * 60)
+        monitor.update()
+
+    (progress,) = monitor.progress()
+    assert progress.phase == PhPhases.RUN_GENERATION
+    assert (progress.done, progress.running, progress.total) == (4, 6, 10)
+    assert progress.rate == pytest.approx(4.0)
+    assert progress.eta == pytest.approx(6 / 4 * 3600)
+    assert not progress.stalled
+    assert "RUN_GENERATION" in monitor.report()
+
+
+def test_stalled_phases(files):
+    status_file, history_file = files
+    monitor = StatusMonitor(status_file, history_file, stall_after=600)
+    write_status(status_file, generation(1, 2), mtime=T0)
+    monitor.update()
+    write_status(status_file, generation(1, 2), mtime=T0 + 300)
+    monitor.update()
+    assert not monitor.progress()[0].stalled
+    write_status(status_file, generation(1, 2), mtime=T0 + 600)
+    monitor.update()
+    assert monitor.progress()[0].stalled
+
+
+def test_history_is_bounded_and_survives_restarts(files):
+    status_file, history_file = files
+    monitor = StatusMonitor(status_file, history_file, window=600, stall_after=300)
+    for i in range(30):
+        write_status(status_file, generation(i, 30 - i), mtime=T0 + 60 * i)
+        monitor.update()
+
+    # The records of the last 10 minutes, and the counts at their start
+    assert monitor.history[0][0] == T0 + 60 * 19
+    assert len(monitor.history) == 11
+    assert len(history_lines(history_file)) <= 2 * len(monitor.history) + 1
+    rate = monitor.progress()[0].rate
+    assert rate == pytest.approx(60.0)
+
+    restarted = StatusMonitor(status_file, history_file, window=600, stall_after=300)
+    assert restarted.history == [(t, c) for t, c in monitor.history]
+    assert restarted.progress()[0].rate == pytest.approx(rate)
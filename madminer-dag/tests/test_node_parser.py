@@ -0,0 +1,78 @@
+import pytest
+
+from conftest import write_status
+from madminer_dag.node_parser import Node, NodeStatusParser, PhaseNode
+from madminer_dag.schemas import NodeStatus, PhPhases
+
+
+def test_parse_status_nodes_only():
+    lines = [
+        "[",
+        '  Type = "DagStatus";',
+        '  Node = "not a node";',
+        "]",
+        "[",
+        "  NodeStatus = 5; /* \"STATUS_DONE\" */",
+        '  Type = "NodeStatus";  /* fields come in any order */',
+        '  Node = "PH_1+RUN_DELPHES_1";',
+        '  StatusDetails = "";',
+        "]",
+        "[",
+        '  Type = "StatusEnd";',
+        "]",
+    ]
+    assert list(NodeStatusParser.parse(iter(lines))) == [
+        Node("PH_1+RUN_DELPHES_1", NodeStatus.DONE)
+    ]
+
+
+def test_parse_fails_on_incomplete_blocks():
+    lines = ["[", '  Type = "NodeStatus";', '  Node = "RUN_SETUP";', "]"]
+    with pytest.raises(ValueError, match="Incomplete node status block"):
+        list(NodeStatusParser.parse(iter(lines)))
+
+
+def test_node_phases():
+    assert Node("RUN_SETUP", None).phase == PhPhases.SETUP
+    assert Node("PH_3+RUN_ANALYSIS_exp_3", None).phase == PhPhases.RUN_ANALYSIS
+    assert Node("PH_3+RUN_ANALYSIS_exp_3", None).id == 3
+    assert Node("PH_3+SOMETHING_3", None).phase is None
+
+
+def test_all_nodes_parses_the_file_once_per_change(tmp_path, monkeypatch):
+    path = write_status(
+        tmp_path / "exp.dag.status",
+        {"RUN_SETUP": NodeStatus.DONE, "PH_1+RUN_GENERATION_1": NodeStatus.SUBMITTED},
+        mtime=1000,
+    )
+    parser = NodeStatusParser(path)
+    parses = []
+    iter_nodes = parser.iter_nodes
+    monkeypatch.setattr(parser, "iter_nodes", lambda: parses.append(1) or iter_nodes())
+
+    assert parser.changed()
+    nodes = parser.all_nodes()
+    assert len(nodes) == 2
+    assert not parser.changed()
+    assert parser.all_nodes() is nodes
+    assert len(parses) == 1
+
+    # Same size, newer modification time
+    write_status(
+        path,
+        {"RUN_SETUP": NodeStatus.DONE, "PH_1+RUN_GENERATION_1": NodeStatus.ERROR},
+        mtime=1001,
+    )
+    assert parser.changed()
+    assert parser.all_nodes()[1].status == NodeStatus.ERROR
+    assert len(parses) == 2
+
+
+def test_phase_nodes_skip_nodes_without_phase(tmp_path):
+    path = write_status(
+        tmp_path / "exp.dag.status",
+        {"RUN_SETUP": NodeStatus.DONE, "PH_1": NodeStatus.SUBMITTED},
+    )
+    assert NodeStatusParser(path).phase_nodes() == [
+        PhaseNode("RUN_SETUP", NodeStatus.DONE, PhPhases.SETUP)
+    ]
@@ -0,0 +1,165 @@
+from pathlib import Path
+
+from madminer_dag.local import DAGFileParser
+from madminer_dag.manifest import Manifest
+from madminer_dag.node_parser import Node, PhaseNode
+from madminer_dag.run import failed_closure
+from madminer_dag.schemas import NodeStatus, PhPhases
+
+
+def parse(dag):
+    parser = DAGFileParser()
+    parser.parse(dag.filename)
+    return parser.nodes
+
+
+def test_fused_layout(make_conf, make_dag):
+    conf = make_conf(processes=[("sm", 3)])
+    conf.update(layout="fused", runs_per_job=2, parallel_runs=2)
+    dag = make_dag(conf)
+    dag.run()
+    subdag = dag._ph_subdags[0][0]
+    assert subdag.node_phases == {
+        "RUN_FUSED_1": PhPhases.RUN_DELPHES,
+        "RUN_ANALYSIS_1": PhPhases.RUN_ANALYSIS,
+    }
+
+    nodes = parse(dag)
+    assert sorted(nodes) == [
+        "PH_1+RUN_ANALYSIS_1",
+        "PH_1+RUN_FUSED_1",
+        "PH_3+RUN_ANALYSIS_3",
+        "PH_3+RUN_FUSED_3",
+        "RUN_AUGMENTATION",
+        "RUN_SETUP",
+    ]
+    fused = nodes["PH_1+RUN_FUSED_1"]
+    assert fused.submit.name == "run_fused.sub"
+    assert fused.children == {"PH_1+RUN_ANALYSIS_1"}
+    process = dag._ph_subdags[0][3]
+    assert fused.vars["PROC_DIR"] == str(process["proc_dir"])
+    assert fused.vars["BENCHMARK"] == "sm"
+    # Resources of the runs packed in the node, run at once
+    assert fused.vars["NGEN"] == "1,2"
+    assert fused.vars["SLOT_DISK"] == "60GB"
+    assert "SLOT_DISK" not in nodes["PH_3+RUN_FUSED_3"].vars
+
+    # Only the LHE and ROOT files leave the fused node
+    manifest = dag.build_manifest()
+    node = manifest["PH_1+RUN_FUSED_1"]
+    assert node.phase == PhPhases.RUN_DELPHES
+    assert node.runs == [1, 2]
+    assert any(o.endswith("unweighted_events.lhe.gz") for o in node.outputs)
+    assert any(o.startswith(conf["root_files_dir"]) for o in node.outputs)
+
+
+def test_fused_and_split_prepare_with_the_same_vars(make_conf, make_dag):
+    split = make_dag(make_conf(), name="split")
+    split.build()
+    fused_conf = make_conf()
+    fused_conf["layout"] = "fused"
+    fused = make_dag(fused_conf, name="fused")
+    fused.build()
+    (prepare, *_) = split._ph_subdags[0][0].nodes
+    (run_fused, *_) = fused._ph_subdags[0][0].nodes
+    assert (prepare.name, run_fused.name) == ("PREPARE_GENERATION_1", "RUN_FUSED_1")
+    assert prepare._vars.split(" ", 2)[2] == run_fused._vars.split(" ", 2)[2]
+
+
+def test_fused_nodes_are_delphes_nodes_in_the_status_file():
+    assert Node("PH_7+RUN_FUSED_7", None).phase == PhPhases.RUN_DELPHES
+
+    # Redoing a failed fused node redoes its analysis, not the other way around
+    nodes = [
+        PhaseNode("RUN_SETUP", NodeStatus.DONE, PhPhases.SETUP),
+        PhaseNode("PH_1+RUN_FUSED_1", NodeStatus.ERROR, PhPhases.RUN_DELPHES),
+        PhaseNode("PH_1+RUN_ANALYSIS_1", NodeStatus.FUTILE, PhPhases.RUN_ANALYSIS),
+        PhaseNode("PH_2+RUN_FUSED_2", NodeStatus.DONE, PhPhases.RUN_DELPHES),
+        PhaseNode("PH_2+RUN_ANALYSIS_2", NodeStatus.ERROR, PhPhases.RUN_ANALYSIS),
+        PhaseNode("RUN_AUGMENTATION", NodeStatus.FUTILE, PhPhases.RUN_AUGMENTATION),
+    ]
+    assert failed_closure(nodes) == {
+        "PH_1+RUN_FUSED_1",
+        "PH_1+RUN_ANALYSIS_1",
+        "PH_2+RUN_ANALYSIS_2",
+        "RUN_AUGMENTATION",
+    }
+
+
+def shared_dag(make_conf, make_dag, **exp1):
+    """DAG of `exp0` asking for 3 SM runs and 1 BSM run, and `exp1` asking for
+    2 SM runs"""
+    conf1 = make_conf("exp1", [("sm", 2)])
+    conf1.update(exp1)
+    return make_dag(make_conf("exp0", [("sm", 3), ("bsm", 1)]), conf1)
+
+
+def test_experiments_share_identical_samples(make_conf, make_dag):
+    dag = shared_dag(make_conf, make_dag)
+    dag.build()
+    # The SM sample is generated once, with the runs of the experiment asking
+    # for the most, and the first ones are analysed by both
+    assert len(dag._ph_subdags) == 4
+    analyses = {
+        subdag.name: sorted(subdag.analyses) for subdag, *_ in dag._ph_subdags
+    }
+    assert analyses == {
+        "PH_1": ["RUN_ANALYSIS_exp0_1", "RUN_ANALYSIS_exp1_1"],
+        "PH_2": ["RUN_ANALYSIS_exp0_2", "RUN_ANALYSIS_exp1_2"],
+        "PH_3": ["RUN_ANALYSIS_exp0_3"],
+        "PH_4": ["RUN_ANALYSIS_exp0_4"],
+    }
+    assert dag.shared_report().startswith(
+        "Generating 4 runs for 6 runs requested, 1 processes shared"
+    )
+
+    # Every experiment analyses with its own observables, into its own folder
+    subdag = dag._ph_subdags[0][0]
+    exp1 = {node.name: node for node in subdag.nodes}["RUN_ANALYSIS_exp1_1"]
+    assert f'H5_DIR="{make_conf("exp1")["h5_dir"]}"' in str(exp1)
+
+
+def test_samples_with_other_inputs_are_not_shared(make_conf, make_dag):
+    dag = shared_dag(make_conf, make_dag, seed=5)
+    dag.build()
+    assert len(dag._ph_subdags) == 6
+    assert "0 processes shared" in dag.shared_report()
+
+
+def test_redo_closure_of_shared_runs(make_conf, make_dag, tmp_path):
+    dag = shared_dag(make_conf, make_dag)
+    dag.build()
+    dag.build_manifest().save(tmp_path / "manifest.json")
+    manifest = Manifest.load(tmp_path / "manifest.json")
+    assert manifest.seed == dag.seed
+
+    # A failed shared run is redone for both experiments
+    assert manifest.downstream(["PH_1+RUN_GENERATION_1"]) == {
+        "PH_1+RUN_GENERATION_1",
+        "PH_1+RUN_DELPHES_1",
+        "PH_1+RUN_ANALYSIS_exp0_1",
+        "PH_1+RUN_ANALYSIS_exp1_1",
+        "RUN_AUGMENTATION_exp0",
+        "RUN_AUGMENTATION_exp1",
+    }
+    # A failed analysis only for its experiment
+    assert manifest.downstream(["PH_1+RUN_ANALYSIS_exp1_1"]) == {
+        "PH_1+RUN_ANALYSIS_exp1_1",
+        "RUN_AUGMENTATION_exp1",
+    }
+    # Shared runs wait for the setup of every experiment using them
+    redo_setup = manifest.downstream(["RUN_SETUP_exp1"])
+    assert "PH_2+PREPARE_GENERATION_2" in redo_setup
+    assert not any(name.startswith("PH_3+") for name in redo_setup)
+    assert "RUN_AUGMENTATION_exp0" in redo_setup
+
+
+def test_changed_inputs_of_shared_runs(make_conf, make_dag):
+    confs = make_conf("exp0", [("sm", 3), ("bsm", 1)]), make_conf("exp1", [("sm", 2)])
+    before = make_dag(*confs).build().build_manifest()
+    Path(confs[1]["observables"]).write_text("observables: [pt_j1]\n")
+    after = make_dag(*confs).build().build_manifest()
+    assert before.changed_inputs(after) == {
+        "PH_1+RUN_ANALYSIS_exp1_1",
+        "PH_2+RUN_ANALYSIS_exp1_2",
+    }